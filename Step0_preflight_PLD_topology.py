@@ -0,0 +1,59 @@
+# [Description] ------------------------------
+# Preflight check of the PLD and GeoDAR polygons before running Steps 3-5.
+# Finds self-overlapping and nested polygons, duplicate IDs/geometries and invalid rings (see pld_preflight.py),
+# and writes one compact issue table. Fix the reported polygons first: e.g. nested circa-2015 polygons
+# (C15_3977065 / C15_8349584) make Intersect return three pieces instead of two in Step4.
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Setup] -----------------------------------
+# Inputs
+# work_dir: working space
+work_dir = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\Auxiliary_datasets\Lakes\SWOT_PLD_v01.gdb"
+
+# Layers to check and their ID fields
+layers = [["PLDv01_circa2015", "lake_UID"],
+          [r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\Dam_datasets\All_dams.gdb\GeoDAR_v11_reservoirs_internal_simple", "GeoDARv11_ID"]]
+
+# Number of workers (None: all cores)
+processes = None
+# "processes": process pool on a shared-memory geometry store; "threads": thread pool in this process (lighter for regional layers)
+execution = "processes"
+
+# OUTPUT
+issue_table = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\Auxiliary_datasets\Lakes\PLDv01_preflight_issues.csv"
+#---------------------------------------------
+
+
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import arcpy, os, datetime
+from arcpy import env
+import pld_preflight
+
+if __name__ == "__main__": # required by the worker processes (they re-import this script on Windows)
+    print("----- Module Started -----")
+    print(datetime.datetime.now())
+
+    # Define environment settings.
+    env.workspace = work_dir
+
+    issues_by_layer = {}
+    for layer, ID_field in layers:
+        issues = pld_preflight.check_feature_class(layer, ID_field, processes, execution=execution)
+        issues_by_layer[os.path.basename(layer)] = issues
+        issue_count = {}
+        for issue in issues:
+            issue_count[issue['issue']] = issue_count.get(issue['issue'], 0) + 1
+        print(layer + ' checked... ' + str(issue_count))
+
+    pld_preflight.write_issues(issue_table, issues_by_layer)
+
+    print("----- Module Completed -----")
+    print(datetime.datetime.now())
@@ -12,6 +12,15 @@ work_dir = r"E:\SWOT_PLD_20211103\SWOT_PLD_full_dataset"
 #circa2015 = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\Auxiliary_datasets\Lakes\SWOT_Lakes_AllUCLA2015.gdb\circa2015_UCLA_lakes". relocated to below:
 circa2015 = r"E:\SWOT_PLD_20211103\SWOT_PLD_v01.gdb\circa2015_UCLA_lakes"
 selection_relation = "SHARE_A_LINE_SEGMENT_WITH" #"INTERSECT" # "SHARE_A_LINE_SEGMENT_WITH"
+prefetch_depth = 1 # selection_engine = "threads": number of pfaf layers read (background thread) ahead of the one being processed. 0: no prefetching
+# "arcpy": SelectLayerByLocation; "threads": Shapely 2 relation tests in a thread pool (thread_pool.py) with one R-tree on circa2015
+selection_engine = "arcpy"
+workers = None # threads for selection_engine = "threads" (None: all cores)
+# selection_engine = "threads" only: accept/reject most candidate pairs on cached simplified envelopes (geometry_envelopes.py,
+# .env.npz files next to circa2015 and the pfaf layers) before testing the full-resolution shorelines
+use_envelopes = False
+envelope_tolerance = 0.0005 # degrees
+pfaf_layers = ["01","02","03","04","05","06","07","08","09"] # pfaf layers to label (a subset per partition in work_queue.py runs)
 #---------------------------------------------
 
 # [Script] -----------------------------------
@@ -21,6 +30,8 @@ import numpy as np
 from arcpy import env
 from numpy import ndarray
 from datetime import date
+import prefetch_reader
+import geometry_arrays, geometry_envelopes, packed_rtree, thread_pool
 
 print("----- Module Started -----")
 print(datetime.datetime.now())
@@ -28,10 +39,55 @@ print(datetime.datetime.now())
 env.workspace = work_dir
 env.overwriteOutput = "TRUE"
 
-for layer_i in ["01","02","03","04","05","06","07","08","09"]:
+if selection_engine == "threads": # circa2015 is read and indexed once, for all pfaf layers
+    flag_field = "inter_PLDv01" if selection_relation == "INTERSECT" else "shareseg_PLDv01"
+    if use_envelopes:
+        circa2015_flat, circa2015_values, circa2015_envelopes = geometry_envelopes.feature_class_envelopes(
+            circa2015, ['OID@'], envelope_tolerance)
+        circa2015_envelopes = geometry_envelopes.prepare(circa2015_envelopes)
+    else:
+        circa2015_flat, circa2015_values = geometry_arrays.read_flat_geometry(circa2015, ['OID@'])
+    circa2015_OIDs = np.array(circa2015_values['OID@'], dtype=np.int64)
+    circa2015_tree = packed_rtree.PackedRTree.build(geometry_arrays.geometry_bounds(circa2015_flat))
+    circa2015_OID_field = arcpy.Describe(circa2015).OIDFieldName
+
+# Read a pfaf layer for selection_engine = "threads" (runs on the prefetching thread, so only read-only cursor pulls:
+# arcpy geoprocessing tools are not thread-safe)
+def read_layer(layer_i):
+    PLD_path = os.path.join(work_dir, "SWOT_PLD_pfaf_" + layer_i + ".shp")
+    if use_envelopes: # (flat, values, envelopes), cached next to the shapefile
+        return geometry_envelopes.feature_class_envelopes(PLD_path, tolerance=envelope_tolerance,
+                                                          cache_path=os.path.join(work_dir, "SWOT_PLD_pfaf_" + layer_i + geometry_envelopes.ENVELOPE_EXTENSION))
+    return geometry_arrays.read_flat_geometry(PLD_path)[0]
+
+# The arcpy engine selects on the shapefiles directly (nothing to prefetch)
+PLD_layers = prefetch_reader.PrefetchReader(pfaf_layers, read_layer, prefetch_depth) if selection_engine == "threads" \
+    else [(x, None) for x in pfaf_layers]
+for layer_i, PLD_read in PLD_layers:
     PLD = "SWOT_PLD_pfaf_" + layer_i + ".shp"  
     print('processing ' + PLD + '... using ' + selection_relation)
     
+    if selection_engine == "threads":
+        envelopes = None
+        if use_envelopes:
+            PLD_flat, PLD_values, PLD_envelopes = PLD_read
+            envelopes = (geometry_envelopes.prepare(PLD_envelopes), circa2015_envelopes)
+        else:
+            PLD_flat = PLD_read
+        PLD_count = geometry_arrays.geometry_count(PLD_flat)
+        pair_PLD, pair_circa2015 = thread_pool.related_pairs(PLD_flat, circa2015_flat, selection_relation, circa2015_tree, workers,
+                                                             envelopes=envelopes)
+        selected_OIDs = np.unique(circa2015_OIDs[pair_circa2015]).tolist()
+        print('PLD count : selected count ... ' + str(PLD_count) + ' : ' + str(len(selected_OIDs)))
+        for i in range(0, len(selected_OIDs), 1000): # flag the selected lakes, 1000 OIDs per where clause
+            SQL_selected = "{0} IN ({1})".format(arcpy.AddFieldDelimiters(circa2015, circa2015_OID_field),
+                                                 ','.join([str(x) for x in selected_OIDs[i:i + 1000]]))
+            with arcpy.da.UpdateCursor(circa2015, [flag_field], SQL_selected) as cursor:
+                for row in cursor:
+                    cursor.updateRow([1])
+        print('')
+        continue
+    
     arcpy.MakeFeatureLayer_management(PLD, "PLD_lyr")
     PLD_count = int(arcpy.GetCount_management("PLD_lyr").getOutput(0))
     
@@ -12,6 +12,7 @@ file_dir = r'D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonizatio
 # files
 GIS_file = file_dir + '/Dams_India_NRLD2019' # input and output
 this_coutry = 'India' 
+incremental = True # rewrite only rows whose source fields changed or that are new (register_hash.py); False: every row
 #======================================================================================
 
 
@@ -22,6 +23,7 @@ import numpy as np
 from arcpy import env
 from numpy import ndarray
 from datetime import date
+import register_hash
 
 fieldList = arcpy.ListFields(GIS_file)    
 fieldName = [f.name for f in fieldList]
@@ -30,47 +32,36 @@ if ('dam_UID' in fieldName) == False:
 if ('reg_string' in fieldName) == False:
     arcpy.AddField_management(GIS_file, 'reg_string', "TEXT", field_length = 500) #field_length=255 by default
 
-#Update universal ID
-all_records = arcpy.UpdateCursor(GIS_file)
-for each_record in all_records:
-    this_data_source = each_record.dam_source #in the format of "register_..."
-    valid_data_source = this_data_source[9:]
-    each_record.dam_UID = valid_data_source + '_' + str(int(each_record.dam_ID))
-    all_records.updateRow(each_record)
-del all_records # Release the cursor
-del each_record
-    
-# concatenate string
-all_records = arcpy.UpdateCursor(GIS_file)
-for each_record in all_records:
-        
-    this_ID = each_record.dam_UID #string
-    
-    this_dam_name = each_record.NameofDam #string
+# Register fields read for reg_string (a change in any of them rebuilds the row)
+source_fields = ['NameofDam', 'YearofCompletion', 'River', 'NeareastCity', 'ReservoirArea_m2', 'GrossStorageCapacity_m3', 'EffectiveStorageCapacity_m3']
+
+# Concatenate string of one row (row: {field: value})
+def build_reg_string(row, this_ID):
+    this_dam_name = row['NameofDam'] #string
     if this_dam_name is None:
         this_dam_name = ''
     else:
         this_dam_name = this_dam_name.strip()
         
-    this_year_complete = each_record.YearofCompletion #string
+    this_year_complete = row['YearofCompletion'] #string
     if this_year_complete is None:
         this_year_complete = ''
     else:
         this_year_complete = this_year_complete.strip()
     
-    this_river = each_record.River #string
+    this_river = row['River'] #string
     if this_river is None:
         this_river = ''
     else:
         this_river = this_river.strip()
     
-    this_town = each_record.NeareastCity #string
+    this_town = row['NeareastCity'] #string
     if this_town is None:
         this_town = ''
     else:
         this_town = this_town.strip()
         
-    this_reservoir_area = each_record.ReservoirArea_m2 #string
+    this_reservoir_area = row['ReservoirArea_m2'] #string
     if this_reservoir_area is None:
         this_reservoir_area = ''
     else:
@@ -79,7 +70,7 @@ for each_record in all_records:
             this_reservoir_area = (10.0**(-6))*float(this_reservoir_area) #m2 to km2 -----------------------------------------------------------------
             this_reservoir_area = str(format(this_reservoir_area, ".4f"))  #keep 4 decimal digits
         
-    this_reservoir_cap_gross = each_record.GrossStorageCapacity_m3 #string
+    this_reservoir_cap_gross = row['GrossStorageCapacity_m3'] #string
     if this_reservoir_cap_gross is None:
         this_reservoir_cap_gross = ''
     else:
@@ -88,7 +79,7 @@ for each_record in all_records:
             this_reservoir_cap_gross = (10.0**(-6))*float(this_reservoir_cap_gross) #m3 to mcm -----------------------------------------------------------------
             this_reservoir_cap_gross = str(format(this_reservoir_cap_gross, ".4f"))   
 
-    this_reservoir_cap = each_record.EffectiveStorageCapacity_m3 #string
+    this_reservoir_cap = row['EffectiveStorageCapacity_m3'] #string
     if this_reservoir_cap is None:
         this_reservoir_cap = ''
     else:
@@ -118,8 +109,10 @@ for each_record in all_records:
     
     this_string = this_string + this_ID + " (reg ID)"
 
-    each_record.reg_string = this_string
-    
-    all_records.updateRow(each_record)
-del all_records # Release the cursor
-del each_record
+    return this_string
+
+#Update universal ID and concatenate string, in one pass over the rows whose hash changed
+changes = register_hash.update_register(GIS_file, source_fields, build_reg_string, salt=this_coutry, incremental=incremental)
+print('rows written: ' + str(changes['written']) + '; new: ' + str(len(changes['new'])) + '; changed: ' + str(len(changes['changed'])) +
+      '; deleted: ' + str(len(changes['deleted'])))
+print('deleted dam_UIDs: ' + ', '.join(changes['deleted']))
@@ -12,6 +12,7 @@ file_dir = r'D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonizatio
 # files
 GIS_file = file_dir + '/Dams_Japan_JDF' 
 this_coutry = 'Japan'
+incremental = True # rewrite only rows whose source fields changed or that are new (register_hash.py); False: every row
 
 #======================================================================================
 
@@ -23,6 +24,7 @@ import numpy as np
 from arcpy import env
 from numpy import ndarray
 from datetime import date
+import register_hash
 
 fieldList = arcpy.ListFields(GIS_file)    
 fieldName = [f.name for f in fieldList]
@@ -31,41 +33,30 @@ if ('dam_UID' in fieldName) == False:
 if ('reg_string' in fieldName) == False:
     arcpy.AddField_management(GIS_file, 'reg_string', "TEXT") #field_length=255 by default, which should be good
 
-#Update universal ID
-all_records = arcpy.UpdateCursor(GIS_file)
-for each_record in all_records:
-    this_data_source = each_record.dam_source #in the format of "register_..."
-    valid_data_source = this_data_source[9:]
-    each_record.dam_UID = valid_data_source + '_' + str(int(each_record.dam_ID))
-    all_records.updateRow(each_record)
-del all_records # Release the cursor
-del each_record
-    
-# concatenate string
-all_records = arcpy.UpdateCursor(GIS_file)
-for each_record in all_records:
-        
-    this_ID = each_record.dam_UID #string
-    
-    this_dam_name = each_record.dam_name #string
+# Register fields read for reg_string (a change in any of them rebuilds the row)
+source_fields = ['dam_name', 'yr_start', 'yr_complete', 'surface_area_ha', 'res_cap_tm3']
+
+# Concatenate string of one row (row: {field: value})
+def build_reg_string(row, this_ID):
+    this_dam_name = row['dam_name'] #string
     if this_dam_name is None:
         this_dam_name = ''
     else:
         this_dam_name = this_dam_name.strip()
         
-    this_year_start = each_record.yr_start #string
+    this_year_start = row['yr_start'] #string
     if this_year_start is None:
         this_year_start = ''
     else:
         this_year_start = this_year_start.strip()
         
-    this_year_complete = each_record.yr_complete #string
+    this_year_complete = row['yr_complete'] #string
     if this_year_complete is None:
         this_year_complete = ''
     else:
         this_year_complete = this_year_complete.strip()
     
-    this_reservoir_area = each_record.surface_area_ha #string
+    this_reservoir_area = row['surface_area_ha'] #string
     if this_reservoir_area is None:
         this_reservoir_area = ''
     else:
@@ -74,7 +65,7 @@ for each_record in all_records:
             this_reservoir_area = 0.01*float(this_reservoir_area) #ha to km2 -----------------------------------------------------------------
             this_reservoir_area = str(format(this_reservoir_area, ".4f"))  #keep 4 decimal digits
         
-    this_reservoir_cap = each_record.res_cap_tm3 #string
+    this_reservoir_cap = row['res_cap_tm3'] #string
     if this_reservoir_cap is None:
         this_reservoir_cap = ''
     else:
@@ -99,8 +90,10 @@ for each_record in all_records:
     
     this_string = this_string + this_ID + " (reg ID)"
 
-    each_record.reg_string = this_string
-    
-    all_records.updateRow(each_record)
-del all_records # Release the cursor
-del each_record
+    return this_string
+
+#Update universal ID and concatenate string, in one pass over the rows whose hash changed
+changes = register_hash.update_register(GIS_file, source_fields, build_reg_string, salt=this_coutry, incremental=incremental)
+print('rows written: ' + str(changes['written']) + '; new: ' + str(len(changes['new'])) + '; changed: ' + str(len(changes['changed'])) +
+      '; deleted: ' + str(len(changes['deleted'])))
+print('deleted dam_UIDs: ' + ', '.join(changes['deleted']))
@@ -12,6 +12,7 @@ file_dir = r'D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonizatio
 # files
 GIS_file = file_dir + '/Dams_SouthAfrica_LRD2019' # input and output
 this_coutry = 'South Africa' #--------------------------------------------------------------------------------
+incremental = True # rewrite only rows whose source fields changed or that are new (register_hash.py); False: every row
 
 # dam_source needs to be added first
 #======================================================================================
@@ -27,6 +28,7 @@ import numpy as np
 from arcpy import env
 from numpy import ndarray
 from datetime import date
+import register_hash
 
 fieldList = arcpy.ListFields(GIS_file)    
 fieldName = [f.name for f in fieldList]
@@ -35,59 +37,48 @@ if ('dam_UID' in fieldName) == False:
 if ('reg_string' in fieldName) == False:
     arcpy.AddField_management(GIS_file, 'reg_string', "TEXT", field_length = 500) #field_length=255 by default
 
-#Update universal ID
-all_records = arcpy.UpdateCursor(GIS_file)
-for each_record in all_records:
-    this_data_source = each_record.dam_source #in the format of "register_..."
-    valid_data_source = this_data_source[9:]
-    each_record.dam_UID = valid_data_source + '_' + str(int(each_record.dam_ID))
-    all_records.updateRow(each_record)
-del all_records # Release the cursor
-del each_record
-    
-# concatenate string
-all_records = arcpy.UpdateCursor(GIS_file)
-for each_record in all_records:
-        
-    this_ID = each_record.dam_UID #string
-    
-    this_dam_name = each_record.Name_of_dam #string
+# Register fields read for reg_string (a change in any of them rebuilds the row)
+source_fields = ['Name_of_dam', 'Province_code', 'Completion_date', 'Completion_date_altered', 'River_or_Watercourse', 'Town_nearest', 'Surface_area__ha_', 'Capacity__1000_cub_m_']
+
+# Concatenate string of one row (row: {field: value})
+def build_reg_string(row, this_ID):
+    this_dam_name = row['Name_of_dam'] #string
     if this_dam_name is None:
         this_dam_name = ''
     else:
         this_dam_name = this_dam_name.strip()
     
-    this_state = each_record.Province_code #string
+    this_state = row['Province_code'] #string
     if this_state is None:
         this_state = ''
     else:
         this_state = this_state.strip()
         
-    this_year_complete = each_record.Completion_date #double
+    this_year_complete = row['Completion_date'] #double
     if this_year_complete is None:
         this_year_complete = ''
     else:
         this_year_complete = str(this_year_complete).strip()
     
-    this_year_complete_alt = each_record.Completion_date_altered #double
+    this_year_complete_alt = row['Completion_date_altered'] #double
     if this_year_complete_alt is None:
         this_year_complete_alt = ''
     else:
         this_year_complete_alt = str(this_year_complete_alt).strip()
         
-    this_river = each_record.River_or_Watercourse #string
+    this_river = row['River_or_Watercourse'] #string
     if this_river is None:
         this_river = ''
     else:
         this_river = this_river.strip()
     
-    this_town = each_record.Town_nearest #string
+    this_town = row['Town_nearest'] #string
     if this_town is None:
         this_town = ''
     else:
         this_town = this_town.strip()
         
-    this_reservoir_area = each_record.Surface_area__ha_ #double
+    this_reservoir_area = row['Surface_area__ha_'] #double
     if this_reservoir_area is None:
         this_reservoir_area = ''
     else:
@@ -96,7 +87,7 @@ for each_record in all_records:
             this_reservoir_area = 0.01*float(this_reservoir_area) #ha to km2 -----------------------------------------------------------------
             this_reservoir_area = str(format(this_reservoir_area, ".4f"))  #keep 4 decimal digits 
 
-    this_reservoir_cap = each_record.Capacity__1000_cub_m_ #double 
+    this_reservoir_cap = row['Capacity__1000_cub_m_'] #double 
     if this_reservoir_cap is None:
         this_reservoir_cap = ''
     else:
@@ -130,8 +121,10 @@ for each_record in all_records:
     
     this_string = this_string + this_ID + " (reg ID)"
 
-    each_record.reg_string = this_string
-    
-    all_records.updateRow(each_record)
-del all_records # Release the cursor
-del each_record
+    return this_string
+
+#Update universal ID and concatenate string, in one pass over the rows whose hash changed
+changes = register_hash.update_register(GIS_file, source_fields, build_reg_string, salt=this_coutry, incremental=incremental)
+print('rows written: ' + str(changes['written']) + '; new: ' + str(len(changes['new'])) + '; changed: ' + str(len(changes['changed'])) +
+      '; deleted: ' + str(len(changes['deleted'])))
+print('deleted dam_UIDs: ' + ', '.join(changes['deleted']))
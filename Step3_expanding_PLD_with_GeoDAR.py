@@ -24,6 +24,8 @@ GeoDAR = "D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\D
 
 #PLD_output = "PLDv01_circa2015_GeoDARv1101182022" #now used only for Japan
 PLD_output = "PLDv01_circa2015_GeoDARv11" #now used only for non-Japan region
+# Write a packed Hilbert R-tree sidecar (.hrt, see rtree_sidecar.py) next to each output for fast bbox/nearest queries
+write_sidecars = True
 #---------------------------------------------
 
 
@@ -35,6 +37,7 @@ import numpy as np
 from arcpy import env
 from numpy import ndarray
 from datetime import date
+import bulk_reader, rtree_sidecar
 
 print("----- Module Started -----")
 print(datetime.datetime.now())
@@ -50,22 +53,12 @@ arcpy.MakeFeatureLayer_management(GeoDAR, "GeoDAR_lyr")
 arcpy.Intersect_analysis(["PLD_lyr", "GeoDAR_lyr"], "intersect_1")
 print('intersection completed...')
 
-#Retrieve all "GeoDARv11_ID"
-all_GeoDARv11_ID_array = []
-dam_records = arcpy.SearchCursor('GeoDAR_lyr')
-for dam_record in dam_records:
-    all_GeoDARv11_ID_array.append(dam_record.GeoDARv11_ID)
-del dam_record
-del dam_records
+#Retrieve all "GeoDARv11_ID" (one columnar read, no geometry)
+all_GeoDARv11_ID_array = bulk_reader.read_columns('GeoDAR_lyr', ["GeoDARv11_ID"])["GeoDARv11_ID"].tolist()
 unique_GeoDARv11_ID_array = list(set(all_GeoDARv11_ID_array))
 
 #Retrieve intersected GeoDARv11_ID
-intersected_GeoDARv11_ID_array = []
-dam_records = arcpy.SearchCursor("intersect_1")
-for dam_record in dam_records:
-    intersected_GeoDARv11_ID_array.append(dam_record.GeoDARv11_ID)
-del dam_record
-del dam_records
+intersected_GeoDARv11_ID_array = bulk_reader.read_columns("intersect_1", ["GeoDARv11_ID"])["GeoDARv11_ID"].tolist()
 unique_intersected_GeoDARv11_ID_array = list(set(intersected_GeoDARv11_ID_array))
 
 #Find the remaining GeoDARv11_IDs
@@ -96,5 +89,8 @@ arcpy.SelectLayerByAttribute_management("PLD_output_lyr", "CLEAR_SELECTION")
 ##then manually delete the GeoDAR fieldsL ID_v11, plg_src, Hylak_id, and GeoDARv11_ID. previously for Japan only.
 ##then manually delete the GeoDAR fieldsL GeoDARv11_ID.
 
+if write_sidecars:
+    print('sidecar written: ' + rtree_sidecar.write_sidecar(PLD_output))
+
 print("----- Module Completed -----")
 print(datetime.datetime.now())
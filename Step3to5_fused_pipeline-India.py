@@ -0,0 +1,237 @@
+# [Description] ------------------------------
+# Fused mode of Steps 3, 4 and 5: anti-join/append of GeoDAR reservoirs, GeoDAR association and QC fields,
+# dissolve and dam pairing as one dataflow in the memory workspace. PLD x GeoDAR is intersected once and the
+# intersection table is reused for the anti-join (Step3) and the association (Step4, see geodar_association.py);
+# pairing uses one near table (Step5 rules, see dam_pairing.py). Only the final products are written to disk,
+# plus the intermediate layers as debug snapshots if debug_workspace is set.
+
+# note: the manual QC between Step4 and Step5 is skipped here: GeoDARv11_ID_QC / lake_UID_QC are the values Step4
+# writes before QC. The lakes Step4 flags for a check (intGeoDAR_count != -1) are printed and listed in the snapshots.
+# Appended GeoDAR reservoirs are intersected with GeoDAR once more (as Step4 does with PLDv01_circa2015_GeoDARv11_subset),
+# so overlapping reservoirs are associated the same way as in the stepwise run.
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Setup] -----------------------------------
+# Inputs
+# work_dir: working space
+work_dir = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\To_Sam\R1_other_regions\R1_India_test.gdb"
+
+# Water polygons (PLD of this region) and GeoDAR reservoirs
+PLD = "PLDv01_circa2015_India"
+GeoDAR = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\Dam_datasets\All_dams.gdb\GeoDAR_v11_reservoirs_internal_simple"
+
+# Dams: dam points
+dams_original = "All_dams_India"
+
+# Search distance (in meters), as in Step5:
+search_step = 50
+max_search_distance = 300
+max_search_distance_large = 1000
+
+# Area used for intGeoDAR_arearatio and the largest polygon:
+# False: Shape_Area (depends on the projection); True: ellipsoidal areas from geodesic_area.py (projection-independent)
+use_geodesic_area = False
+geodesic_area_cache = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\To_Sam\R1_other_regions\geodesic_area_cache.npz"
+
+# Debug snapshots of the intermediate layers (a gdb); None: nothing but the final products is written
+debug_workspace = None # r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\To_Sam\R1_other_regions\R1_India_fused_debug.gdb"
+
+# OUTPUT
+dams = "All_dams_India_HM"
+water_mask_dissolved = "PLDv01_India_HM"
+# Dam-lake relation store (SQLite, see relation_store.py). None: not written
+relation_store_path = None
+# Write a packed Hilbert R-tree sidecar (.hrt, see rtree_sidecar.py) next to each output (dams and water_mask_dissolved) for fast bbox/nearest queries
+write_sidecars = True
+#---------------------------------------------
+
+
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import arcpy, numpy, os, re, datetime
+import numpy as np
+from arcpy import env
+import bulk_reader, geodar_association, geodesic_area, geometry_arrays, search_sweep, dam_pairing, relation_store, rtree_sidecar
+
+print("----- Module Started -----")
+print(datetime.datetime.now())
+
+# Define environment settings.
+env.workspace = work_dir
+env.overwriteOutput = "TRUE"
+area_cache = geodesic_area.GeodesicAreaCache(geodesic_area_cache if use_geodesic_area else None)
+
+
+def read_areas(layer, fields):
+    # Rows of fields plus the polygon area (Shape_Area, or the geodesic area) as the last value.
+    if use_geodesic_area:
+        flat, values = geometry_arrays.read_flat_geometry(layer, fields)
+        areas = geodesic_area.cached_polygon_areas(flat, area_cache).tolist()
+        return list(zip(*([values[f] for f in fields] + [areas])))
+    with arcpy.da.SearchCursor(layer, fields + ['SHAPE@AREA']) as cursor:
+        return [row for row in cursor]
+
+
+def snapshot(layer, name):
+    if debug_workspace is not None:
+        arcpy.CopyFeatures_management(layer, os.path.join(debug_workspace, name))
+
+
+# Step3/4: intersect PLD with GeoDAR once
+arcpy.MakeFeatureLayer_management(PLD, "PLD_lyr")
+arcpy.MakeFeatureLayer_management(GeoDAR, "GeoDAR_lyr")
+arcpy.Intersect_analysis(["PLD_lyr", "GeoDAR_lyr"], "memory\\intersect_1")
+intersected_rows = read_areas("memory\\intersect_1", ["lake_UID", "GeoDARv11_ID"])
+snapshot("memory\\intersect_1", "intersect_1")
+print('intersection completed...')
+
+# Step3: append GeoDAR reservoirs that do not intersect PLD (anti-join on the intersection table); lake_UID = GeoDAR ID
+intersected_GeoDARv11_IDs = set([row[1] for row in intersected_rows])
+appended_OIDs = [this_OID for this_OID, this_GeoDARv11_ID in bulk_reader.read_rows("GeoDAR_lyr", ["OID@", "GeoDARv11_ID"])
+                 if this_GeoDARv11_ID not in intersected_GeoDARv11_IDs]
+GeoDAR_OID_field = arcpy.Describe("GeoDAR_lyr").OIDFieldName
+if len(appended_OIDs) > 0:
+    SQL_appended = "{0} IN ({1})".format(arcpy.AddFieldDelimiters("GeoDAR_lyr", GeoDAR_OID_field), ','.join([str(x) for x in appended_OIDs]))
+else:
+    SQL_appended = "1 = 0" # an empty selection would make Merge use every reservoir
+arcpy.MakeFeatureLayer_management(GeoDAR, "appended_GeoDAR_lyr", SQL_appended)
+arcpy.Merge_management(["PLD_lyr", "appended_GeoDAR_lyr"], "memory\\PLD_GeoDAR")
+arcpy.Delete_management("appended_GeoDAR_lyr")
+with arcpy.da.UpdateCursor("memory\\PLD_GeoDAR", ["lake_UID", "GeoDARv11_ID"], "lake_UID IS NULL") as cursor:
+    for row in cursor:
+        cursor.updateRow([row[1], row[1]])
+print('merging completed... ' + str(len(appended_OIDs)) + ' GeoDAR reservoirs appended')
+
+# Step4: intersection rows of the appended reservoirs (they intersect themselves, and possibly other reservoirs)
+if len(appended_OIDs) > 0:
+    arcpy.MakeFeatureLayer_management("memory\\PLD_GeoDAR", "appended_lyr", "lake_UID = GeoDARv11_ID")
+    arcpy.CopyFeatures_management("appended_lyr", "memory\\appended")
+    arcpy.DeleteField_management("memory\\appended", ["GeoDARv11_ID"])
+    arcpy.Intersect_analysis(["memory\\appended", "GeoDAR_lyr"], "memory\\intersect_2")
+    intersected_rows += read_areas("memory\\intersect_2", ["lake_UID", "GeoDARv11_ID"])
+    arcpy.Delete_management("memory\\appended")
+    arcpy.Delete_management("memory\\intersect_2")
+arcpy.Delete_management("memory\\intersect_1")
+
+# Step4: associate GeoDAR IDs with PLD polygons
+intersected_lake_UIDs = set([row[0] for row in intersected_rows])
+lake_area_by_UID = {}
+for this_lake_UID, this_area in read_areas("memory\\PLD_GeoDAR", ["lake_UID"]):
+    if this_lake_UID in intersected_lake_UIDs:
+        lake_area_by_UID[this_lake_UID] = this_area
+lakes = geodar_association.associate([row[0] for row in intersected_rows], [row[1] for row in intersected_rows],
+                                     [row[2] for row in intersected_rows], lake_area_by_UID)
+fieldName = [f.name for f in arcpy.ListFields("memory\\PLD_GeoDAR")]
+if ('lake_UID_QC' in fieldName) == False:
+    arcpy.AddField_management("memory\\PLD_GeoDAR", 'lake_UID_QC', "TEXT")
+if ('GeoDARv11_ID_QC' in fieldName) == False:
+    arcpy.AddField_management("memory\\PLD_GeoDAR", 'GeoDARv11_ID_QC', "TEXT")
+if ('intGeoDAR_count' in fieldName) == False:
+    arcpy.AddField_management("memory\\PLD_GeoDAR", 'intGeoDAR_count', "LONG")
+if ('intGeoDAR_arearatio' in fieldName) == False:
+    arcpy.AddField_management("memory\\PLD_GeoDAR", 'intGeoDAR_arearatio', "DOUBLE")
+with arcpy.da.UpdateCursor("memory\\PLD_GeoDAR", ["lake_UID", "lake_UID_QC", "GeoDARv11_ID", "GeoDARv11_ID_QC",
+                                                  "intGeoDAR_count", "intGeoDAR_arearatio"]) as cursor:
+    for row in cursor:
+        row[1] = row[0]
+        if row[0] in lakes:
+            this_GeoDARv11_ID, this_count, this_ratio = lakes[row[0]]
+            row[2:] = [this_GeoDARv11_ID, this_GeoDARv11_ID, this_count, this_ratio]
+        cursor.updateRow(row)
+snapshot("memory\\PLD_GeoDAR", "PLD_GeoDAR")
+lakes_to_check = geodar_association.lakes_to_check(lakes)
+print('GeoDAR IDs associated... ' + str(len(lakes_to_check)) + ' lakes flagged for a check: ' + ','.join(lakes_to_check[:20]))
+
+# Step5: dissolve the GeoDAR reservoirs (aggregated as in Step5; statistic fields missing from this PLD are skipped)
+arcpy.MakeFeatureLayer_management("memory\\PLD_GeoDAR", "water_mask_lyr")
+polygon_count_by_GeoDAR_ID = {}
+for this_GeoDAR_ID in bulk_reader.read_columns("water_mask_lyr", ["GeoDARv11_ID_QC"], "GeoDARv11_ID_QC IS NOT NULL")["GeoDARv11_ID_QC"].tolist():
+    polygon_count_by_GeoDAR_ID[this_GeoDAR_ID] = polygon_count_by_GeoDAR_ID.get(this_GeoDAR_ID, 0) + 1
+statistics_fields = [["lake_id","FIRST"],["basin_id","FIRST"],["names","FIRST"],["grand_id","FIRST"],["ref_area","FIRST"],["ref_wse","FIRST"],\
+     ["date_t0","FIRST"],["ds_t0","FIRST"],["pass_full","FIRST"],["pass_part","FIRST"],["cycle_flag","FIRST"],\
+     ["ref_area_u","FIRST"],["ref_wse_u","FIRST"],["storage","FIRST"],["ice_clim_f","FIRST"],["ice_dyn_fl","FIRST"],\
+     ["lon","FIRST"],["lat","FIRST"],["reach_id_l","FIRST"],["lakeID","FIRST"],["inter_PLDv01","FIRST"],["shareseg_PLDv01","FIRST"],\
+     ["lake_UID","FIRST"],["R1_partition","FIRST"],["GeoDARv11_ID","FIRST"],["lake_UID_QC","FIRST"],\
+     ["intGeoDAR_count","MAX"],["intGeoDAR_arearatio","FIRST"]]
+fieldName = [f.name for f in arcpy.ListFields("memory\\PLD_GeoDAR")]
+SQL_reservoirs = """{0} IS NOT NULL""".format(arcpy.AddFieldDelimiters('water_mask_lyr', "GeoDARv11_ID_QC"))
+arcpy.SelectLayerByAttribute_management("water_mask_lyr", "NEW_SELECTION", SQL_reservoirs)
+arcpy.Dissolve_management('water_mask_lyr', 'memory\\interm_GeoDAR_dissolved', ["GeoDARv11_ID_QC"],
+                          [x for x in statistics_fields if x[0] in fieldName])
+for f in arcpy.ListFields('memory\\interm_GeoDAR_dissolved'):
+    if not f.required:
+        arcpy.AlterField_management('memory\\interm_GeoDAR_dissolved', f.name, f.name.replace("MAX_", "").replace("FIRST_", ""))
+with arcpy.da.UpdateCursor('memory\\interm_GeoDAR_dissolved', ["GeoDARv11_ID_QC", "lake_UID_QC"]) as cursor:
+    for row in cursor:
+        if polygon_count_by_GeoDAR_ID.get(row[0], 0) > 1: #meaning this polygon was dissolved from multiple polygons
+            cursor.updateRow([row[0], row[1] + '_dslvd'])
+arcpy.SelectLayerByAttribute_management("water_mask_lyr", "SWITCH_SELECTION") #non-GeoDAR PLD polygons.
+arcpy.management.Merge(['water_mask_lyr', 'memory\\interm_GeoDAR_dissolved'], water_mask_dissolved)
+arcpy.SelectLayerByAttribute_management("water_mask_lyr", "CLEAR_SELECTION")
+snapshot("memory\\interm_GeoDAR_dissolved", "interm_GeoDAR_dissolved")
+arcpy.Delete_management("water_mask_lyr")
+arcpy.Delete_management("memory\\interm_GeoDAR_dissolved")
+arcpy.Delete_management("memory\\PLD_GeoDAR")
+print('dissolved....')
+
+# Step5: pair dams with the dissolved polygons (one near table for all search distances)
+arcpy.CopyFeatures_management(dams_original, dams)
+lake_area_by_OID = None
+if use_geodesic_area:
+    lake_area_by_OID = dict(read_areas(water_mask_dissolved, ["OID@"]))
+    area_cache.save()
+candidate_table = search_sweep.build_candidate_table(dams, water_mask_dissolved, max(max_search_distance, max_search_distance_large),
+                                                     lake_area_by_OID)
+dam_lake, lake_ranks, keep_array = search_sweep.evaluate(candidate_table, search_step, max_search_distance, max_search_distance_large)
+ranks_by_lake_UID = dict((candidate_table['lake_UIDs'][k], v) for k, v in lake_ranks.items())
+print('dams paired... ' + str(int(np.sum(dam_lake != dam_pairing.NO_LAKE))) + ' of ' + str(len(dam_lake)))
+
+# Add fields for dam points and water polygons (as in Step5)
+fieldName = [f.name for f in arcpy.ListFields(dams)]
+for this_field, this_type in [['R1_keep', "SHORT"], ['R1_lake_UID_QC', "TEXT"], ['R1_keep_QC1', "SHORT"],
+                              ['R1_lake_UID_QC1', "TEXT"], ['R1_move', "SHORT"], ['R1_comment', "TEXT"]]:
+    if (this_field in fieldName) == False:
+        arcpy.AddField_management(dams, this_field, this_type)
+fieldName = [f.name for f in arcpy.ListFields(water_mask_dissolved)]
+for this_field, this_type in [['R1_damcnt', "LONG"], ['R1_srccnt', "LONG"], ['R1_dam_UIDs', "TEXT"], ['R1_sel_damcnt', "LONG"],
+                              ['R1_sel_dam_UID', "TEXT"], ['R1_lake_UID_QC1', "TEXT"], ['R1_comment', "TEXT"]]:
+    if (this_field in fieldName) == False:
+        arcpy.AddField_management(water_mask_dissolved, this_field, this_type)
+
+#Assign values back to dams (in cursor order, as read by build_candidate_table)
+with arcpy.da.UpdateCursor(dams, ["R1_keep", "R1_keep_QC1", "R1_lake_UID_QC", "R1_lake_UID_QC1"]) as cursor:
+    for ii, row in enumerate(cursor):
+        row[0] = keep_array[ii]
+        row[1] = keep_array[ii]
+        if dam_lake[ii] != dam_pairing.NO_LAKE:
+            row[2] = candidate_table['lake_UIDs'][dam_lake[ii]]
+            row[3] = row[2]
+        cursor.updateRow(row)
+
+#Assign values back to water mask
+with arcpy.da.UpdateCursor(water_mask_dissolved, ["lake_UID_QC", "R1_lake_UID_QC1", "R1_damcnt", "R1_srccnt", "R1_dam_UIDs",
+                                                  "R1_sel_dam_UID", "R1_sel_damcnt"]) as cursor:
+    for row in cursor:
+        row[1] = row[0]
+        if row[0] in ranks_by_lake_UID:
+            this_rank = ranks_by_lake_UID[row[0]]
+            row[2:] = [this_rank['R1_damcnt'], this_rank['R1_srccnt'], this_rank['R1_dam_UIDs'],
+                       this_rank['R1_sel_dam_UID'], this_rank['R1_sel_damcnt']]
+        cursor.updateRow(row)
+
+if relation_store_path is not None:
+    relation_store.build_from_feature_classes(relation_store_path, dams, water_mask_dissolved)
+    print('relation store written...')
+
+if write_sidecars:
+    print('sidecars written: ' + rtree_sidecar.write_sidecar(dams) + ', ' + rtree_sidecar.write_sidecar(water_mask_dissolved))
+
+print("----- Module Completed -----")
+print(datetime.datetime.now())
@@ -23,6 +23,27 @@ GeoDAR = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\
 # Water_original: original water polygons
 PLD = "PLDv01_circa2015_GeoDARv11_subset" #this is only the subset of the latter, which spatially intersects with GeoDAR to save computation
 #PLD_full = "PLDv01_circa2015_GeoDARv11_edit" #a duplicate of PLDv01_circa2015_GeoDARv11. Use table join because doing this takes way too long. 
+
+# Number of layers read ahead on a background thread (PLD_lyr is read while intermediate_1 is processed). 0: no prefetching
+prefetch_depth = 1
+
+# Area used for intGeoDAR_arearatio: 
+# False: Shape_Area (depends on the projection of the gdb); True: ellipsoidal areas from geodesic_area.py (projection-independent)
+use_geodesic_area = False
+geodesic_area_cache = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\Auxiliary_datasets\Lakes\geodesic_area_cache.npz" # shared with Step5
+
+# How intGeoDAR_arearatio is computed:
+# "exact": polygon intersection of every cluster; "raster": rasterized estimates with error bounds (raster_overlay.py),
+# exact intersection only for clusters within the error margin of 0.99 or whose lakes intersect several reservoirs;
+# "threads": exact Shapely intersections in a thread pool (thread_pool.py, Shapely 2) instead of Intersect_analysis.
+# The error bound of each raster ratio is written to intGeoDAR_ratio_err (0 for exact ratios).
+area_ratio_mode = "exact"
+raster_resolution = 1.0/3600 # degrees (1 arc-second)
+raster_workers = 1 # threads over raster tiles (thread_pool.py); None: all cores
+thread_workers = None # threads for area_ratio_mode = "threads" (None: all cores)
+
+# Write a packed Hilbert R-tree sidecar (.hrt, see rtree_sidecar.py) next to the updated PLD for fast bbox/nearest queries
+write_sidecars = True
 #---------------------------------------------
 
 
@@ -34,6 +55,7 @@ import numpy as np
 from arcpy import env
 from numpy import ndarray
 from datetime import date
+import bulk_reader, geodar_association, geodesic_area, geometry_arrays, prefetch_reader, raster_overlay, rtree_sidecar, thread_pool
 
 print("----- Module Started -----")
 print(datetime.datetime.now())
@@ -46,116 +68,162 @@ env.overwriteOutput = "TRUE"
 arcpy.MakeFeatureLayer_management(PLD, "PLD_lyr")
 arcpy.MakeFeatureLayer_management(GeoDAR, "GeoDAR_lyr")
 
-#Intersect the two layers
-arcpy.Intersect_analysis(["PLD_lyr", "GeoDAR_lyr"], "intermediate_1")
-print('intersection completed...')
-
-# Retrieve GoDAR IDs
-all_intersected_GeoDARv11_ID = []
-all_intersected_lake_UID = []
-all_intersected_area = []
-unique_intersected_lake_UID = []
-unique_intersected_GeoDARv11_ID = []
-polygon_records = arcpy.SearchCursor("intermediate_1") # By default, cursor only takes effect for selected features.
-for polygon_record in polygon_records:
-    all_intersected_GeoDARv11_ID.append(polygon_record.GeoDARv11_ID)
-    all_intersected_lake_UID.append(polygon_record.lake_UID)
-    all_intersected_area.append(polygon_record.Shape_Area)
+if area_ratio_mode in ('raster', 'threads'):
+    if area_ratio_mode == 'raster': # raster area ratios; exact overlay only where needed (see raster_overlay.py)
+        lakes, raster_stats = raster_overlay.raster_associate("PLD_lyr", "GeoDAR_lyr", raster_resolution, use_geodesic_area=use_geodesic_area,
+                                                              geodesic_area_cache=geodesic_area_cache, workers=raster_workers)
+        print('raster overlay completed... ' + str(raster_stats))
+        unique_intersected_lake_UID_ratio_error = [x[3] for x in lakes.values()]
+    else: # Shapely intersections of the candidate pairs, in the PLD coordinates (planar areas = Shape_Area) or WGS84 (geodesic areas)
+        spatial_reference = geometry_arrays.wgs84() if use_geodesic_area else arcpy.Describe("PLD_lyr").spatialReference
+        PLD_flat, PLD_values = geometry_arrays.read_flat_geometry("PLD_lyr", ['lake_UID'], spatial_reference=spatial_reference)
+        GeoDAR_flat, GeoDAR_values = geometry_arrays.read_flat_geometry("GeoDAR_lyr", ['GeoDARv11_ID'], spatial_reference=spatial_reference)
+        pair_PLD, pair_GeoDAR, intersected_area = thread_pool.intersection_areas(PLD_flat, GeoDAR_flat, workers=thread_workers,
+                                                                                 geodesic=use_geodesic_area)
+        order = np.lexsort((pair_GeoDAR, pair_PLD)) # intersection pieces in PLD order
+        order = order[intersected_area[order] > 0] # pairs that only touch give no piece, as in Intersect_analysis
+        if use_geodesic_area:
+            area_cache = geodesic_area.GeodesicAreaCache(geodesic_area_cache)
+            PLD_area = geodesic_area.cached_polygon_areas(PLD_flat, area_cache)
+            area_cache.save()
+        else:
+            PLD_area = thread_pool.planar_areas(PLD_flat)
+        lakes = geodar_association.associate([PLD_values['lake_UID'][p] for p in pair_PLD[order]],
+                                             [GeoDAR_values['GeoDARv11_ID'][g] for g in pair_GeoDAR[order]],
+                                             intersected_area[order].tolist(), dict(zip(PLD_values['lake_UID'], PLD_area.tolist())))
+        print('intersection areas computed...')
+    unique_intersected_lake_UID = list(lakes.keys())
+    unique_intersected_lake_UID_joint_GeoDAR_ID = [x[0] for x in lakes.values()]
+    unique_intersected_lake_UID_joint_count = [x[1] for x in lakes.values()]
+    unique_intersected_lake_UID_arearatio = [x[2] for x in lakes.values()]
+else:
+    #Intersect the two layers
+    arcpy.Intersect_analysis(["PLD_lyr", "GeoDAR_lyr"], "intermediate_1")
+    print('intersection completed...')
+
+    if use_geodesic_area: # {OID: area}, reused across reruns through the geometry-hash cache
+        intersected_area_by_OID = geodesic_area.feature_class_areas("intermediate_1", "OID@", geodesic_area_cache)
+        PLD_area_by_OID = geodesic_area.feature_class_areas("PLD_lyr", "OID@", geodesic_area_cache)
+        print('geodesic areas computed...')
+
+    # Read intermediate_1 and then PLD_lyr in the background (one columnar read each)
+    layer_reader = prefetch_reader.PrefetchReader([("intermediate_1", ["OID@", "GeoDARv11_ID", "lake_UID", "Shape_Area"]),
+                                                   ("PLD_lyr", ["OID@", "lake_UID", "Shape_Area"])],
+                                                  lambda layer_fields: bulk_reader.read_rows(layer_fields[0], layer_fields[1]),
+                                                  prefetch_depth)
+    layer_reads = iter(layer_reader)
+
+    # Retrieve GoDAR IDs
+    all_intersected_GeoDARv11_ID = []
+    all_intersected_lake_UID = []
+    all_intersected_area = []
+    unique_intersected_lake_UID = []
+    unique_intersected_GeoDARv11_ID = []
+    polygon_layer, polygon_records = next(layer_reads) # intermediate_1
+    for (polygon_OID, polygon_GeoDARv11_ID, polygon_lake_UID, polygon_area) in polygon_records:
+        all_intersected_GeoDARv11_ID.append(polygon_GeoDARv11_ID)
+        all_intersected_lake_UID.append(polygon_lake_UID)
+        if use_geodesic_area:
+            all_intersected_area.append(intersected_area_by_OID[polygon_OID])
+        else:
+            all_intersected_area.append(polygon_area)
     
-    if polygon_record.lake_UID not in unique_intersected_lake_UID:
-        unique_intersected_lake_UID.append(polygon_record.lake_UID)
-    if polygon_record.GeoDARv11_ID not in unique_intersected_GeoDARv11_ID:
-        unique_intersected_GeoDARv11_ID.append(polygon_record.GeoDARv11_ID)
-del polygon_record # Release the cursor
-del polygon_records
-print('GeoDAR IDs retrieved...')
-
-# Generate unique PLD information (including joint count and jointed GeoDAR IDs)
-unique_intersected_lake_UID_joint_count = [] #paprallel with unique_intersected_lake_UID!
-unique_intersected_lake_UID_joint_GeoDAR_ID = []
-unique_intersected_lake_UID_arearatio = []
-for this_unique_lake_UID in unique_intersected_lake_UID:
-    here_PLD_indices = [i for i, x in enumerate(all_intersected_lake_UID) if x == this_unique_lake_UID] #search from dam arrays. 
+        if polygon_lake_UID not in unique_intersected_lake_UID:
+            unique_intersected_lake_UID.append(polygon_lake_UID)
+        if polygon_GeoDARv11_ID not in unique_intersected_GeoDARv11_ID:
+            unique_intersected_GeoDARv11_ID.append(polygon_GeoDARv11_ID)
+    del polygon_records
+    print('GeoDAR IDs retrieved...')
+
+    # Generate unique PLD information (including joint count and jointed GeoDAR IDs)
+    unique_intersected_lake_UID_joint_count = [] #paprallel with unique_intersected_lake_UID!
+    unique_intersected_lake_UID_joint_GeoDAR_ID = []
+    unique_intersected_lake_UID_arearatio = []
+    for this_unique_lake_UID in unique_intersected_lake_UID:
+        here_PLD_indices = [i for i, x in enumerate(all_intersected_lake_UID) if x == this_unique_lake_UID] #search from dam arrays. 
     
-    this_unique_GeoDAR_IDs = [] #unique GeoDAR IDs for this PLD lake_UID polygon
-    for this_PLD_index in here_PLD_indices:
-        if all_intersected_GeoDARv11_ID[this_PLD_index] not in this_unique_GeoDAR_IDs:
-            this_unique_GeoDAR_IDs.append(all_intersected_GeoDARv11_ID[this_PLD_index])  
-    #this can be simply done by [all_intersected_GeoDARv11_ID[i] for i in here_PLD_indices] #these values are unique here. Check so: 
-    if [all_intersected_GeoDARv11_ID[i] for i in here_PLD_indices] != this_unique_GeoDAR_IDs:
-        print('this should not happen........... algorithm varies')
-        #break
-        #This can happen. This is because: very strangely, if there are two polygons nested within each other from the same source 
-        #(circa 2015 has such an error: C15_3977065 C15_8349584 for lake_UID)
-        # when they intersect with another polygon from another source, there will be three intersected polygons, instead of two...
-        # This has been corrected from the original PLD file (no overlap any more!!)
+        this_unique_GeoDAR_IDs = [] #unique GeoDAR IDs for this PLD lake_UID polygon
+        for this_PLD_index in here_PLD_indices:
+            if all_intersected_GeoDARv11_ID[this_PLD_index] not in this_unique_GeoDAR_IDs:
+                this_unique_GeoDAR_IDs.append(all_intersected_GeoDARv11_ID[this_PLD_index])  
+        #this can be simply done by [all_intersected_GeoDARv11_ID[i] for i in here_PLD_indices] #these values are unique here. Check so: 
+        if [all_intersected_GeoDARv11_ID[i] for i in here_PLD_indices] != this_unique_GeoDAR_IDs:
+            print('this should not happen........... algorithm varies')
+            #break
+            #This can happen. This is because: very strangely, if there are two polygons nested within each other from the same source 
+            #(circa 2015 has such an error: C15_3977065 C15_8349584 for lake_UID)
+            # when they intersect with another polygon from another source, there will be three intersected polygons, instead of two...
+            # This has been corrected from the original PLD file (no overlap any more!!)
     
-    unique_intersected_lake_UID_joint_count.append(len(this_unique_GeoDAR_IDs))
-    unique_intersected_lake_UID_joint_GeoDAR_ID.append(this_unique_GeoDAR_IDs[-1]) #use the last ID
-    unique_intersected_lake_UID_arearatio.append(-1.0) #initiate the array
-print('unique intersected lake UID retrieved')
+        unique_intersected_lake_UID_joint_count.append(len(this_unique_GeoDAR_IDs))
+        unique_intersected_lake_UID_joint_GeoDAR_ID.append(this_unique_GeoDAR_IDs[-1]) #use the last ID
+        unique_intersected_lake_UID_arearatio.append(-1.0) #initiate the array
+    print('unique intersected lake UID retrieved')
   
-# Retrieve original areas for each unique PLD polygon (only those that intersect with GeoDAR)
-original_PLD_areas = []
-original_PLD_lake_UID = []
-polygon_records = arcpy.SearchCursor("PLD_lyr") # By default, cursor only takes effect for selected features.
-for polygon_record in polygon_records:
-    if polygon_record.lake_UID in unique_intersected_lake_UID:
-        original_PLD_areas.append(polygon_record.Shape_Area)
-        original_PLD_lake_UID.append(polygon_record.lake_UID)
-del polygon_record # Release the cursor
-del polygon_records
-if len(original_PLD_lake_UID) != len(unique_intersected_lake_UID):
-    print('This should not happen')
-# Just in case, reorder it based on the order of unique_intersected_lake_UID
-sorted_original_PLD_areas = [] #paprallel with unique_intersected_lake_UID!
-for this_unique_lake_UID in unique_intersected_lake_UID:
-    here_PLD_indices = [i for i, x in enumerate(original_PLD_lake_UID) if x == this_unique_lake_UID] #search from dam arrays. 
-    if len(here_PLD_indices) != 1:
-        print('this should not happen ..........')
-    else:
-        sorted_original_PLD_areas.append(original_PLD_areas[here_PLD_indices[0]])
-print('sorted original PLD areas generated')
-
-# Loop through each unique GeoDAR IDs. follow the sequence of unique_intersected_GeoDARv11_ID (in intersected result),
-# but this sequence may not always follow the GeoDAR sequence. 
-for this_unique_GeoDARv11_ID in unique_intersected_GeoDARv11_ID:
-    here_GeoDAR_indices = [i for i, x in enumerate(all_intersected_GeoDARv11_ID) if x == this_unique_GeoDARv11_ID]
+    # Retrieve original areas for each unique PLD polygon (only those that intersect with GeoDAR)
+    original_PLD_areas = []
+    original_PLD_lake_UID = []
+    polygon_layer, polygon_records = next(layer_reads) # PLD_lyr, read while intermediate_1 was processed
+    layer_reader.close()
+    for (polygon_OID, polygon_lake_UID, polygon_area) in polygon_records:
+        if polygon_lake_UID in unique_intersected_lake_UID:
+            if use_geodesic_area:
+                original_PLD_areas.append(PLD_area_by_OID[polygon_OID])
+            else:
+                original_PLD_areas.append(polygon_area)
+            original_PLD_lake_UID.append(polygon_lake_UID)
+    del polygon_records
+    if len(original_PLD_lake_UID) != len(unique_intersected_lake_UID):
+        print('This should not happen')
+    # Just in case, reorder it based on the order of unique_intersected_lake_UID
+    sorted_original_PLD_areas = [] #paprallel with unique_intersected_lake_UID!
+    for this_unique_lake_UID in unique_intersected_lake_UID:
+        here_PLD_indices = [i for i, x in enumerate(original_PLD_lake_UID) if x == this_unique_lake_UID] #search from dam arrays. 
+        if len(here_PLD_indices) != 1:
+            print('this should not happen ..........')
+        else:
+            sorted_original_PLD_areas.append(original_PLD_areas[here_PLD_indices[0]])
+    print('sorted original PLD areas generated')
+
+    # Loop through each unique GeoDAR IDs. follow the sequence of unique_intersected_GeoDARv11_ID (in intersected result),
+    # but this sequence may not always follow the GeoDAR sequence. 
+    for this_unique_GeoDARv11_ID in unique_intersected_GeoDARv11_ID:
+        here_GeoDAR_indices = [i for i, x in enumerate(all_intersected_GeoDARv11_ID) if x == this_unique_GeoDARv11_ID]
     
-    withinGeoDAR_lake_UID = [all_intersected_lake_UID[i] for i in here_GeoDAR_indices] #these values are unique here. 
+        withinGeoDAR_lake_UID = [all_intersected_lake_UID[i] for i in here_GeoDAR_indices] #these values are unique here. 
     
-    # Collect the sum of the intersectied area
-    sum_intersected_area = sum([all_intersected_area[i] for i in here_GeoDAR_indices])
+        # Collect the sum of the intersectied area
+        sum_intersected_area = sum([all_intersected_area[i] for i in here_GeoDAR_indices])
     
-    #Check the count of PLD for each of these lake_UID
-    withinGeoDAR_lake_UID_joint_count = []
-    withinGeoDAR_lake_UID_area = []
-    for this_withinGeoDAR_lake_UID in withinGeoDAR_lake_UID: #this will be double counted if the values are not unique!
-        index_1 = [i for i, x in enumerate(unique_intersected_lake_UID) if x == this_withinGeoDAR_lake_UID] 
-        if len(index_1) != 1:
-            print('this should not happen....')
-        withinGeoDAR_lake_UID_joint_count.append(unique_intersected_lake_UID_joint_count[index_1[0]]) #only to check confidence
-        withinGeoDAR_lake_UID_area.append(sorted_original_PLD_areas[index_1[0]])
-    sum_withinGeoDAR_lake_UID_area = sum(withinGeoDAR_lake_UID_area)
-    area_ratio = 1.0*sum_intersected_area/sum_withinGeoDAR_lake_UID_area
+        #Check the count of PLD for each of these lake_UID
+        withinGeoDAR_lake_UID_joint_count = []
+        withinGeoDAR_lake_UID_area = []
+        for this_withinGeoDAR_lake_UID in withinGeoDAR_lake_UID: #this will be double counted if the values are not unique!
+            index_1 = [i for i, x in enumerate(unique_intersected_lake_UID) if x == this_withinGeoDAR_lake_UID] 
+            if len(index_1) != 1:
+                print('this should not happen....')
+            withinGeoDAR_lake_UID_joint_count.append(unique_intersected_lake_UID_joint_count[index_1[0]]) #only to check confidence
+            withinGeoDAR_lake_UID_area.append(sorted_original_PLD_areas[index_1[0]])
+        sum_withinGeoDAR_lake_UID_area = sum(withinGeoDAR_lake_UID_area)
+        area_ratio = 1.0*sum_intersected_area/sum_withinGeoDAR_lake_UID_area
     
-    check_needed = 'yes'
-    if max(withinGeoDAR_lake_UID_joint_count) == 1 and area_ratio > 0.99:
-        check_needed = 'no'
+        check_needed = 'yes'
+        if max(withinGeoDAR_lake_UID_joint_count) == 1 and area_ratio > 0.99:
+            check_needed = 'no'
     
-    # Update values in unique_intersected_lake_UID series 
-    for this_withinGeoDAR_lake_UID in withinGeoDAR_lake_UID:
-        index_2 = [i for i, x in enumerate(unique_intersected_lake_UID) if x == this_withinGeoDAR_lake_UID] 
-        if check_needed == 'no':
-            unique_intersected_lake_UID_joint_count[index_2[0]] = -1 #update for all PLD polygons for this cluster (i.e., intersecting this GeoDAR reservoir). 
-            # This should not interfere with the next iteration because the previous count is 1 (unique). 
+        # Update values in unique_intersected_lake_UID series 
+        for this_withinGeoDAR_lake_UID in withinGeoDAR_lake_UID:
+            index_2 = [i for i, x in enumerate(unique_intersected_lake_UID) if x == this_withinGeoDAR_lake_UID] 
+            if check_needed == 'no':
+                unique_intersected_lake_UID_joint_count[index_2[0]] = -1 #update for all PLD polygons for this cluster (i.e., intersecting this GeoDAR reservoir). 
+                # This should not interfere with the next iteration because the previous count is 1 (unique). 
         
-        # update area
-        unique_intersected_lake_UID_arearatio[index_2[0]] = area_ratio #applying to all PLD polygons for this cluster (intersecting this GeoDAR reservoir).
-        # If this PLD polygon intersects more than one GeoDAR polygon, the ratio intersected with the last GeoDAR polygon will be used for a possible 'rewrite'. 
-        # This is consistent with the GeoDAR ID written for this PLD polygon (see iteration above).
-        # This is okay, because the count number of this PLD polygon will be used to indicate the need for manual check. 
-print('unique intersected GeoDARv11 information generated')
+            # update area
+            unique_intersected_lake_UID_arearatio[index_2[0]] = area_ratio #applying to all PLD polygons for this cluster (intersecting this GeoDAR reservoir).
+            # If this PLD polygon intersects more than one GeoDAR polygon, the ratio intersected with the last GeoDAR polygon will be used for a possible 'rewrite'. 
+            # This is consistent with the GeoDAR ID written for this PLD polygon (see iteration above).
+            # This is okay, because the count number of this PLD polygon will be used to indicate the need for manual check. 
+    print('unique intersected GeoDARv11 information generated')
         
 # Assign values to the original PLD
 # Must be added at the end otherwise it will cause conflicts with the attribute names in Intersection Tool.
@@ -171,6 +239,9 @@ if ('intGeoDAR_count' in fieldName) == False:
     arcpy.AddField_management(PLD, 'intGeoDAR_count', "LONG")
 if ('intGeoDAR_arearatio' in fieldName) == False:
     arcpy.AddField_management(PLD, 'intGeoDAR_arearatio', "DOUBLE")   
+write_ratio_error = area_ratio_mode == 'raster' or ('intGeoDAR_ratio_err' in fieldName) # reset to 0 by exact reruns
+if write_ratio_error and ('intGeoDAR_ratio_err' in fieldName) == False:
+    arcpy.AddField_management(PLD, 'intGeoDAR_ratio_err', "DOUBLE") # error bound of intGeoDAR_arearatio (0: exact)
     
 polygon_records = arcpy.UpdateCursor(PLD) # By default, cursor only takes effect for selected features.
 for polygon_record in polygon_records:
@@ -184,10 +255,15 @@ for polygon_record in polygon_records:
         polygon_record.GeoDARv11_ID_QC = unique_intersected_lake_UID_joint_GeoDAR_ID[index_3[0]]
         polygon_record.intGeoDAR_count = unique_intersected_lake_UID_joint_count[index_3[0]]
         polygon_record.intGeoDAR_arearatio = unique_intersected_lake_UID_arearatio[index_3[0]]
+        if write_ratio_error:
+            polygon_record.intGeoDAR_ratio_err = unique_intersected_lake_UID_ratio_error[index_3[0]] if area_ratio_mode == 'raster' else 0.0
     
     polygon_records.updateRow(polygon_record)
 del polygon_record # Release the cursor
 del polygon_records
+
+if write_sidecars:
+    print('sidecar written: ' + rtree_sidecar.write_sidecar(PLD))
  
 print("----- Module Completed -----")
 print(datetime.datetime.now())
@@ -26,9 +26,28 @@ search_step = 50
 max_search_distance = 300  # This may vary with the quality of the dam point data. 
 max_search_distance_large = 1000 # for snapped GOODD points (about 30-arc-second, consistent with the snapping data of HydroSHEDS 30-second, see Mulligan et al GOODD paper).
 
+# Pair dams through a rasterized lake-ID grid (lake_id_grid.py) instead of per-dam location queries:
+# dams are decided from their grid cell and only ambiguous ones (competing lakes, distance near a radius edge) are checked exactly.
+use_lake_grid = False
+lake_grid_resolution = 1.0/3600 # degrees (1 arc-second)
+
+# Pre-pairing deduplication (see dam_clustering.py): dams of all sources within dedup_radius (in meters) of a better-ranked dam
+# join its cluster (R1_clus_ID: dam_UID of the representative, R1_clus_rep: 1/0). Only representatives are paired and ranked;
+# members take the lake of their representative. None: no clustering
+dedup_radius = None
+
+# Area used to pick the largest polygon within the search distance:
+# False: Shape_Area (depends on the projection of the gdb); True: ellipsoidal areas from geodesic_area.py (projection-independent)
+use_geodesic_area = False
+geodesic_area_cache = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\To_Sam\R1_other_regions\geodesic_area_cache.npz" # shared with Step4
+
 # OUTPUT
 dams = "All_dams_India_HM" #this is just a replicate of All_dams_India at the beginning, with expanded attributes
 water_mask_dissolved = "PLDv01_India_HM"
+# Dam-lake relation store (SQLite, see relation_store.py) for batched lookups without the gdb. None: not written
+relation_store_path = None # r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\To_Sam\R1_other_regions\R1_India_relations.sqlite"
+# Write a packed Hilbert R-tree sidecar (.hrt, see rtree_sidecar.py) next to each output (dams and water_mask_dissolved) for fast bbox/nearest queries
+write_sidecars = True
 #---------------------------------------------
 
 
@@ -41,6 +60,7 @@ import numpy as np
 from arcpy import env
 from numpy import ndarray
 from datetime import date
+import bulk_reader, dam_clustering, geodesic_area, lake_id_grid, relation_store, rtree_sidecar
 
 print("----- Module Started -----")
 print(datetime.datetime.now())
@@ -57,12 +77,7 @@ arcpy.MakeFeatureLayer_management(water_mask, "water_mask_lyr")
 # Retrieve GeoDARv11_ID_QC (with repeats) and prepare for dissolve. 
 SQL_reservoirs = """{0} IS NOT NULL""".format(arcpy.AddFieldDelimiters('water_mask_lyr', "GeoDARv11_ID_QC")) #GeoDARv11_ID_QC IS NOT NULL
 arcpy.SelectLayerByAttribute_management("water_mask_lyr", "NEW_SELECTION", SQL_reservoirs)
-original_GeoDARv11_ID_QC = []
-polygon_records = arcpy.SearchCursor("water_mask_lyr") # By default, cursor only takes effect for selected features. 
-for polygon_record in polygon_records:
-    original_GeoDARv11_ID_QC.append(polygon_record.GeoDARv11_ID_QC)
-del polygon_record # Release the cursor
-del polygon_records
+original_GeoDARv11_ID_QC = bulk_reader.read_columns("water_mask_lyr", ["GeoDARv11_ID_QC"], SQL_reservoirs)["GeoDARv11_ID_QC"].tolist()
 arcpy.SelectLayerByAttribute_management("water_mask_lyr", "CLEAR_SELECTION") 
 # Dissolve QCed PLD (with GeoDAR IDs QCed)
 # Just in case clear the selection and select again
@@ -146,8 +161,17 @@ for this_record in all_records:
 del this_record # Release the cursor
 del all_records
 
+# Cluster nearby dams; only the representatives go through pairing
+if dedup_radius is not None:
+    dam_clusters = dam_clustering.cluster_feature_class(dams, dedup_radius)
+    print(str(int(np.sum(dam_clusters['representative'] == np.arange(len(dam_clusters['dam_UIDs']))))) + ' of ' +
+          str(len(dam_clusters['dam_UIDs'])) + ' dams are cluster representatives...')
+    SQL_representatives = """{0} = 1""".format(arcpy.AddFieldDelimiters(dams, "R1_clus_rep"))
+else:
+    SQL_representatives = None
+
 # Make feature layers
-arcpy.MakeFeatureLayer_management(dams, "dams_lyr")
+arcpy.MakeFeatureLayer_management(dams, "dams_lyr", SQL_representatives)
 arcpy.MakeFeatureLayer_management(water_mask_dissolved, 'water_mask_dissolved_lyr')  
 
 # Retrieve water mask subset (to improve computing efficiency)
@@ -163,116 +187,134 @@ arcpy.CopyFeatures_management("water_mask_dissolved_lyr", "interm_water_dissolve
 arcpy.SelectLayerByAttribute_management("water_mask_dissolved_lyr", "CLEAR_SELECTION")
 arcpy.SelectLayerByAttribute_management("dams_lyr", "CLEAR_SELECTION")
 arcpy.MakeFeatureLayer_management("interm_water_dissolved_neardams", "interm_water_dissolved_neardams_lyr")
+if use_geodesic_area: # {OID: area} of all candidate polygons, computed once (cached by geometry hash)
+    polygon_area_by_OID = geodesic_area.feature_class_areas("interm_water_dissolved_neardams", "OID@", geodesic_area_cache)
+    polygon_OID_field = arcpy.Describe("interm_water_dissolved_neardams").OIDFieldName
 
 # Loop through each dam to pair its reservoir polygon
-dam_records = arcpy.SearchCursor("dams_lyr")
-total_dam_count = float(arcpy.GetCount_management("dams_lyr").getOutput(0)) # Total number of dam points
-progress_array = list(np.linspace(1, total_dam_count, 100)) # Used to track pairing progress
-progress_array_rounded = []
-for this_progress_array_element in progress_array:
-    progress_array_rounded.append(round(this_progress_array_element))
-progress_array = [] # Clear up the memory
-dam_i = 0
-dam_ID_array = []
-dam_source_array = []
-#intGeoDAR_array = []
-lakeUID_array = [] # to write and update later
-#GeoDARID_array = [] # to write GeoDAR ID only for those with GeoDAR polygons
-keep_array = [] # to write and update later
-for dam_record in dam_records:
-    # Track and report pairing progress
-    dam_i += 1
-    #print(dam_i)
-    this_dam_i_index = [i for i, x in enumerate(progress_array_rounded) if x == dam_i]
-    if len(this_dam_i_index)>0:
-        print(" In progress:  " + str(100.0*progress_array_rounded[this_dam_i_index[0]]/total_dam_count) + "% of the dams paired ......")
+if use_lake_grid: # Pair with the rasterized lake-ID grid (see lake_id_grid.py); only ambiguous dams are checked exactly
+    grid_pairing = lake_id_grid.pair_feature_classes("dams_lyr", "interm_water_dissolved_neardams", search_step, max_search_distance,
+                                                     max_search_distance_large, polygon_area_by_OID if use_geodesic_area else None,
+                                                     lake_grid_resolution)
+    print(str(grid_pairing['ambiguous_count']) + ' of ' + str(len(grid_pairing['dam_UIDs'])) + ' dams checked exactly...')
+    dam_ID_array = grid_pairing['dam_UIDs']
+    dam_source_array = grid_pairing['dam_sources']
+    lakeUID_array = [grid_pairing['lake_UIDs'][x] if x != lake_id_grid.NO_LAKE else '-999' for x in grid_pairing['dam_lake']]
+    with arcpy.da.SearchCursor("dams_lyr", ['R1_keep']) as cursor:
+        keep_array = [row[0] for row in cursor]
+else:
+    dam_records = arcpy.SearchCursor("dams_lyr")
+    total_dam_count = float(arcpy.GetCount_management("dams_lyr").getOutput(0)) # Total number of dam points
+    progress_array = list(np.linspace(1, total_dam_count, 100)) # Used to track pairing progress
+    progress_array_rounded = []
+    for this_progress_array_element in progress_array:
+        progress_array_rounded.append(round(this_progress_array_element))
+    progress_array = [] # Clear up the memory
+    dam_i = 0
+    dam_ID_array = []
+    dam_source_array = []
+    #intGeoDAR_array = []
+    lakeUID_array = [] # to write and update later
+    #GeoDARID_array = [] # to write GeoDAR ID only for those with GeoDAR polygons
+    keep_array = [] # to write and update later
+    for dam_record in dam_records:
+        # Track and report pairing progress
+        dam_i += 1
+        #print(dam_i)
+        this_dam_i_index = [i for i, x in enumerate(progress_array_rounded) if x == dam_i]
+        if len(this_dam_i_index)>0:
+            print(" In progress:  " + str(100.0*progress_array_rounded[this_dam_i_index[0]]/total_dam_count) + "% of the dams paired ......")
     
-    # Read values from here
-    keep_array.append(dam_record.R1_keep) #initiation
+        # Read values from here
+        keep_array.append(dam_record.R1_keep) #initiation
     
-    # Retrieve this dam ID
-    this_dam_ID = dam_record.dam_UID #string
-    dam_ID_array.append(this_dam_ID)
+        # Retrieve this dam ID
+        this_dam_ID = dam_record.dam_UID #string
+        dam_ID_array.append(this_dam_ID)
     
-    # Retrieve this dam source
-    this_dam_source = dam_record.dam_source #string     
-    dam_source_array.append(this_dam_source)
+        # Retrieve this dam source
+        this_dam_source = dam_record.dam_source #string     
+        dam_source_array.append(this_dam_source)
     
-    # Select this dam
-    SQL_dam = """{0} = '{1}'""".format(arcpy.AddFieldDelimiters("dams_lyr", "dam_UID"), this_dam_ID)
-    arcpy.SelectLayerByAttribute_management("dams_lyr", "NEW_SELECTION", SQL_dam)
+        # Select this dam
+        SQL_dam = """{0} = '{1}'""".format(arcpy.AddFieldDelimiters("dams_lyr", "dam_UID"), this_dam_ID)
+        arcpy.SelectLayerByAttribute_management("dams_lyr", "NEW_SELECTION", SQL_dam)
     
-    # Select all water polygons within the search distance (4/6/2022: added a mechanism that uses search_step to reduce overshooting)
-    # For GeoDAR dams, they will be correctly tied to the QCed GeoDAR reservoir (if any). 
-    if this_dam_source == 'GeoDARv11': # Do not apply the proximity criterion here. 
-        #if this_dam_ID exists in the polygon as well. 
-        SQL_reservoir = """{0} = '{1}'""".format(arcpy.AddFieldDelimiters("interm_water_dissolved_neardams_lyr", "GeoDARv11_ID_QC"), this_dam_ID)
-        arcpy.SelectLayerByAttribute_management("interm_water_dissolved_neardams_lyr", "NEW_SELECTION", SQL_reservoir)
-        selected_polygon_count = int(arcpy.GetCount_management("interm_water_dissolved_neardams_lyr").getOutput(0))
-        # If the input is a layer or table view containing a selected set of records after the action of selection (either by attribute or location),
-        # only the selected records will be counted, otherwise NO features are used for counting (i.e., count = 0).
-        # However, if we performed an action of "CLEAR_SELECTION" or we never performed any selection action, the count will be the total record number.
-        
-        if selected_polygon_count > 1:
-            print('this should not happen...') #reservoirs have already been dissolved
-            print(SQL_reservoir)
-            print('count: ' + str(selected_polygon_count))
-            
-        if selected_polygon_count == 1: #select this polygon
-            polygon_records = arcpy.SearchCursor("interm_water_dissolved_neardams_lyr") # By default, cursor only takes effect for selected features. 
-            for polygon_record in polygon_records:
-                this_lakeUID = polygon_record.lake_UID_QC
-                #this_GeoDARID = polygon_record.GeoDARv11_ID_QC
-                #this_intGeoDAR = polygon_record.intGeoDARres
-            del polygon_record # Release the cursor
-            del polygon_records
-            lakeUID_array.append(this_lakeUID)
-            #GeoDARID_array.append(this_GeoDARID)
-            #intGeoDAR_array.append(this_intGeoDAR) 
-        else: #this GeoDAR dam should not be associated with any polysons even though it has a polygon within the proximity (Do not use the proximity criterion here). 
-            # Update dam_count_array
-            lakeUID_array.append('-999')    
-            #GeoDARID_array.append('-999')
-            #intGeoDAR_array.append(-999)   
-    else: # Apply proximity criterion for other dam sources. 
-        # Apply the mechanism to apply search_step
-        if this_dam_source != 'GOODDsnp':
-            selected_polygon_count = 0 #initiate the value to be 0
-            search_distance = search_step #initiate the value to be search_step
-            while selected_polygon_count == 0 and search_distance <= max_search_distance: #stop if the count is no more 0 or the maximum search_distance has been reached;
-                arcpy.SelectLayerByLocation_management("interm_water_dissolved_neardams_lyr", "WITHIN_A_DISTANCE_GEODESIC", "dams_lyr", str(search_distance)+" Meters")
-                selected_polygon_count = int(arcpy.GetCount_management("interm_water_dissolved_neardams_lyr").getOutput(0))
-                search_distance += search_step
-        else:
-            arcpy.SelectLayerByLocation_management("interm_water_dissolved_neardams_lyr", "WITHIN_A_DISTANCE_GEODESIC", "dams_lyr", str(max_search_distance_large)+" Meters")
+        # Select all water polygons within the search distance (4/6/2022: added a mechanism that uses search_step to reduce overshooting)
+        # For GeoDAR dams, they will be correctly tied to the QCed GeoDAR reservoir (if any). 
+        if this_dam_source == 'GeoDARv11': # Do not apply the proximity criterion here. 
+            #if this_dam_ID exists in the polygon as well. 
+            SQL_reservoir = """{0} = '{1}'""".format(arcpy.AddFieldDelimiters("interm_water_dissolved_neardams_lyr", "GeoDARv11_ID_QC"), this_dam_ID)
+            arcpy.SelectLayerByAttribute_management("interm_water_dissolved_neardams_lyr", "NEW_SELECTION", SQL_reservoir)
             selected_polygon_count = int(arcpy.GetCount_management("interm_water_dissolved_neardams_lyr").getOutput(0))
+            # If the input is a layer or table view containing a selected set of records after the action of selection (either by attribute or location),
+            # only the selected records will be counted, otherwise NO features are used for counting (i.e., count = 0).
+            # However, if we performed an action of "CLEAR_SELECTION" or we never performed any selection action, the count will be the total record number.
         
-        if selected_polygon_count > 0: # If at least one water polygon was found...
-            # Retrieve the largest polygon, together with its polygon ID and area value. 
-            polygon_records = arcpy.SearchCursor("interm_water_dissolved_neardams_lyr") # By default, cursor only takes effect for selected features. 
-            Area_largest_polygon = 0.0
-            for polygon_record in polygon_records:
-                if polygon_record.Shape_Area > Area_largest_polygon:
-                    Area_largest_polygon = polygon_record.Shape_Area
+            if selected_polygon_count > 1:
+                print('this should not happen...') #reservoirs have already been dissolved
+                print(SQL_reservoir)
+                print('count: ' + str(selected_polygon_count))
+            
+            if selected_polygon_count == 1: #select this polygon
+                polygon_records = arcpy.SearchCursor("interm_water_dissolved_neardams_lyr") # By default, cursor only takes effect for selected features. 
+                for polygon_record in polygon_records:
                     this_lakeUID = polygon_record.lake_UID_QC
                     #this_GeoDARID = polygon_record.GeoDARv11_ID_QC
                     #this_intGeoDAR = polygon_record.intGeoDARres
-            del polygon_record # Release the cursor
-            del polygon_records
-            lakeUID_array.append(this_lakeUID)
-            #GeoDARID_array.append(this_GeoDARID)
-            #intGeoDAR_array.append(this_intGeoDAR)
-        else: 
-            # Update dam_count_array
-            lakeUID_array.append('-999')    
-            #GeoDARID_array.append('-999')
-            #intGeoDAR_array.append(-999)        
+                del polygon_record # Release the cursor
+                del polygon_records
+                lakeUID_array.append(this_lakeUID)
+                #GeoDARID_array.append(this_GeoDARID)
+                #intGeoDAR_array.append(this_intGeoDAR) 
+            else: #this GeoDAR dam should not be associated with any polysons even though it has a polygon within the proximity (Do not use the proximity criterion here). 
+                # Update dam_count_array
+                lakeUID_array.append('-999')    
+                #GeoDARID_array.append('-999')
+                #intGeoDAR_array.append(-999)   
+        else: # Apply proximity criterion for other dam sources. 
+            # Apply the mechanism to apply search_step
+            if this_dam_source != 'GOODDsnp':
+                selected_polygon_count = 0 #initiate the value to be 0
+                search_distance = search_step #initiate the value to be search_step
+                while selected_polygon_count == 0 and search_distance <= max_search_distance: #stop if the count is no more 0 or the maximum search_distance has been reached;
+                    arcpy.SelectLayerByLocation_management("interm_water_dissolved_neardams_lyr", "WITHIN_A_DISTANCE_GEODESIC", "dams_lyr", str(search_distance)+" Meters")
+                    selected_polygon_count = int(arcpy.GetCount_management("interm_water_dissolved_neardams_lyr").getOutput(0))
+                    search_distance += search_step
+            else:
+                arcpy.SelectLayerByLocation_management("interm_water_dissolved_neardams_lyr", "WITHIN_A_DISTANCE_GEODESIC", "dams_lyr", str(max_search_distance_large)+" Meters")
+                selected_polygon_count = int(arcpy.GetCount_management("interm_water_dissolved_neardams_lyr").getOutput(0))
         
-    # Clear up selections
-    arcpy.SelectLayerByAttribute_management("interm_water_dissolved_neardams_lyr", "CLEAR_SELECTION")  
-    arcpy.SelectLayerByAttribute_management("dams_lyr", "CLEAR_SELECTION")
-del dam_record # Release the cursor
-del dam_records
+            if selected_polygon_count > 0: # If at least one water polygon was found...
+                # Retrieve the largest polygon, together with its polygon ID and area value. 
+                polygon_records = arcpy.SearchCursor("interm_water_dissolved_neardams_lyr") # By default, cursor only takes effect for selected features. 
+                Area_largest_polygon = 0.0
+                for polygon_record in polygon_records:
+                    if use_geodesic_area:
+                        this_polygon_area = polygon_area_by_OID[polygon_record.getValue(polygon_OID_field)]
+                    else:
+                        this_polygon_area = polygon_record.Shape_Area
+                    if this_polygon_area > Area_largest_polygon:
+                        Area_largest_polygon = this_polygon_area
+                        this_lakeUID = polygon_record.lake_UID_QC
+                        #this_GeoDARID = polygon_record.GeoDARv11_ID_QC
+                        #this_intGeoDAR = polygon_record.intGeoDARres
+                del polygon_record # Release the cursor
+                del polygon_records
+                lakeUID_array.append(this_lakeUID)
+                #GeoDARID_array.append(this_GeoDARID)
+                #intGeoDAR_array.append(this_intGeoDAR)
+            else: 
+                # Update dam_count_array
+                lakeUID_array.append('-999')    
+                #GeoDARID_array.append('-999')
+                #intGeoDAR_array.append(-999)        
+        
+        # Clear up selections
+        arcpy.SelectLayerByAttribute_management("interm_water_dissolved_neardams_lyr", "CLEAR_SELECTION")  
+        arcpy.SelectLayerByAttribute_management("dams_lyr", "CLEAR_SELECTION")
+    del dam_record # Release the cursor
+    del dam_records
 
 # Loop through unique lake_UIDs and select the best-ranking dam
 unique_lakeUID_array = list(set(lakeUID_array)) 
@@ -382,6 +424,15 @@ for dam_record in dam_records:
     ii = ii + 1
 del dam_record
 del dam_records
+
+# Cluster members take the lake of their representative
+if dedup_radius is not None:
+    lakeUID_by_dam_ID = dict(zip(dam_ID_array, lakeUID_array))
+    with arcpy.da.UpdateCursor(dams, ['R1_clus_ID', 'R1_lake_UID_QC', 'R1_lake_UID_QC1'],
+                               """{0} = 0""".format(arcpy.AddFieldDelimiters(dams, "R1_clus_rep"))) as cursor:
+        for this_clus_ID, this_lake_UID, this_lake_UID_QC1 in cursor:
+            if lakeUID_by_dam_ID[this_clus_ID] != '-999':
+                cursor.updateRow([this_clus_ID, lakeUID_by_dam_ID[this_clus_ID], lakeUID_by_dam_ID[this_clus_ID]])
   
 #Assign values back to water mask    
 lake_records = arcpy.UpdateCursor('water_mask_dissolved_lyr')
@@ -399,5 +450,12 @@ for lake_record in lake_records:
 del lake_record
 del lake_records  
 
+if relation_store_path is not None:
+    relation_store.build_from_feature_classes(relation_store_path, dams, water_mask_dissolved)
+    print('relation store written...')
+
+if write_sidecars:
+    print('sidecars written: ' + rtree_sidecar.write_sidecar(dams) + ', ' + rtree_sidecar.write_sidecar(water_mask_dissolved))
+
 print("----- Module Completed -----")
 print(datetime.datetime.now())
\ No newline at end of file
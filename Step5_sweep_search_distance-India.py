@@ -0,0 +1,82 @@
+# [Description] ------------------------------
+# This module sweeps the Step5 search settings (search_step, max_search_distance, max_search_distance_large) in one run.
+# Dam-to-polygon candidates and distances are computed once up to the largest radius, and every combination
+# is evaluated from that candidate table (see search_sweep.py and dam_pairing.py).
+# Output: a per-setting summary table (paired dams, lakes with multiple dams, changed assignments, ...).
+# Run this after Step5 has produced the dissolved water mask (water_mask_dissolved).
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Setup] -----------------------------------
+# Inputs
+# work_dir: working space
+work_dir = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\To_Sam\R1_other_regions\R1_India_test.gdb"
+
+# Dams: dam points
+dams_original = "All_dams_India"
+
+# Dissolved water mask from Step5 (QCed GeoDAR reservoirs dissolved)
+water_mask_dissolved = "PLDv01_India_HM"
+
+# Settings to sweep (in meters). The first combination is the baseline for "changed_assignments".
+search_steps = [50, 25, 100]
+max_search_distances = [300, 200, 500]
+max_search_distances_large = [1000]
+
+# Dam-polygon distances: "near_table" (GenerateNearTable, GEODESIC), "kernels" (geometry_kernels.py, Numba if installed)
+# or "threads" (the same kernels in a thread pool, see thread_pool.py)
+distance_engine = "near_table"
+distance_workers = None # threads for distance_engine = "threads" (None: all cores)
+
+# Candidate table cache (.npz); reused if it covers the largest radius and was built from the same dams, water mask
+# and distance_engine (see search_sweep.input_signature).
+candidate_table_file = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\To_Sam\R1_other_regions\R1_India_sweep_candidates.npz"
+
+# OUTPUT
+summary_file = r"D:\Research\Projects\SWOT\Dam_inventory_collection\Dam_harmonization\To_Sam\R1_other_regions\R1_India_sweep_summary.csv"
+#---------------------------------------------
+
+
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import arcpy, numpy, os, datetime
+import numpy as np
+from arcpy import env
+import search_sweep
+
+print("----- Module Started -----")
+print(datetime.datetime.now())
+
+# Define environment settings.
+env.workspace = work_dir
+env.overwriteOutput = "TRUE"
+
+max_radius = max(max(max_search_distances), max(max_search_distances_large))
+input_signature = search_sweep.input_signature(dams_original, water_mask_dissolved, distance_engine)
+candidate_table = None
+if os.path.exists(candidate_table_file):
+    candidate_table = search_sweep.load_candidate_table(candidate_table_file)
+    if candidate_table['max_radius'] < max_radius: # cached table does not reach the largest radius
+        candidate_table = None
+    elif candidate_table['signature'] != input_signature: # inputs or distance engine changed since it was cached
+        candidate_table = None
+if candidate_table is None:
+    candidate_table = search_sweep.build_candidate_table(dams_original, water_mask_dissolved, max_radius,
+                                                         distance_engine=distance_engine, workers=distance_workers)
+    candidate_table['signature'] = input_signature
+    search_sweep.save_candidate_table(candidate_table_file, candidate_table)
+print('candidate table ready... ' + str(len(candidate_table['cand_dam'])) + ' dam-polygon candidates')
+
+summaries = search_sweep.sweep(candidate_table, search_steps, max_search_distances, max_search_distances_large)
+search_sweep.write_summary(summary_file, summaries)
+for summary in summaries:
+    print(summary)
+
+print("----- Module Completed -----")
+print(datetime.datetime.now())
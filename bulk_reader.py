@@ -0,0 +1,93 @@
+# [Description] ------------------------------
+# Columnar attribute reads: the requested fields of a table, feature class or layer in one bulk call
+# (arcpy.da.TableToArrowTable, or arcpy.da.TableToNumPyArray/FeatureClassToNumPyArray on older ArcGIS Pro),
+# instead of one row object per feature from arcpy.SearchCursor. Geometry is never read unless a geometry
+# token (SHAPE@XY, SHAPE@AREA, ...) is among the fields. A where clause is passed to the data source.
+# Layers are read with their selection and definition query, as with a cursor.
+# Null values come back as None in text columns and as NaN in numeric columns (integer columns with nulls become float).
+
+# Usage:
+#   columns = bulk_reader.read_columns("intermediate_1", ["OID@", "GeoDARv11_ID", "lake_UID", "Shape_Area"])
+#   rows = bulk_reader.read_rows("water_mask_lyr", ["GeoDARv11_ID_QC"], where="GeoDARv11_ID_QC IS NOT NULL")
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import collections
+import numpy as np
+
+NULL_INTEGER = np.iinfo(np.int32).min # placeholder of null integers in TableToNumPyArray
+NULL_TEXT = u'\u2400' # placeholder of null text (never a real value in these layers)
+INTEGER_TYPES = ('SmallInteger', 'Integer', 'BigInteger')
+FLOAT_TYPES = ('Single', 'Double')
+
+
+def default_engine():
+    # 'arrow' where arcpy.da.TableToArrowTable exists (ArcGIS Pro 3.2+), otherwise 'numpy'.
+    import arcpy
+    return 'arrow' if hasattr(arcpy.da, 'TableToArrowTable') else 'numpy'
+
+
+def _null_values(table, fields):
+    # TableToNumPyArray placeholders of the fields that may hold nulls.
+    import arcpy
+    field_types = dict((f.name.upper(), f.type) for f in arcpy.ListFields(table))
+    null_values = {}
+    for field in fields:
+        field_type = field_types.get(field.upper())
+        if field_type in INTEGER_TYPES:
+            null_values[field] = NULL_INTEGER
+        elif field_type in FLOAT_TYPES:
+            null_values[field] = np.nan
+        elif field_type in ('String', 'GUID', 'GlobalID'):
+            null_values[field] = NULL_TEXT
+    return null_values
+
+
+def read_numpy(table, fields, where=None, spatial_reference=None, null_values=None):
+    # NumPy structured array of the fields (nulls replaced by null_values: {field: placeholder}, default by field type).
+    import arcpy
+    if null_values is None:
+        null_values = _null_values(table, fields)
+    if any(x.upper().startswith('SHAPE@') for x in fields):
+        return arcpy.da.FeatureClassToNumPyArray(table, fields, where, spatial_reference, null_value=null_values)
+    return arcpy.da.TableToNumPyArray(table, fields, where, null_value=null_values)
+
+
+def read_arrow(table, fields, where=None):
+    # pyarrow Table of the fields (nulls kept as nulls). Geometry tokens are not supported here.
+    import arcpy
+    return arcpy.da.TableToArrowTable(table, fields, where)
+
+
+def read_columns(table, fields, where=None, spatial_reference=None, engine=None):
+    # {field: 1-D array} in the cursor order (text: object arrays with None for nulls; numbers: NaN for nulls).
+    # Geometry tokens are read through the numpy engine.
+    engine = engine or default_engine()
+    if engine == 'arrow' and not any(x.upper().startswith('SHAPE@') for x in fields):
+        arrow_table = read_arrow(table, fields, where)
+        return collections.OrderedDict((f, arrow_table.column(i).to_numpy(zero_copy_only=False))
+                                       for i, f in enumerate(fields))
+    null_values = _null_values(table, fields)
+    array = read_numpy(table, fields, where, spatial_reference, null_values)
+    columns = collections.OrderedDict()
+    for field, name in zip(fields, array.dtype.names):
+        column = array[name]
+        if null_values.get(field) == NULL_TEXT:
+            column = column.astype(object)
+            column[column == NULL_TEXT] = None
+        elif null_values.get(field) == NULL_INTEGER and np.any(column == NULL_INTEGER):
+            column = np.where(column == NULL_INTEGER, np.nan, column)
+        columns[field] = column
+    return columns
+
+
+def read_rows(table, fields, where=None, spatial_reference=None, engine=None):
+    # All rows of the fields as a list of tuples of Python values (drop-in for prefetch_reader.read_rows).
+    columns = read_columns(table, fields, where, spatial_reference, engine)
+    return list(zip(*[columns[f].tolist() for f in fields]))
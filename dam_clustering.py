@@ -0,0 +1,161 @@
+# [Description] ------------------------------
+# Pre-pairing clustering of dam points from all sources (register, GeoDARv11, GOODDunsnp, GOODDsnp).
+# Points are bucketed in a grid hash on the sphere: rows are radius-high latitude bands, and every row is cut
+# into whole columns at least as wide as the longitude extent of a radius-circle in that band (so column widths
+# grow toward the poles, and columns wrap at the antimeridian). Pairs within radius (great-circle distance) are
+# only searched in the 3 x 3 neighbouring cells.
+# Clusters are formed around representatives in the Step5 source priority (register > GeoDARv11 > GOODDunsnp > GOODDsnp,
+# then the point order): the best remaining point claims every unclaimed point within radius of it. Register dams are
+# never claimed by another point (two register dams close together are taken as two dams).
+# Only representatives need to be paired with polygons; the members take the polygon of their representative.
+
+# Usage:
+#   representative = dam_clustering.cluster_dams(lons, lats, dam_sources, 250.0)   # index of the representative of every dam
+#   dam_clustering.cluster_feature_class(dams, 250.0)   # writes R1_clus_ID (representative dam_UID) and R1_clus_rep (1/0)
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import re
+import numpy as np
+import geometry_arrays
+
+SOURCE_RANK = ['GeoDARv11', 'GOODDunsnp', 'GOODDsnp'] # after the register (decreasing preference)
+
+
+def source_ranks(dam_sources):
+    # Rank of every dam source (0: register, 1: GeoDARv11, 2: GOODDunsnp, 3: GOODDsnp, 4: any other source).
+    ranks = []
+    for this_dam_source in dam_sources:
+        if re.search('register_.+', this_dam_source or ''):
+            ranks.append(0)
+        elif this_dam_source in SOURCE_RANK:
+            ranks.append(1 + SOURCE_RANK.index(this_dam_source))
+        else:
+            ranks.append(1 + len(SOURCE_RANK))
+    return np.array(ranks, dtype=np.int64)
+
+
+def row_columns(rows, radius):
+    # Number of columns of every latitude row, so that a column is at least as wide as a radius-circle
+    # centred anywhere in the row or in the next row toward the pole.
+    angle = radius/geometry_arrays.EARTH_RADIUS
+    row_height = np.degrees(angle)
+    poleward_lat = np.minimum((np.abs(rows + 0.5) + 1.5)*row_height, 90.0)
+    half_width = np.sin(angle)/np.maximum(np.cos(np.radians(poleward_lat)), 1e-12)
+    half_width = np.degrees(np.arcsin(np.minimum(half_width, 1.0)))
+    return np.maximum(np.floor(360.0/np.where(half_width >= 90.0, 360.0, half_width)), 1).astype(np.int64)
+
+
+def grid_cells(lons, lats, radius):
+    # (row, column) of every point in the grid hash.
+    row_height = np.degrees(radius/geometry_arrays.EARTH_RADIUS)
+    rows = np.floor(np.asarray(lats, dtype=np.float64)/row_height).astype(np.int64)
+    return rows, _columns(lons, rows, radius)
+
+
+def _columns(lons, rows, radius):
+    columns = row_columns(rows, radius)
+    lons = (np.asarray(lons, dtype=np.float64) + 180.0) % 360.0
+    return np.minimum(np.floor(lons*columns/360.0).astype(np.int64), columns - 1)
+
+
+def great_circle_distance(lon1, lat1, lon2, lat2):
+    # Haversine distance (m) on the mean Earth radius.
+    lon1, lat1, lon2, lat2 = [np.radians(np.asarray(x, dtype=np.float64)) for x in (lon1, lat1, lon2, lat2)]
+    h = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+    return 2*geometry_arrays.EARTH_RADIUS*np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def pairs_within(lons, lats, radius):
+    # All point pairs (i < j) within radius (m): (i, j, distance).
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    rows, cols = grid_cells(lons, lats, radius)
+    # Cells as sorted keys; the points of a cell are one slice of the sorted order
+    key_cols = int(row_columns(np.array([0]), radius)[0]) + 1
+    keys = rows*key_cols + cols
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    pair_i = []
+    pair_j = []
+    for dr in (-1, 0, 1):
+        neighbour_rows = rows + dr
+        neighbour_columns = row_columns(neighbour_rows, radius)
+        base_cols = _columns(lons, neighbour_rows, radius)
+        for dc in (-1, 0, 1):
+            neighbour_cols = (base_cols + dc) % neighbour_columns
+            if dc != 0:
+                # Rows with fewer than 3 columns would visit the same cell twice
+                fresh = (neighbour_cols != base_cols) & ((dc == -1) | (neighbour_cols != (base_cols - 1) % neighbour_columns))
+            else:
+                fresh = np.ones(len(lons), dtype=bool)
+            neighbour_keys = neighbour_rows*key_cols + neighbour_cols
+            start = np.searchsorted(sorted_keys, neighbour_keys, 'left')
+            end = np.searchsorted(sorted_keys, neighbour_keys, 'right')
+            count = np.where(fresh, end - start, 0)
+            point = np.repeat(np.arange(len(lons)), count)
+            other = order[geometry_arrays._ranges(start[count > 0], count[count > 0])]
+            keep = point < other
+            pair_i.append(point[keep])
+            pair_j.append(other[keep])
+    pair_i = np.concatenate(pair_i) if pair_i else np.zeros(0, dtype=np.int64)
+    pair_j = np.concatenate(pair_j) if pair_j else np.zeros(0, dtype=np.int64)
+    distance = great_circle_distance(lons[pair_i], lats[pair_i], lons[pair_j], lats[pair_j])
+    within = distance <= radius
+    return pair_i[within], pair_j[within], distance[within]
+
+
+def cluster_dams(lons, lats, dam_sources, radius):
+    # Index of the representative of every dam (a representative is its own representative).
+    n = len(dam_sources)
+    ranks = source_ranks(dam_sources)
+    pair_i, pair_j, distance = pairs_within(lons, lats, radius)
+    # Neighbour lists, nearest first
+    first = np.concatenate([pair_i, pair_j])
+    second = np.concatenate([pair_j, pair_i])
+    order = np.lexsort((np.concatenate([distance, distance]), first))
+    first = first[order]
+    second = second[order]
+    bounds = np.searchsorted(first, np.arange(n + 1))
+    representative = np.full(n, -1, dtype=np.int64)
+    for i in np.lexsort((np.arange(n), ranks)).tolist():
+        if representative[i] != -1:
+            continue
+        representative[i] = i
+        for j in second[bounds[i]:bounds[i + 1]].tolist():
+            if representative[j] == -1 and ranks[j] != 0:
+                representative[j] = i
+    return representative
+
+
+def cluster_feature_class(dams, radius, cluster_field='R1_clus_ID', representative_field='R1_clus_rep'):
+    # Cluster the dams of a feature class and write the dam_UID of the representative of every dam
+    # (cluster_field) and 1/0 for representatives/members (representative_field).
+    # Returns {dam_UIDs, dam_sources, representative} in cursor order.
+    import arcpy
+    dam_UIDs = []
+    dam_sources = []
+    dam_xy = []
+    with arcpy.da.SearchCursor(dams, ['dam_UID', 'dam_source', 'SHAPE@XY'], spatial_reference=geometry_arrays.wgs84()) as cursor:
+        for this_dam_UID, this_dam_source, this_xy in cursor:
+            dam_UIDs.append(this_dam_UID)
+            dam_sources.append(this_dam_source)
+            dam_xy.append(this_xy)
+    dam_xy = np.array(dam_xy, dtype=np.float64).reshape(-1, 2)
+    representative = cluster_dams(dam_xy[:, 0], dam_xy[:, 1], dam_sources, radius)
+
+    field_names = [f.name for f in arcpy.ListFields(dams)]
+    if cluster_field not in field_names:
+        arcpy.AddField_management(dams, cluster_field, "TEXT")
+    if representative_field not in field_names:
+        arcpy.AddField_management(dams, representative_field, "SHORT")
+    with arcpy.da.UpdateCursor(dams, [cluster_field, representative_field]) as cursor:
+        for i, row in enumerate(cursor):
+            cursor.updateRow([dam_UIDs[representative[i]], 1 if representative[i] == i else 0])
+    return {'dam_UIDs': dam_UIDs, 'dam_sources': dam_sources, 'representative': representative}
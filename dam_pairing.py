@@ -0,0 +1,112 @@
+# [Description] ------------------------------
+# The Step5 pairing and ranking rules, evaluated on a precomputed candidate table instead of
+# repeated SelectLayerByLocation calls, so that many settings can be evaluated from one table.
+#   Candidate table: one row per (dam, water polygon) within the largest search radius of interest:
+#     cand_dam (dam index), cand_lake (polygon index, in the polygon layer's OID order), cand_distance (m)
+# Rules (same as Step5_build_dam_reservoir_relation):
+#   GeoDARv11 dams: the polygon whose GeoDARv11_ID_QC equals the dam_UID (no proximity criterion).
+#   GOODDsnp dams: the largest polygon within max_search_distance_large.
+#   Other dams: the search distance grows by search_step up to max_search_distance; the largest polygon
+#   within the first distance that finds any polygon.
+#   Ties in area go to the first polygon in OID order (the cursor order in Step5).
+# Lakes then rank their dams by source: register > GeoDARv11 > GOODDunsnp > GOODDsnp.
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import numpy as np
+
+NO_LAKE = -1
+
+
+def pair_dams(dam_sources, GeoDAR_lake, cand_dam, cand_lake, cand_distance, lake_area,
+              search_step, max_search_distance, max_search_distance_large):
+    # Polygon index paired with every dam (NO_LAKE if none).
+    # GeoDAR_lake: per dam, the index of the polygon with GeoDARv11_ID_QC == dam_UID (NO_LAKE if none).
+    dam_sources = np.asarray(dam_sources, dtype=object)
+    cand_dam = np.asarray(cand_dam, dtype=np.int64)
+    cand_lake = np.asarray(cand_lake, dtype=np.int64)
+    cand_distance = np.asarray(cand_distance, dtype=np.float64)
+    lake_area = np.asarray(lake_area, dtype=np.float64)
+    is_GeoDAR = dam_sources == 'GeoDARv11'
+    is_snapped = dam_sources == 'GOODDsnp'
+
+    dam_lake = np.full(len(dam_sources), NO_LAKE, dtype=np.int64)
+    dam_lake[is_GeoDAR] = np.asarray(GeoDAR_lake, dtype=np.int64)[is_GeoDAR]
+
+    # Stepped search: every candidate is first found at radius ceil(distance/search_step)*search_step
+    step_count = np.maximum(1, np.ceil(cand_distance/search_step))
+    found_radius = step_count*search_step
+    stepped = ~is_GeoDAR[cand_dam] & ~is_snapped[cand_dam] & (found_radius <= max_search_distance)
+    dam_radius = np.full(len(dam_sources), np.inf)
+    np.minimum.at(dam_radius, cand_dam[stepped], found_radius[stepped])
+    selected = stepped & (found_radius <= dam_radius[cand_dam])
+    selected |= is_snapped[cand_dam] & (cand_distance <= max_search_distance_large)
+
+    # Largest polygon per dam (first in OID order among equal areas)
+    sel_dam = cand_dam[selected]
+    sel_lake = cand_lake[selected]
+    order = np.lexsort((sel_lake, -lake_area[sel_lake], sel_dam))
+    sel_dam = sel_dam[order]
+    first = np.ones(len(sel_dam), dtype=bool)
+    first[1:] = sel_dam[1:] != sel_dam[:-1]
+    dam_lake[sel_dam[first]] = sel_lake[order][first]
+    return dam_lake
+
+
+def rank_lakes(dam_lake, dam_UIDs, dam_sources, register_name, keep_initial):
+    # Per-lake ranking as written by Step5 (R1_damcnt, R1_srccnt, R1_dam_UIDs, R1_sel_damcnt, R1_sel_dam_UID)
+    # and the updated R1_keep per dam. Dams are taken in their input (cursor) order.
+    # Returns (lakes: {lake index: dict of values}, keep: list parallel with dams).
+    rank_sources = [register_name, 'GeoDARv11', 'GOODDunsnp', 'GOODDsnp'] #decreasing preference
+    keep = list(keep_initial)
+    dams_by_lake = {}
+    for dam_i, this_lake in enumerate(np.asarray(dam_lake).tolist()):
+        if this_lake != NO_LAKE:
+            dams_by_lake.setdefault(this_lake, []).append(dam_i)
+    lakes = {}
+    for this_lake, dam_indices in dams_by_lake.items():
+        dam_sources_here = [dam_sources[i] for i in dam_indices]
+        dam_count = len(dam_indices)
+        source_count = len(set(dam_sources_here))
+        if source_count < dam_count:
+            duplicate_dam = 'same-source dam duplicate'
+        elif dam_count > 1:
+            duplicate_dam = 'multiple dams'
+        else:
+            duplicate_dam = 'single dam'
+        sorted_dam_UIDs = []
+        for this_rank_source in rank_sources:
+            sorted_dam_UIDs += [dam_UIDs[dam_indices[j]] for j, x in enumerate(dam_sources_here) if x == this_rank_source]
+        selected_dam_UIDs = []
+        for this_rank_source in rank_sources:
+            here_indices = [j for j, x in enumerate(dam_sources_here) if x == this_rank_source]
+            if len(here_indices) > 0:
+                for j in here_indices:
+                    selected_dam_UIDs.append(dam_UIDs[dam_indices[j]])
+                    keep[dam_indices[j]] = len(here_indices)
+                break
+        lakes[this_lake] = {'R1_damcnt': dam_count, 'R1_srccnt': source_count, 'duplicate': duplicate_dam,
+                            'R1_dam_UIDs': ','.join(sorted_dam_UIDs), 'R1_sel_damcnt': len(selected_dam_UIDs),
+                            'R1_sel_dam_UID': ','.join(selected_dam_UIDs)}
+    return lakes, keep
+
+
+def summarize(dam_lake, lakes, baseline_dam_lake=None):
+    # Summary numbers of one pairing result (rank_lakes output), optionally compared to a baseline pairing.
+    dam_lake = np.asarray(dam_lake)
+    summary = {'paired_dams': int(np.sum(dam_lake != NO_LAKE)),
+               'paired_lakes': len(lakes),
+               'lakes_multiple_dams': sum(1 for x in lakes.values() if x['R1_damcnt'] > 1),
+               'lakes_same_source_duplicate': sum(1 for x in lakes.values() if x['duplicate'] == 'same-source dam duplicate')}
+    if baseline_dam_lake is not None:
+        baseline_dam_lake = np.asarray(baseline_dam_lake)
+        summary['changed_assignments'] = int(np.sum(dam_lake != baseline_dam_lake))
+        summary['newly_paired'] = int(np.sum((dam_lake != NO_LAKE) & (baseline_dam_lake == NO_LAKE)))
+        summary['newly_unpaired'] = int(np.sum((dam_lake == NO_LAKE) & (baseline_dam_lake != NO_LAKE)))
+    return summary
@@ -0,0 +1,50 @@
+# [Description] ------------------------------
+# The Step4 association of GeoDAR IDs with PLD polygons, on plain lists (one row per PLD x GeoDAR intersection piece)
+# instead of repeated list scans, so it can run on an intersection table held in memory (see Step3to5_fused_pipeline).
+# Rules (same as Step4_GeoDAR_to_PLD):
+#   Every intersected lake_UID gets the last of its distinct GeoDAR IDs (in intersection order) and their count.
+#   Every GeoDAR reservoir (cluster) gets area ratio = sum of intersected areas / sum of the areas of its PLD polygons
+#   (one term per intersection piece); its lakes take this ratio (a lake in several clusters keeps the last one).
+#   If every lake of a cluster intersects only this reservoir and the ratio > 0.99, their count is set to -1 (no check needed).
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import collections
+
+NO_CHECK_RATIO = 0.99
+
+
+def associate(intersected_lake_UIDs, intersected_GeoDAR_IDs, intersected_areas, lake_area_by_UID):
+    # {lake_UID: [GeoDARv11_ID, intGeoDAR_count, intGeoDAR_arearatio]} of every intersected lake (in first-appearance order).
+    # lake_area_by_UID: {lake_UID: original PLD polygon area}, same area unit as intersected_areas.
+    GeoDAR_IDs_by_lake = collections.OrderedDict() # lake_UID -> distinct GeoDAR IDs (appearance order)
+    rows_by_GeoDAR = collections.OrderedDict() # GeoDAR ID -> row indices
+    for i, (this_lake_UID, this_GeoDAR_ID) in enumerate(zip(intersected_lake_UIDs, intersected_GeoDAR_IDs)):
+        these_GeoDAR_IDs = GeoDAR_IDs_by_lake.setdefault(this_lake_UID, [])
+        if this_GeoDAR_ID not in these_GeoDAR_IDs:
+            these_GeoDAR_IDs.append(this_GeoDAR_ID)
+        rows_by_GeoDAR.setdefault(this_GeoDAR_ID, []).append(i)
+    lakes = collections.OrderedDict((k, [v[-1], len(v), -1.0]) for k, v in GeoDAR_IDs_by_lake.items())
+
+    for this_GeoDAR_ID, rows in rows_by_GeoDAR.items():
+        withinGeoDAR_lake_UID = [intersected_lake_UIDs[i] for i in rows]
+        sum_intersected_area = sum([intersected_areas[i] for i in rows])
+        sum_withinGeoDAR_lake_UID_area = sum([lake_area_by_UID[x] for x in withinGeoDAR_lake_UID])
+        area_ratio = 1.0*sum_intersected_area/sum_withinGeoDAR_lake_UID_area
+        check_needed = not (max([lakes[x][1] for x in withinGeoDAR_lake_UID]) == 1 and area_ratio > NO_CHECK_RATIO)
+        for this_lake_UID in withinGeoDAR_lake_UID:
+            if not check_needed:
+                lakes[this_lake_UID][1] = -1
+            lakes[this_lake_UID][2] = area_ratio
+    return lakes
+
+
+def lakes_to_check(lakes):
+    # lake_UIDs that still need a manual check (intGeoDAR_count != -1), as flagged by Step4.
+    return [k for k, v in lakes.items() if v[1] != -1]
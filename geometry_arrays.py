@@ -0,0 +1,295 @@
+# [Description] ------------------------------
+# Flat (GeoArrow-style) coordinate arrays for polygons and points read from a feature class.
+# All geometries are held in one float64 coordinate buffer (lon, lat) with offset arrays:
+#   coords[ring_offsets[r]:ring_offsets[r+1]]   -> vertices of ring r (closed, first == last)
+#   ring_offsets[part_offsets[p]:...]          -> rings of part p (first ring = exterior, others = holes)
+#   part_offsets[geom_offsets[g]:...]          -> parts of geometry g (one row of the feature class)
+# Points are stored with one single-vertex "ring" per point, so the same offsets apply.
+# Geometries are read as WKB in WGS84 so everything derived from them is projection-independent.
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import hashlib, struct
+import numpy as np
+from collections import namedtuple
+
+FlatGeometry = namedtuple('FlatGeometry', ['coords', 'ring_offsets', 'part_offsets', 'geom_offsets'])
+
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTIPOINT = 4
+WKB_MULTILINESTRING = 5
+WKB_MULTIPOLYGON = 6
+
+
+def wgs84():
+    # arcpy is imported here (not at module level) so the array functions can run in workers without arcpy.
+    import arcpy
+    return arcpy.SpatialReference(4326)
+
+
+def _read_header(buf, pos):
+    # Returns (endian, base geometry type, number of ordinates per vertex, position after the header).
+    endian = '<' if buf[pos] == 1 else '>'
+    (geom_type,) = struct.unpack_from(endian + 'I', buf, pos + 1)
+    pos += 5
+    has_z = bool(geom_type & 0x80000000) # EWKB flags
+    has_m = bool(geom_type & 0x40000000)
+    if geom_type & 0x20000000: # EWKB embedded SRID
+        pos += 4
+    geom_type &= 0x0FFFFFFF
+    if geom_type >= 1000: # ISO WKB: 1xxx = Z, 2xxx = M, 3xxx = ZM
+        has_z = has_z or (geom_type // 1000) in (1, 3)
+        has_m = has_m or (geom_type // 1000) in (2, 3)
+        geom_type = geom_type % 1000
+    return endian, geom_type, 2 + int(has_z) + int(has_m), pos
+
+
+def _read_vertices(buf, pos, endian, ndim, count):
+    xy = np.frombuffer(buf, dtype=endian + 'f8', count=count*ndim, offset=pos).reshape(count, ndim)[:, :2]
+    return xy, pos + 8*count*ndim
+
+
+def _read_polygon_body(buf, pos, endian, ndim, ring_sizes, chunks):
+    (ring_count,) = struct.unpack_from(endian + 'I', buf, pos)
+    pos += 4
+    for ring_i in range(ring_count):
+        (vertex_count,) = struct.unpack_from(endian + 'I', buf, pos)
+        xy, pos = _read_vertices(buf, pos + 4, endian, ndim, vertex_count)
+        chunks.append(xy)
+        ring_sizes.append(vertex_count)
+    return ring_count, pos
+
+
+def _parse_wkb(buf, ring_sizes, part_sizes, chunks):
+    # Appends the rings/parts of one WKB geometry and returns its number of parts.
+    endian, geom_type, ndim, pos = _read_header(buf, 0)
+    if geom_type == WKB_POLYGON:
+        ring_count, pos = _read_polygon_body(buf, pos, endian, ndim, ring_sizes, chunks)
+        part_sizes.append(ring_count)
+        return 1
+    if geom_type == WKB_POINT:
+        xy, pos = _read_vertices(buf, pos, endian, ndim, 1)
+        chunks.append(xy)
+        ring_sizes.append(1)
+        part_sizes.append(1)
+        return 1
+    if geom_type == WKB_LINESTRING:
+        (vertex_count,) = struct.unpack_from(endian + 'I', buf, pos)
+        xy, pos = _read_vertices(buf, pos + 4, endian, ndim, vertex_count)
+        chunks.append(xy)
+        ring_sizes.append(vertex_count)
+        part_sizes.append(1)
+        return 1
+    if geom_type in (WKB_MULTIPOINT, WKB_MULTILINESTRING, WKB_MULTIPOLYGON):
+        (part_count,) = struct.unpack_from(endian + 'I', buf, pos)
+        pos += 4
+        for part_i in range(part_count):
+            part_endian, part_type, part_ndim, pos = _read_header(buf, pos)
+            if part_type == WKB_POLYGON:
+                ring_count, pos = _read_polygon_body(buf, pos, part_endian, part_ndim, ring_sizes, chunks)
+                part_sizes.append(ring_count)
+            elif part_type == WKB_POINT:
+                xy, pos = _read_vertices(buf, pos, part_endian, part_ndim, 1)
+                chunks.append(xy)
+                ring_sizes.append(1)
+                part_sizes.append(1)
+            else: # linestring
+                (vertex_count,) = struct.unpack_from(part_endian + 'I', buf, pos)
+                xy, pos = _read_vertices(buf, pos + 4, part_endian, part_ndim, vertex_count)
+                chunks.append(xy)
+                ring_sizes.append(vertex_count)
+                part_sizes.append(1)
+        return part_count
+    raise ValueError('Unsupported WKB geometry type: ' + str(geom_type))
+
+
+def _offsets(sizes):
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    if len(sizes) > 0:
+        np.cumsum(sizes, out=offsets[1:])
+    return offsets
+
+
+def wkb_to_flat(wkb_list):
+    # Decode a sequence of WKB blobs (None = empty geometry) into one FlatGeometry.
+    ring_sizes = []
+    part_sizes = []
+    geom_sizes = []
+    chunks = []
+    for wkb in wkb_list:
+        if wkb is None:
+            geom_sizes.append(0)
+        else:
+            geom_sizes.append(_parse_wkb(bytes(wkb), ring_sizes, part_sizes, chunks))
+    if len(chunks) > 0:
+        coords = np.ascontiguousarray(np.concatenate(chunks), dtype=np.float64)
+    else:
+        coords = np.zeros((0, 2), dtype=np.float64)
+    return FlatGeometry(coords, _offsets(ring_sizes), _offsets(part_sizes), _offsets(geom_sizes))
+
+
+def read_flat_geometry(feature_class, fields=None, where=None, spatial_reference=None):
+    # Read geometries (WKB, WGS84 by default) plus optional attribute fields in one cursor pass.
+    # Returns (FlatGeometry, {field: list of values}) in cursor (OID) order.
+    import arcpy
+    if spatial_reference is None:
+        spatial_reference = wgs84()
+    if fields is None:
+        fields = []
+    wkb_list = []
+    values = dict((f, []) for f in fields)
+    with arcpy.da.SearchCursor(feature_class, ['SHAPE@WKB'] + list(fields), where_clause=where,
+                               spatial_reference=spatial_reference) as cursor:
+        for row in cursor:
+            wkb_list.append(row[0])
+            for f_i, f in enumerate(fields):
+                values[f].append(row[f_i + 1])
+    return wkb_to_flat(wkb_list), values
+
+
+def geometry_count(flat):
+    return len(flat.geom_offsets) - 1
+
+
+def ring_geometry_index(flat):
+    # Geometry index of every ring (parallel with ring_offsets[:-1]).
+    part_of_ring = np.repeat(np.arange(len(flat.part_offsets) - 1), np.diff(flat.part_offsets))
+    geom_of_part = np.repeat(np.arange(len(flat.geom_offsets) - 1), np.diff(flat.geom_offsets))
+    return geom_of_part[part_of_ring]
+
+
+def geometry_ring_offsets(flat):
+    # Offsets of each geometry into the ring list (geometry g owns rings [out[g], out[g+1])).
+    return flat.part_offsets[flat.geom_offsets]
+
+
+def exterior_ring_mask(flat):
+    # True for the first ring of every part (exterior), False for holes.
+    mask = np.zeros(len(flat.ring_offsets) - 1, dtype=bool)
+    part_sizes = np.diff(flat.part_offsets)
+    mask[flat.part_offsets[:-1][part_sizes > 0]] = True
+    return mask
+
+
+def geometry_bounds(flat):
+    # (n, 4) array of [xmin, ymin, xmax, ymax] per geometry; NaN for empty geometries.
+    n_geom = geometry_count(flat)
+    bounds = np.full((n_geom, 4), np.nan)
+    vertex_offsets = flat.ring_offsets[geometry_ring_offsets(flat)]
+    sizes = np.diff(vertex_offsets)
+    nonempty = np.nonzero(sizes > 0)[0]
+    if len(nonempty) > 0:
+        starts = vertex_offsets[:-1][nonempty]
+        x = flat.coords[:, 0]
+        y = flat.coords[:, 1]
+        bounds[nonempty, 0] = np.minimum.reduceat(x, starts)
+        bounds[nonempty, 1] = np.minimum.reduceat(y, starts)
+        bounds[nonempty, 2] = np.maximum.reduceat(x, starts)
+        bounds[nonempty, 3] = np.maximum.reduceat(y, starts)
+    return bounds
+
+
+def subset(flat, geom_indices):
+    # New FlatGeometry holding only the given geometries (in the given order).
+    geom_indices = np.asarray(geom_indices, dtype=np.int64)
+    ring_sizes = np.diff(flat.ring_offsets)
+    part_sizes = np.diff(flat.part_offsets)
+    geom_sizes = np.diff(flat.geom_offsets)
+    part_index = _ranges(flat.geom_offsets[geom_indices], geom_sizes[geom_indices])
+    ring_index = _ranges(flat.part_offsets[part_index], part_sizes[part_index])
+    vertex_index = _ranges(flat.ring_offsets[ring_index], ring_sizes[ring_index])
+    return FlatGeometry(flat.coords[vertex_index], _offsets(ring_sizes[ring_index]),
+                        _offsets(part_sizes[part_index]), _offsets(geom_sizes[geom_indices]))
+
+
+def _ranges(starts, sizes):
+    # Concatenation of arange(start, start + size) for every (start, size), without a Python loop.
+    sizes = np.asarray(sizes, dtype=np.int64)
+    total = int(sizes.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(np.asarray(starts, dtype=np.int64) - _offsets(sizes)[:-1], sizes)
+    return offsets + np.arange(total, dtype=np.int64)
+
+
+def geometry_hashes(flat):
+    # 16-byte digest per geometry of its coordinates and ring/part structure (empty geometries share one digest).
+    n_geom = geometry_count(flat)
+    hashes = np.zeros(n_geom, dtype='S16')
+    geom_rings = geometry_ring_offsets(flat)
+    ring_sizes = np.diff(flat.ring_offsets)
+    part_sizes = np.diff(flat.part_offsets)
+    for geom_i in range(n_geom):
+        ring_start = geom_rings[geom_i]
+        ring_end = geom_rings[geom_i + 1]
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(part_sizes[flat.geom_offsets[geom_i]:flat.geom_offsets[geom_i + 1]].tobytes())
+        digest.update(ring_sizes[ring_start:ring_end].tobytes())
+        digest.update(flat.coords[flat.ring_offsets[ring_start]:flat.ring_offsets[ring_end]].tobytes())
+        hashes[geom_i] = digest.digest()
+    return hashes
+
+
+EARTH_RADIUS = 6371008.8 # mean Earth radius (m), for local distances
+
+
+def pair_segments(flat, pair_geom):
+    # Edges of the geometries in pair_geom: (pair index of each edge, index of the edge's first vertex).
+    # Edge i joins vertex i and i+1 of the same ring; edges of a pair are contiguous.
+    pair_geom = np.asarray(pair_geom, dtype=np.int64)
+    vertex_offsets = flat.ring_offsets[geometry_ring_offsets(flat)]
+    starts = vertex_offsets[pair_geom]
+    sizes = vertex_offsets[pair_geom + 1] - starts
+    vertex_index = _ranges(starts, sizes)
+    pair_index = np.repeat(np.arange(len(pair_geom)), sizes)
+    ring_id = np.repeat(np.arange(len(flat.ring_offsets) - 1), np.diff(flat.ring_offsets))
+    next_index = np.minimum(vertex_index + 1, len(ring_id) - 1)
+    valid = (vertex_index + 1 < len(ring_id)) & (ring_id[vertex_index] == ring_id[next_index])
+    return pair_index[valid], vertex_index[valid]
+
+
+def point_polygon_distance(px, py, pair_point, pair_geom, flat, boundary=False):
+    # Distance (m) from point pair_point[k] (lon/lat in px, py) to geometry pair_geom[k] (0 inside, or the
+    # distance to the boundary if boundary=True), and whether the point is inside (even-odd rule, so holes
+    # and multi-part polygons are handled).
+    # Distances use a local equirectangular frame centred on each point: accurate to ~0.1% within a few km.
+    pair_point = np.asarray(pair_point, dtype=np.int64)
+    n_pair = len(pair_point)
+    distance = np.full(n_pair, np.inf)
+    inside = np.zeros(n_pair, dtype=bool)
+    if n_pair == 0:
+        return distance, inside
+    seg_pair, seg_start = pair_segments(flat, pair_geom)
+    if len(seg_pair) == 0:
+        return distance, inside
+    point_x = np.asarray(px, dtype=np.float64)[pair_point][seg_pair]
+    point_y = np.asarray(py, dtype=np.float64)[pair_point][seg_pair]
+    scale_y = np.radians(EARTH_RADIUS)
+    scale_x = scale_y*np.cos(np.radians(point_y))
+    x1 = ((flat.coords[seg_start, 0] - point_x + 180) % 360 - 180)*scale_x
+    y1 = (flat.coords[seg_start, 1] - point_y)*scale_y
+    x2 = ((flat.coords[seg_start + 1, 0] - point_x + 180) % 360 - 180)*scale_x
+    y2 = (flat.coords[seg_start + 1, 1] - point_y)*scale_y
+    dx = x2 - x1
+    dy = y2 - y1
+    length_2 = dx*dx + dy*dy
+    t = np.where(length_2 > 0, -(x1*dx + y1*dy)/np.where(length_2 > 0, length_2, 1), 0)
+    t = np.clip(t, 0, 1)
+    seg_distance = np.hypot(x1 + t*dx, y1 + t*dy)
+    np.minimum.at(distance, seg_pair, seg_distance)
+    # Ray casting along +x from the point (the origin of the local frame)
+    crosses = (y1 > 0) != (y2 > 0)
+    x_cross = x1 + (0 - y1)*dx/np.where(dy != 0, dy, 1)
+    crossing_count = np.bincount(seg_pair[crosses & (x_cross > 0)], minlength=n_pair)
+    inside = crossing_count % 2 == 1
+    if boundary:
+        return distance, inside
+    return np.where(inside, 0.0, distance), inside
@@ -0,0 +1,225 @@
+# [Description] ------------------------------
+# Conservative multi-level envelopes of detailed polygons (circa2015/PLD shorelines), to accept or reject most
+# candidate pairs of the spatial predicates before the full-resolution geometry is touched:
+#   hull    convex hull (contains the polygon)
+#   outer   outline simplified (Douglas-Peucker, tolerance in degrees) and buffered outward by the tolerance
+#           (contains the polygon)
+#   core    simplified outline buffered inward by the tolerance (contained in the polygon; empty for thin polygons)
+# Containment is checked against the full-resolution polygon when the envelopes are built: an outer envelope that
+# does not cover the polygon is rebuilt with twice the buffer, then replaced by the hull, and a core that is not
+# covered by it is rebuilt likewise, then dropped, so the classifications below never decide wrongly, they only
+# leave more pairs to the exact test.
+# Classifications of candidate pairs: REJECT (predicate false), ACCEPT (predicate true) or EXACT (test needed).
+#   intersects          reject: hulls or outer envelopes disjoint; accept: cores intersect
+#   shared_boundary     (SHARE_A_LINE_SEGMENT_WITH) reject: outer envelopes disjoint, or one polygon strictly inside
+#                       the core of the other; never accepted
+# Envelopes are cached in an .npz file next to the dataset (rtree_sidecar.sidecar_path with ENVELOPE_EXTENSION),
+# keyed by geometry hash (geometry_arrays.geometry_hashes): edited polygons get new hashes and are rebuilt, and a
+# cache built with another tolerance is discarded. Building needs Shapely 2 (optional, as in thread_pool.py).
+
+# Usage:
+#   envelopes = geometry_envelopes.cached_envelopes(flat, geometry_envelopes.EnvelopeCache(path))
+#   classes = geometry_envelopes.classify_intersects(geometry_envelopes.prepare(envelopes_a),
+#                                                    geometry_envelopes.prepare(envelopes_b), pair_a, pair_b)
+#   pair_a[classes == geometry_envelopes.EXACT] ... exact tests only for these
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import os
+import numpy as np
+from collections import namedtuple
+import geometry_arrays, rtree_sidecar, thread_pool
+
+try:
+    import shapely
+except ImportError:
+    shapely = None
+
+Envelopes = namedtuple('Envelopes', ['hull', 'outer', 'core']) # FlatGeometry per level, parallel with the polygons
+
+REJECT = 0
+ACCEPT = 1
+EXACT = 2
+DEFAULT_TOLERANCE = 0.0005 # degrees (about 55 m of latitude)
+ENVELOPE_EXTENSION = '.env.npz'
+LEVELS = ['hull', 'outer', 'core']
+
+
+def _concatenate_flat(flats):
+    # One FlatGeometry with the geometries of every flat array, in order.
+    return geometry_arrays.FlatGeometry(
+        np.concatenate([x.coords for x in flats]).reshape(-1, 2),
+        geometry_arrays._offsets(np.concatenate([np.diff(x.ring_offsets) for x in flats])),
+        geometry_arrays._offsets(np.concatenate([np.diff(x.part_offsets) for x in flats])),
+        geometry_arrays._offsets(np.concatenate([np.diff(x.geom_offsets) for x in flats])))
+
+
+def from_shapely(geometries):
+    # Flat array with one geometry per shapely geometry (its polygon parts; empty if it has none).
+    flat, index = thread_pool._flat_polygons(geometries)
+    return flat._replace(geom_offsets=np.searchsorted(index, np.arange(len(geometries) + 1)).astype(np.int64))
+
+
+def build_envelopes(flat, tolerance=DEFAULT_TOLERANCE):
+    # Envelopes of every polygon of a flat array; returns (Envelopes, number of outer envelopes replaced by hulls).
+    thread_pool._require_shapely()
+    geometries = thread_pool.to_shapely(flat)
+    hull = shapely.convex_hull(geometries)
+    # Degenerate (zero-area) polygons have line or point hulls
+    hull = np.where(shapely.get_type_id(hull) == shapely.GeometryType.POLYGON, hull, shapely.buffer(hull, tolerance))
+    simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    # The topology-preserving simplifier may move the outline slightly more than the tolerance
+    outer = shapely.buffer(simplified, tolerance, join_style='mitre')
+    core = shapely.buffer(simplified, -tolerance, join_style='mitre')
+    outer_fallback = np.nonzero(~shapely.covers(outer, geometries))[0]
+    outer[outer_fallback] = shapely.buffer(simplified[outer_fallback], 2*tolerance, join_style='mitre')
+    outer_fallback = outer_fallback[~shapely.covers(outer[outer_fallback], geometries[outer_fallback])]
+    outer[outer_fallback] = hull[outer_fallback]
+    core_fallback = np.nonzero(~shapely.covers(geometries, core))[0]
+    core[core_fallback] = shapely.buffer(simplified[core_fallback], -2*tolerance, join_style='mitre')
+    core_fallback = core_fallback[~shapely.covers(geometries[core_fallback], core[core_fallback])]
+    core[core_fallback] = shapely.Polygon()
+    return Envelopes(from_shapely(hull), from_shapely(outer), from_shapely(core)), len(outer_fallback)
+
+
+class EnvelopeCache(object):
+    # Geometry hash -> envelopes. Persisted as an .npz file (path=None: in-memory cache); the cache is
+    # discarded when it was built with another tolerance.
+    def __init__(self, path=None, tolerance=DEFAULT_TOLERANCE):
+        self.path = path
+        self.tolerance = tolerance
+        self.index = {}
+        self.envelopes = None
+        self.modified = False
+        if path is not None and os.path.exists(path):
+            data = np.load(path)
+            if float(data['tolerance']) == tolerance:
+                self.envelopes = Envelopes(*[geometry_arrays.FlatGeometry(
+                    data[level + '_coords'], data[level + '_ring_offsets'], data[level + '_part_offsets'],
+                    data[level + '_geom_offsets']) for level in LEVELS])
+                self.index = dict((h, i) for i, h in enumerate(data['hashes'].tolist()))
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, hashes):
+        # Cache positions parallel with hashes (-1 where not cached).
+        return np.array([self.index.get(h, -1) for h in hashes.tolist()], dtype=np.int64)
+
+    def get(self, positions):
+        return Envelopes(*[geometry_arrays.subset(x, positions) for x in self.envelopes])
+
+    def update(self, hashes, envelopes):
+        start = len(self.index)
+        if self.envelopes is None:
+            self.envelopes = envelopes
+        else:
+            self.envelopes = Envelopes(*[_concatenate_flat([a, b]) for a, b in zip(self.envelopes, envelopes)])
+        for i, h in enumerate(hashes.tolist()):
+            self.index[h] = start + i
+        self.modified = True
+
+    def save(self, keep_hashes=None):
+        # Write the cache; keep_hashes: only keep these geometries (e.g. those still in the dataset).
+        if keep_hashes is not None:
+            keep = sorted(set(self.index[h] for h in keep_hashes.tolist() if h in self.index))
+            if len(keep) < len(self.index):
+                hashes = dict((i, h) for h, i in self.index.items())
+                self.envelopes = self.get(keep)
+                self.index = dict((hashes[old], new) for new, old in enumerate(keep))
+                self.modified = True
+        if self.path is None or not self.modified or self.envelopes is None:
+            return
+        hashes = dict((i, h) for h, i in self.index.items())
+        arrays = {'tolerance': np.float64(self.tolerance),
+                  'hashes': np.array([hashes[i] for i in range(len(hashes))], dtype='S16')}
+        for level, flat in zip(LEVELS, self.envelopes):
+            for name, array in zip(flat._fields, flat):
+                arrays[level + '_' + name] = array
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self.path)
+        self.modified = False
+
+
+def cached_envelopes(flat, cache=None, tolerance=DEFAULT_TOLERANCE):
+    # build_envelopes() that only builds the polygons missing from the cache (the cache tolerance is used if given).
+    if cache is None:
+        return build_envelopes(flat, tolerance)[0]
+    hashes = geometry_arrays.geometry_hashes(flat)
+    positions = cache.lookup(hashes)
+    missing = np.nonzero(positions == -1)[0]
+    if len(missing) > 0:
+        # Duplicate geometries (same hash) are built once
+        unique_hashes, first = np.unique(hashes[missing], return_index=True)
+        cache.update(unique_hashes, build_envelopes(geometry_arrays.subset(flat, missing[first]), cache.tolerance)[0])
+        positions = cache.lookup(hashes)
+    return cache.get(positions)
+
+
+def feature_class_envelopes(feature_class, fields=None, tolerance=DEFAULT_TOLERANCE, cache_path=None, where=None):
+    # (flat, {field: values}, Envelopes) of a polygon feature class, with the cache next to it
+    # (cache_path default: rtree_sidecar.sidecar_path(feature_class, ENVELOPE_EXTENSION)).
+    import arcpy
+    cache_path = cache_path or rtree_sidecar.sidecar_path(arcpy.Describe(feature_class).catalogPath, ENVELOPE_EXTENSION)
+    cache = EnvelopeCache(cache_path, tolerance)
+    flat, values = geometry_arrays.read_flat_geometry(feature_class, fields, where=where)
+    envelopes = cached_envelopes(flat, cache)
+    cache.save(None if where else geometry_arrays.geometry_hashes(flat))
+    return flat, values, envelopes
+
+
+def prepare(envelopes):
+    # Prepared shapely geometries of every envelope level (for the polygon-pair classifications).
+    thread_pool._require_shapely()
+    levels = Envelopes(*[thread_pool.to_shapely(x) for x in envelopes])
+    for geometries in levels:
+        shapely.prepare(geometries)
+    return levels
+
+
+def _reject_disjoint(prepared_a, prepared_b, pair_a, pair_b, classes):
+    # REJECT the EXACT pairs whose hulls, then outer envelopes, are disjoint.
+    for level in ['hull', 'outer']:
+        k = np.nonzero(classes == EXACT)[0]
+        disjoint = ~shapely.intersects(getattr(prepared_a, level)[pair_a[k]], getattr(prepared_b, level)[pair_b[k]])
+        classes[k[disjoint]] = REJECT
+
+
+def classify_intersects(prepared_a, prepared_b, pair_a, pair_b):
+    # Classes of the pairs (polygon pair_a[k] of a, pair_b[k] of b) for the INTERSECT predicate.
+    pair_a = np.asarray(pair_a, dtype=np.int64)
+    pair_b = np.asarray(pair_b, dtype=np.int64)
+    classes = np.full(len(pair_a), EXACT, dtype=np.int8)
+    _reject_disjoint(prepared_a, prepared_b, pair_a, pair_b, classes)
+    k = np.nonzero(classes == EXACT)[0]
+    classes[k[shapely.intersects(prepared_a.core[pair_a[k]], prepared_b.core[pair_b[k]])]] = ACCEPT
+    return classes
+
+
+def classify_shared_boundary(prepared_a, prepared_b, pair_a, pair_b):
+    # Classes of the pairs for SHARE_A_LINE_SEGMENT_WITH (boundaries sharing a segment): never ACCEPT.
+    pair_a = np.asarray(pair_a, dtype=np.int64)
+    pair_b = np.asarray(pair_b, dtype=np.int64)
+    classes = np.full(len(pair_a), EXACT, dtype=np.int8)
+    _reject_disjoint(prepared_a, prepared_b, pair_a, pair_b, classes)
+    k = np.nonzero(classes == EXACT)[0]
+    nested = shapely.contains_properly(prepared_a.core[pair_a[k]], prepared_b.outer[pair_b[k]]) | \
+             shapely.contains_properly(prepared_b.core[pair_b[k]], prepared_a.outer[pair_a[k]])
+    classes[k[nested]] = REJECT
+    return classes
+
+
+def classify_related(prepared_a, prepared_b, pair_a, pair_b, relation):
+    # classify_intersects or classify_shared_boundary by Step1 selection relation name.
+    if relation == 'INTERSECT':
+        return classify_intersects(prepared_a, prepared_b, pair_a, pair_b)
+    if relation == 'SHARE_A_LINE_SEGMENT_WITH':
+        return classify_shared_boundary(prepared_a, prepared_b, pair_a, pair_b)
+    raise ValueError('no envelope classification for ' + relation)
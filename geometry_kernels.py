@@ -0,0 +1,150 @@
+# [Description] ------------------------------
+# Batch point-to-polygon kernels on flat coordinate buffers (see geometry_arrays.py):
+# for (point, candidate polygon) pair arrays, the distance (m) from the point to the polygon and whether the point
+# is inside (even-odd rule). With Numba installed the kernel is compiled (parallel loop over pairs, no GIL,
+# no Python objects per pair); without it, geometry_arrays.point_polygon_distance is used in chunks.
+# Both engines use the same local equirectangular formula, so they return the same values.
+
+# Usage:
+#   distance, inside = geometry_kernels.point_polygon_distance(lons, lats, pair_point, pair_geom, flat)
+#   cand_point, cand_geom, cand_distance = geometry_kernels.candidates_within(lons, lats, flat, 1000.0)
+#   ... = geometry_kernels.candidates_within(lons, lats, flat, 1000.0, envelopes=envelopes)   # see geometry_envelopes.py
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import math
+import numpy as np
+import geometry_arrays, packed_rtree
+
+try:
+    import numba
+    ENGINE = 'numba'
+except ImportError:
+    numba = None
+    ENGINE = 'numpy'
+
+FALLBACK_CHUNK_EDGES = 4000000 # edges per chunk of the numpy fallback (bounds its temporary arrays)
+METERS_PER_DEGREE = math.radians(geometry_arrays.EARTH_RADIUS)
+_warm = False
+
+
+def _distance_kernel(px, py, pair_point, pair_geom, coords, ring_offsets, geom_rings, boundary, distance, inside):
+    # One pass over the edges of the candidate polygon of every pair (same arithmetic as
+    # geometry_arrays.point_polygon_distance).
+    for k in numba.prange(len(pair_point)):
+        point_x = px[pair_point[k]]
+        point_y = py[pair_point[k]]
+        g = pair_geom[k]
+        scale_y = METERS_PER_DEGREE
+        scale_x = scale_y*math.cos(math.radians(point_y))
+        best = np.inf
+        crossing_count = 0
+        for r in range(geom_rings[g], geom_rings[g + 1]):
+            for i in range(ring_offsets[r], ring_offsets[r + 1] - 1):
+                x1 = ((coords[i, 0] - point_x + 180) % 360 - 180)*scale_x
+                y1 = (coords[i, 1] - point_y)*scale_y
+                x2 = ((coords[i + 1, 0] - point_x + 180) % 360 - 180)*scale_x
+                y2 = (coords[i + 1, 1] - point_y)*scale_y
+                dx = x2 - x1
+                dy = y2 - y1
+                length_2 = dx*dx + dy*dy
+                t = 0.0
+                if length_2 > 0:
+                    t = min(max(-(x1*dx + y1*dy)/length_2, 0.0), 1.0)
+                d = math.hypot(x1 + t*dx, y1 + t*dy)
+                if d < best:
+                    best = d
+                if (y1 > 0) != (y2 > 0):
+                    if x1 + (0 - y1)*dx/(dy if dy != 0 else 1) > 0:
+                        crossing_count += 1
+        inside[k] = crossing_count % 2 == 1
+        distance[k] = 0.0 if inside[k] and not boundary else best
+
+
+_serial_distance_kernel = _distance_kernel
+if numba is not None:
+    # The serial variant is for callers that run their own threads (see thread_pool.py): numba's default
+    # threading layer does not allow parallel kernels to be entered from several threads at once.
+    _serial_distance_kernel = numba.njit(nogil=True, cache=True)(_distance_kernel)
+    _distance_kernel = numba.njit(parallel=True, nogil=True, cache=True)(_distance_kernel)
+
+
+def warm_up():
+    # Compile (or load from the cache) both kernels and start numba's threading layer on the calling thread.
+    # Call on the main thread before running kernels on worker threads: a parallel kernel first entered off the
+    # main thread leaves the interpreter hanging at exit.
+    global _warm
+    if numba is None or _warm:
+        return
+    flat = geometry_arrays.FlatGeometry(np.array([[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 0.0]]),
+                                        np.array([0, 4], dtype=np.int64), np.array([0, 1], dtype=np.int64),
+                                        np.array([0, 1], dtype=np.int64))
+    for parallel in [True, False]:
+        point_polygon_distance(np.zeros(1), np.zeros(1), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                               flat, parallel=parallel)
+    _warm = True
+
+
+def _numpy_distance(px, py, pair_point, pair_geom, flat, boundary):
+    # geometry_arrays.point_polygon_distance in chunks of about FALLBACK_CHUNK_EDGES edges.
+    vertex_offsets = flat.ring_offsets[geometry_arrays.geometry_ring_offsets(flat)]
+    pair_edges = vertex_offsets[pair_geom + 1] - vertex_offsets[pair_geom]
+    chunk_of_pair = np.cumsum(pair_edges)//FALLBACK_CHUNK_EDGES
+    bounds = np.searchsorted(chunk_of_pair, np.arange(chunk_of_pair[-1] + 2))
+    distance = np.empty(len(pair_point))
+    inside = np.empty(len(pair_point), dtype=bool)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end > start:
+            distance[start:end], inside[start:end] = geometry_arrays.point_polygon_distance(
+                px, py, pair_point[start:end], pair_geom[start:end], flat, boundary)
+    return distance, inside
+
+
+def point_polygon_distance(px, py, pair_point, pair_geom, flat, boundary=False, engine=None, parallel=True):
+    # Distance (m) from point pair_point[k] to polygon pair_geom[k] (0 inside unless boundary=True) and inside flags.
+    # engine: 'numba' or 'numpy' (default: ENGINE). parallel=False: single-threaded kernel (still releases the GIL).
+    px = np.ascontiguousarray(px, dtype=np.float64)
+    py = np.ascontiguousarray(py, dtype=np.float64)
+    pair_point = np.ascontiguousarray(pair_point, dtype=np.int64)
+    pair_geom = np.ascontiguousarray(pair_geom, dtype=np.int64)
+    if len(pair_point) == 0:
+        return np.zeros(0), np.zeros(0, dtype=bool)
+    if (engine or ENGINE) == 'numpy':
+        return _numpy_distance(px, py, pair_point, pair_geom, flat, boundary)
+    distance = np.empty(len(pair_point))
+    inside = np.empty(len(pair_point), dtype=bool)
+    kernel = _distance_kernel if parallel else _serial_distance_kernel
+    kernel(px, py, pair_point, pair_geom, np.ascontiguousarray(flat.coords), flat.ring_offsets,
+           geometry_arrays.geometry_ring_offsets(flat), boundary, distance, inside)
+    return distance, inside
+
+
+def search_windows(lons, lats, radius):
+    # Lon/lat boxes that contain every point within radius (m) of each point.
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    d_lat = np.degrees(radius/geometry_arrays.EARTH_RADIUS)
+    d_lon = d_lat/np.maximum(np.cos(np.radians(np.abs(lats) + d_lat)), 1e-6)
+    return np.column_stack([lons - d_lon, lats - d_lat, lons + d_lon, lats + d_lat])
+
+
+def candidates_within(lons, lats, flat, max_distance, rtree=None, engine=None, envelopes=None):
+    # All (point, polygon) pairs within max_distance (m): (point index, polygon index, distance), sorted by point.
+    # rtree: optional PackedRTree on the polygon bounds (built if not given).
+    # envelopes: optional geometry_envelopes.Envelopes of flat; pairs farther than max_distance from the outer
+    # envelope are dropped before the full-resolution distances.
+    if rtree is None:
+        rtree = packed_rtree.PackedRTree.build(geometry_arrays.geometry_bounds(flat))
+    point_i, geom_i = rtree.query_bulk(search_windows(lons, lats, max_distance))
+    if envelopes is not None:
+        near = point_polygon_distance(lons, lats, point_i, geom_i, envelopes.outer, engine=engine)[0] <= max_distance
+        point_i, geom_i = point_i[near], geom_i[near]
+    distance = point_polygon_distance(lons, lats, point_i, geom_i, flat, engine=engine)[0]
+    keep = distance <= max_distance
+    return point_i[keep], geom_i[keep], distance[keep]
@@ -0,0 +1,204 @@
+# [Description] ------------------------------
+# Read-only geometry store for process-pool workers.
+# The PLD polygons (flat GeoArrow-style buffers, see geometry_arrays.py), their IDs, bounds and a packed
+# Hilbert R-tree (packed_rtree.py) are written once into one contiguous buffer, either in
+# multiprocessing shared memory or in a memory-mapped file. Workers attach by name/path in milliseconds
+# and get NumPy views on the buffer: nothing is pickled or copied per worker.
+# Coordinates can optionally be quantized to int32 (about 2 cm at global extent) to halve the memory.
+
+# Usage (parent):
+#   store = geometry_store.create(flat, ids, shared_memory=True)      # or path=r"...\PLD.gstore"
+#   pool = multiprocessing.Pool(initializer=geometry_store.worker_initializer, initargs=(store.name, store.path))
+#   ... store.unlink() when all workers are done
+# Usage (worker):
+#   store = geometry_store.attached_store(); store.query_bbox(bbox); store.geometry(i)
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import json, os, struct
+import numpy as np
+import geometry_arrays, packed_rtree
+from geometry_arrays import FlatGeometry
+
+MAGIC = b'PLDGSTR1'
+ALIGNMENT = 64
+INT32_MAX = 2**31 - 2
+
+
+def _aligned(size):
+    return (size + ALIGNMENT - 1)//ALIGNMENT*ALIGNMENT
+
+
+def _layout(arrays, meta):
+    # Header (magic, header length, JSON) followed by 64-byte aligned arrays.
+    entries = {}
+    header = {'meta': meta, 'arrays': entries}
+    for name, array in arrays.items():
+        entries[name] = [array.dtype.str, list(array.shape), 0]
+    # The header length depends on the offsets written into it, so size it with generous offsets first
+    header_size = _aligned(16 + len(json.dumps(header)) + 32*len(arrays) + ALIGNMENT)
+    position = header_size
+    for name, array in arrays.items():
+        entries[name][2] = position
+        position = _aligned(position + array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    if 16 + len(header_bytes) > header_size:
+        raise ValueError('geometry store header does not fit')
+    return header_bytes, header_size, position
+
+
+def _write(buffer, arrays, header_bytes, header_size):
+    buffer = np.frombuffer(buffer, dtype=np.uint8)
+    buffer[:16] = np.frombuffer(MAGIC + struct.pack('<Q', len(header_bytes)), dtype=np.uint8)
+    buffer[16:16 + len(header_bytes)] = np.frombuffer(header_bytes, dtype=np.uint8)
+    header = json.loads(header_bytes.decode('utf-8'))
+    for name, array in arrays.items():
+        dtype, shape, offset = header['arrays'][name]
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=buffer, offset=offset)
+        view[...] = array
+
+
+def _read_views(buffer):
+    if bytes(buffer[:8]) != MAGIC:
+        raise ValueError('not a geometry store')
+    (header_length,) = struct.unpack('<Q', bytes(buffer[8:16]))
+    header = json.loads(bytes(buffer[16:16 + header_length]).decode('utf-8'))
+    views = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=buffer, offset=offset)
+        view.flags.writeable = False
+        views[name] = view
+    return header['meta'], views
+
+
+class GeometryStore(object):
+    def __init__(self, meta, views, shared_memory=None, path=None, mmap=None):
+        self.meta = meta
+        self.views = views
+        self.shared_memory = shared_memory
+        self.path = path
+        self._mmap = mmap
+        self.name = shared_memory.name if shared_memory is not None else None
+        self.ids = views['ids']
+        self.bounds = views['bounds']
+        self.rtree = packed_rtree.PackedRTree.from_arrays(
+            dict((k[6:], v) for k, v in views.items() if k.startswith('rtree_')))
+        self.quantized = bool(meta['quantized'])
+        self.scale = meta['scale']
+        self.origin = np.array(meta['origin'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def coords(self):
+        # Dequantized coordinates (a copy if quantized, the shared view otherwise).
+        if self.quantized:
+            return self.views['coords'].astype(np.float64)*self.scale + self.origin
+        return self.views['coords']
+
+    def flat(self):
+        # FlatGeometry over the whole store.
+        return FlatGeometry(self.coords, self.views['ring_offsets'], self.views['part_offsets'], self.views['geom_offsets'])
+
+    def geometry(self, geom_i):
+        # FlatGeometry of one geometry (only its coordinates are dequantized/copied).
+        geom_offsets = self.views['geom_offsets']
+        part_offsets = self.views['part_offsets']
+        ring_offsets = self.views['ring_offsets']
+        part_start, part_end = geom_offsets[geom_i], geom_offsets[geom_i + 1]
+        ring_start, ring_end = part_offsets[part_start], part_offsets[part_end]
+        vertex_start, vertex_end = ring_offsets[ring_start], ring_offsets[ring_end]
+        coords = self.views['coords'][vertex_start:vertex_end]
+        if self.quantized:
+            coords = coords.astype(np.float64)*self.scale + self.origin
+        return FlatGeometry(coords, ring_offsets[ring_start:ring_end + 1] - vertex_start,
+                            part_offsets[part_start:part_end + 1] - ring_start,
+                            np.array([0, part_end - part_start], dtype=np.int64))
+
+    def query_bbox(self, bbox):
+        # Geometry indices whose bounds intersect bbox [xmin, ymin, xmax, ymax].
+        return self.rtree.query(bbox)
+
+    def close(self):
+        # Detach (the shared memory block / file stays available to others).
+        self.views = None
+        self.ids = self.bounds = self.rtree = None
+        if self.shared_memory is not None:
+            self.shared_memory.close()
+        self._mmap = None # the file is unmapped once the last view is released
+
+    def unlink(self):
+        # Remove the shared memory block (call once, from the process that created it).
+        if self.shared_memory is not None:
+            self.shared_memory.unlink()
+
+
+def create(flat, ids, shared_memory=True, path=None, quantize=False, node_size=16):
+    # Build a store from a FlatGeometry and its IDs (e.g. lake_UID strings), in shared memory or in a file at path.
+    ids = np.asarray([b'' if i is None else (i.encode('utf-8') if isinstance(i, str) else i) for i in ids]) \
+        if len(ids) > 0 else np.zeros(0, dtype='S1')
+    bounds = geometry_arrays.geometry_bounds(flat)
+    rtree = packed_rtree.PackedRTree.build(bounds, node_size)
+    coords = np.asarray(flat.coords, dtype=np.float64)
+    meta = {'quantized': bool(quantize), 'scale': 1.0, 'origin': [0.0, 0.0]}
+    if quantize and len(coords) > 0:
+        origin = (coords.min(axis=0) + coords.max(axis=0))/2
+        scale = max(float((coords.max(axis=0) - coords.min(axis=0)).max())/(2*INT32_MAX), 1e-9)
+        coords = np.round((coords - origin)/scale).astype(np.int32)
+        meta.update({'scale': scale, 'origin': origin.tolist()})
+    arrays = {'coords': coords, 'ring_offsets': np.asarray(flat.ring_offsets, dtype=np.int64),
+              'part_offsets': np.asarray(flat.part_offsets, dtype=np.int64),
+              'geom_offsets': np.asarray(flat.geom_offsets, dtype=np.int64),
+              'ids': ids, 'bounds': bounds}
+    for name, array in rtree.to_arrays().items():
+        arrays['rtree_' + name] = array
+    header_bytes, header_size, total_size = _layout(arrays, meta)
+    if path is not None:
+        tmp_path = path + '.tmp'
+        mm = np.memmap(tmp_path, dtype=np.uint8, mode='w+', shape=(total_size,))
+        _write(mm, arrays, header_bytes, header_size)
+        mm.flush()
+        del mm
+        os.replace(tmp_path, path)
+        return attach(path=path)
+    from multiprocessing import shared_memory as shm_module
+    block = shm_module.SharedMemory(create=True, size=total_size)
+    _write(block.buf, arrays, header_bytes, header_size)
+    meta, views = _read_views(block.buf)
+    return GeometryStore(meta, views, shared_memory=block)
+
+
+def attach(name=None, path=None):
+    # Attach to a store created by create(): by shared memory name, or by file path (memory-mapped, read-only).
+    if path is not None:
+        mm = np.memmap(path, dtype=np.uint8, mode='r')
+        meta, views = _read_views(mm)
+        return GeometryStore(meta, views, path=path, mmap=mm)
+    from multiprocessing import shared_memory as shm_module
+    try:
+        # Attaching processes must not unlink the block when they exit (only the creator does).
+        block = shm_module.SharedMemory(name=name, track=False) # Python >= 3.13
+    except TypeError:
+        block = shm_module.SharedMemory(name=name) # pool workers share the creator's resource tracker
+    meta, views = _read_views(block.buf)
+    return GeometryStore(meta, views, shared_memory=block)
+
+
+_attached = None
+
+
+def worker_initializer(name=None, path=None):
+    # multiprocessing.Pool initializer: attach once per worker process.
+    global _attached
+    _attached = attach(name, path)
+
+
+def attached_store():
+    return _attached
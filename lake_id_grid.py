@@ -0,0 +1,306 @@
+# [Description] ------------------------------
+# Rasterized lake-ID grid for approximate dam-to-lake lookups (Step5 pairing without per-dam location queries).
+# The dissolved water mask is rasterized (rasterize.py) on a global lon/lat grid (1 arc-second by default) and,
+# within a distance band (max_search_distance_large + margin), every cell keeps its two nearest lakes:
+#   label_1, distance_1 (m), label_2, distance_2 (m)   (label = polygon index in cursor order, -1 = none in the band)
+# computed with a jump-flooding pass over the nearest lake cells. The grid is stored as tiles (tile_size cells
+# square, compressed) and only the tiles that hold dams are built, so a continental run stays small.
+# Each dam then reads its cell; the Step5 rules (dam_pairing.py) are decided from the two labels when they are
+# unambiguous, and the remaining dams (a second lake close enough to compete, or a distance within the error
+# margin of a radius edge) are checked exactly with a geodesic near table.
+# Error margin: the cell distance is within ~1 cell diagonal of the true distance (the dam and the lake boundary
+# are each within half a diagonal of their cell centres); margin_cells diagonals are used to be safe.
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import collections, io
+import numpy as np
+import dam_pairing, geometry_arrays, packed_rtree, rasterize
+
+NO_LAKE = dam_pairing.NO_LAKE
+METERS_PER_DEGREE = np.radians(geometry_arrays.EARTH_RADIUS)
+
+
+def cell_index(lons, lats, resolution):
+    # Global (row, column) of lon/lat (row 0 starts at 90N, column 0 at 180W).
+    return (np.floor((90.0 - np.asarray(lats, dtype=np.float64))/resolution).astype(np.int64),
+            np.floor((np.asarray(lons, dtype=np.float64) + 180.0)/resolution).astype(np.int64))
+
+
+def cell_diagonal(lats, resolution):
+    # Diagonal (m) of a cell at these latitudes.
+    cos_lat = np.cos(np.radians(np.asarray(lats, dtype=np.float64)))
+    return resolution*METERS_PER_DEGREE*np.sqrt(1 + cos_lat**2)
+
+
+def _shifted(a, dr, dc, fill):
+    # b[r, c] = a[r + dr, c + dc] (fill outside).
+    b = np.full_like(a, fill)
+    nrows, ncols = a.shape
+    b[max(0, -dr):nrows - max(0, dr), max(0, -dc):ncols - max(0, dc)] = \
+        a[max(0, dr):nrows + min(0, dr), max(0, dc):ncols + min(0, dc)]
+    return b
+
+
+def _merge(state, label, source_row, source_col, distance):
+    # Merge one candidate (per cell) into the two nearest distinct labels.
+    l1, r1, c1, d1, l2, r2, c2, d2 = state
+    valid = label != NO_LAKE
+    same_1 = valid & (label == l1)
+    better_1 = same_1 & (distance < d1)
+    new_1 = valid & ~same_1 & (distance < d1)
+    better_2 = valid & ~same_1 & ~new_1 & (distance < d2)
+    # A new nearest label pushes the old nearest one to second place
+    demote = new_1
+    l2 = np.where(demote, l1, np.where(better_2, label, l2))
+    r2 = np.where(demote, r1, np.where(better_2, source_row, r2))
+    c2 = np.where(demote, c1, np.where(better_2, source_col, c2))
+    d2 = np.where(demote, d1, np.where(better_2, distance, d2))
+    update_1 = better_1 | new_1
+    l1 = np.where(update_1, label, l1)
+    r1 = np.where(update_1, source_row, r1)
+    c1 = np.where(update_1, source_col, c1)
+    d1 = np.where(update_1, distance, d1)
+    return [l1, r1, c1, d1, l2, r2, c2, d2]
+
+
+def nearest_two(labels, row_scale, col_scale, max_step):
+    # Two nearest distinct labels (and distances in m) for every cell of a labelled window (jump flooding).
+    # row_scale: m per row; col_scale: (nrows,) m per column at each row; max_step: band width in cells.
+    nrows, ncols = labels.shape
+    labels = labels.astype(np.int32)
+    rows, cols = np.indices((nrows, ncols), dtype=np.int32)
+    lake = labels != NO_LAKE
+    state = [labels, np.where(lake, rows, 0), np.where(lake, cols, 0), np.where(lake, 0, np.inf).astype(np.float32),
+             np.full_like(labels, NO_LAKE), np.zeros_like(rows), np.zeros_like(cols), np.full((nrows, ncols), np.inf, dtype=np.float32)]
+    row_scale = np.float32(row_scale)
+    col_scale = np.asarray(col_scale, dtype=np.float32)[:, None]
+    step = 1
+    while step*2 <= max_step:
+        step *= 2
+    steps = []
+    while step >= 1:
+        steps.append(step)
+        step //= 2
+    for step in steps + [1]:
+        for dr in (-step, 0, step):
+            for dc in (-step, 0, step):
+                if dr == 0 and dc == 0:
+                    continue
+                for k in (0, 4): # the neighbour's first and second label
+                    label = _shifted(state[k], dr, dc, NO_LAKE)
+                    source_row = _shifted(state[k + 1], dr, dc, 0)
+                    source_col = _shifted(state[k + 2], dr, dc, 0)
+                    distance = np.hypot((rows - source_row)*row_scale, (cols - source_col)*col_scale)
+                    state = _merge(state, label, source_row, source_col, distance)
+    return state[0], state[3], state[4], state[7]
+
+
+class LakeIDGrid(object):
+    # Tiled two-nearest-lake grid. tiles: {(tile row, tile column): compressed .npz bytes}.
+    def __init__(self, resolution, band, tile_size, tiles=None):
+        self.resolution = resolution
+        self.band = band
+        self.tile_size = tile_size
+        self.tiles = {} if tiles is None else tiles
+        self._decoded = collections.OrderedDict() # small LRU of decompressed tiles
+        self.max_decoded = 16
+
+    @classmethod
+    def build(cls, flat, band, resolution=1.0/3600, tile_size=512, points=None):
+        # Grid of the polygons in flat (labels = geometry index). points: optional (lons, lats); if given,
+        # only the tiles holding these points are built.
+        grid = cls(resolution, band, tile_size)
+        bounds = geometry_arrays.geometry_bounds(flat)
+        tree = packed_rtree.PackedRTree.build(bounds)
+        if points is None:
+            valid = ~np.isnan(bounds[:, 0])
+            top, left = cell_index(bounds[valid, 0], bounds[valid, 3], resolution)
+            bottom, right = cell_index(bounds[valid, 2], bounds[valid, 1], resolution)
+            keys = set()
+            for r0, c0, r1, c1 in zip(top//tile_size, left//tile_size, bottom//tile_size, right//tile_size):
+                keys.update((r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1))
+        else:
+            rows, cols = cell_index(points[0], points[1], resolution)
+            keys = set(zip((rows//tile_size).tolist(), (cols//tile_size).tolist()))
+        for key in sorted(keys):
+            grid._build_tile(key, flat, tree)
+        return grid
+
+    def _build_tile(self, key, flat, tree):
+        resolution = self.resolution
+        tile_size = self.tile_size
+        lat_north = 90.0 - key[0]*tile_size*resolution
+        lat_south = lat_north - tile_size*resolution
+        cos_min = max(np.cos(np.radians(min(max(abs(lat_north), abs(lat_south)), 89.0))), 0.01)
+        margin_rows = int(np.ceil(self.band/(resolution*METERS_PER_DEGREE))) + 1
+        margin_cols = int(np.ceil(self.band/(resolution*METERS_PER_DEGREE*cos_min))) + 1
+        lon0 = -180.0 + (key[1]*tile_size - margin_cols)*resolution
+        lat0 = lat_north + margin_rows*resolution
+        nrows = tile_size + 2*margin_rows
+        ncols = tile_size + 2*margin_cols
+        window = [lon0, lat0 - nrows*resolution, lon0 + ncols*resolution, lat0]
+        found = tree.query(window)
+        labels = np.full((nrows, ncols), NO_LAKE, dtype=np.int64)
+        if len(found) > 0:
+            tile_flat = geometry_arrays.subset(flat, found)
+            labels = rasterize.rasterize_polygons(tile_flat, lon0, lat0, resolution, nrows, ncols, found)
+            rasterize.burn_boundaries(labels, tile_flat, lon0, lat0, resolution, found)
+        row_lats = lat0 - (np.arange(nrows) + 0.5)*resolution
+        row_scale = resolution*METERS_PER_DEGREE
+        col_scale = row_scale*np.cos(np.radians(row_lats))
+        max_step = max(margin_rows, margin_cols)
+        l1, d1, l2, d2 = nearest_two(labels, row_scale, col_scale, max_step)
+        core = (slice(margin_rows, margin_rows + tile_size), slice(margin_cols, margin_cols + tile_size))
+        d1 = np.where(d1 <= self.band, d1, np.inf)[core]
+        d2 = np.where(d2 <= self.band, d2, np.inf)[core]
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, label_1=np.where(np.isinf(d1), NO_LAKE, l1[core]).astype(np.int32),
+                            distance_1=d1.astype(np.float32),
+                            label_2=np.where(np.isinf(d2), NO_LAKE, l2[core]).astype(np.int32),
+                            distance_2=d2.astype(np.float32))
+        self.tiles[key] = buffer.getvalue()
+
+    def _tile(self, key):
+        if key in self._decoded:
+            self._decoded.move_to_end(key)
+            return self._decoded[key]
+        data = np.load(io.BytesIO(self.tiles[key]))
+        tile = [data['label_1'], data['distance_1'], data['label_2'], data['distance_2']]
+        self._decoded[key] = tile
+        if len(self._decoded) > self.max_decoded:
+            self._decoded.popitem(last=False)
+        return tile
+
+    def lookup(self, lons, lats):
+        # (label_1, distance_1, label_2, distance_2) at the cells of the points (NO_LAKE/inf outside built tiles).
+        rows, cols = cell_index(lons, lats, self.resolution)
+        n = len(rows)
+        l1 = np.full(n, NO_LAKE, dtype=np.int64)
+        d1 = np.full(n, np.inf)
+        l2 = np.full(n, NO_LAKE, dtype=np.int64)
+        d2 = np.full(n, np.inf)
+        tile_rows = rows//self.tile_size
+        tile_cols = cols//self.tile_size
+        for key in sorted(set(zip(tile_rows.tolist(), tile_cols.tolist()))):
+            if key not in self.tiles:
+                continue
+            here = np.nonzero((tile_rows == key[0]) & (tile_cols == key[1]))[0]
+            tile = self._tile(key)
+            r = rows[here] - key[0]*self.tile_size
+            c = cols[here] - key[1]*self.tile_size
+            l1[here], d1[here], l2[here], d2[here] = tile[0][r, c], tile[1][r, c], tile[2][r, c], tile[3][r, c]
+        return l1, d1, l2, d2
+
+    def save(self, path):
+        # One .npz: tile keys, byte offsets and the concatenated compressed tiles.
+        keys = sorted(self.tiles)
+        sizes = [len(self.tiles[k]) for k in keys]
+        np.savez(path, resolution=np.array([self.resolution]), band=np.array([self.band]),
+                 tile_size=np.array([self.tile_size]), keys=np.array(keys, dtype=np.int64).reshape(-1, 2),
+                 offsets=geometry_arrays._offsets(sizes),
+                 tiles=np.frombuffer(b''.join([self.tiles[k] for k in keys]), dtype=np.uint8))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        offsets = data['offsets']
+        all_tiles = data['tiles'].tobytes()
+        tiles = dict((tuple(k), all_tiles[offsets[i]:offsets[i + 1]]) for i, k in enumerate(data['keys'].tolist()))
+        return cls(float(data['resolution'][0]), float(data['band'][0]), int(data['tile_size'][0]), tiles)
+
+
+def classify(lookup, lats, dam_sources, search_step, max_search_distance, max_search_distance_large,
+             resolution, margin_cells=2.0):
+    # Step5 pairing decided from the grid: (dam_lake (NO_LAKE if unpaired), ambiguous mask).
+    # GeoDARv11 dams are not decided here (their polygon is matched by ID) and are never ambiguous.
+    l1, d1, l2, d2 = lookup
+    dam_sources = np.asarray(dam_sources, dtype=object)
+    margin = margin_cells*cell_diagonal(lats, resolution)
+    is_snapped = dam_sources == 'GOODDsnp'
+    # Largest radius of the stepped search (the search stops after max_search_distance)
+    stepped_limit = np.floor(max_search_distance/search_step + 1e-9)*search_step
+    limit = np.where(is_snapped, max_search_distance_large, stepped_limit)
+    # Largest radius the search can stop at, given the uncertainty of distance_1
+    first_radius = np.maximum(1, np.ceil((d1 + margin)/search_step))*search_step
+    radius = np.where(is_snapped, max_search_distance_large, np.minimum(first_radius, stepped_limit))
+    paired = d1 < limit - margin
+    unpaired = d1 > limit + margin
+    alone = d2 > radius + margin # no competing lake within the search radius
+    dam_lake = np.where(paired & alone, l1, NO_LAKE)
+    ambiguous = ~unpaired & ~(paired & alone)
+    is_GeoDAR = dam_sources == 'GeoDARv11'
+    dam_lake[is_GeoDAR] = NO_LAKE
+    ambiguous[is_GeoDAR] = False
+    return dam_lake, ambiguous
+
+
+def pair_feature_classes(dams, water_polygons, search_step, max_search_distance, max_search_distance_large,
+                         lake_area_by_OID=None, resolution=1.0/3600, tile_size=512, margin_cells=2.0,
+                         near_table="memory\\grid_near_table"):
+    # Step5 pairing with the lake-ID grid; ambiguous dams are paired exactly (geodesic near table + dam_pairing).
+    # Returns {dam_OIDs, dam_UIDs, dam_sources, lake_UIDs, dam_lake, ambiguous_count}; dam_lake indexes lake_UIDs.
+    import arcpy
+    dam_OIDs = []
+    dam_UIDs = []
+    dam_sources = []
+    dam_xy = []
+    with arcpy.da.SearchCursor(dams, ['OID@', 'dam_UID', 'dam_source', 'SHAPE@XY'],
+                               spatial_reference=geometry_arrays.wgs84()) as cursor:
+        for this_OID, this_dam_UID, this_dam_source, this_xy in cursor:
+            dam_OIDs.append(this_OID)
+            dam_UIDs.append(this_dam_UID)
+            dam_sources.append(this_dam_source)
+            dam_xy.append(this_xy)
+    dam_xy = np.array(dam_xy, dtype=np.float64).reshape(-1, 2)
+    flat, values = geometry_arrays.read_flat_geometry(water_polygons, ['OID@', 'lake_UID_QC', 'GeoDARv11_ID_QC', 'Shape_Area'])
+    lake_OIDs = values['OID@']
+    if lake_area_by_OID is None:
+        lake_area = np.array(values['Shape_Area'], dtype=np.float64)
+    else:
+        lake_area = np.array([lake_area_by_OID[x] for x in lake_OIDs], dtype=np.float64)
+    lake_by_GeoDAR_ID = dict((x, i) for i, x in enumerate(values['GeoDARv11_ID_QC']) if x is not None)
+    GeoDAR_lake = np.array([lake_by_GeoDAR_ID.get(x, NO_LAKE) for x in dam_UIDs], dtype=np.int64)
+
+    # Grid lookup for the proximity-based dams
+    band = max(max_search_distance, max_search_distance_large) + margin_cells*cell_diagonal(0.0, resolution)
+    searched = np.array([x != 'GeoDARv11' for x in dam_sources], dtype=bool)
+    grid = LakeIDGrid.build(flat, band, resolution, tile_size, (dam_xy[searched, 0], dam_xy[searched, 1]))
+    lookup = grid.lookup(dam_xy[:, 0], dam_xy[:, 1])
+    dam_lake, ambiguous = classify(lookup, dam_xy[:, 1], dam_sources, search_step, max_search_distance,
+                                   max_search_distance_large, resolution, margin_cells)
+    dam_lake[~searched] = GeoDAR_lake[~searched]
+
+    # Exact pairing of the ambiguous dams
+    ambiguous_index = np.nonzero(ambiguous)[0]
+    if len(ambiguous_index) > 0:
+        dam_OID_field = arcpy.Describe(dams).OIDFieldName
+        SQL_dams = "{0} IN ({1})".format(arcpy.AddFieldDelimiters(dams, dam_OID_field),
+                                         ','.join([str(dam_OIDs[i]) for i in ambiguous_index]))
+        arcpy.MakeFeatureLayer_management(dams, "grid_ambiguous_dams_lyr", SQL_dams)
+        arcpy.GenerateNearTable_analysis("grid_ambiguous_dams_lyr", water_polygons, near_table,
+                                         str(max(max_search_distance, max_search_distance_large)) + " Meters",
+                                         "NO_LOCATION", "NO_ANGLE", "ALL", 0, "GEODESIC")
+        dam_index_by_OID = dict((dam_OIDs[i], i) for i in ambiguous_index)
+        lake_index_by_OID = dict((x, i) for i, x in enumerate(lake_OIDs))
+        cand_dam = []
+        cand_lake = []
+        cand_distance = []
+        with arcpy.da.SearchCursor(near_table, ['IN_FID', 'NEAR_FID', 'NEAR_DIST']) as cursor:
+            for in_FID, near_FID, near_dist in cursor:
+                cand_dam.append(dam_index_by_OID[in_FID])
+                cand_lake.append(lake_index_by_OID[near_FID])
+                cand_distance.append(near_dist)
+        arcpy.Delete_management(near_table)
+        arcpy.Delete_management("grid_ambiguous_dams_lyr")
+        exact_dam_lake = dam_pairing.pair_dams(dam_sources, GeoDAR_lake, cand_dam, cand_lake, cand_distance, lake_area,
+                                               search_step, max_search_distance, max_search_distance_large)
+        dam_lake[ambiguous_index] = exact_dam_lake[ambiguous_index]
+    return {'dam_OIDs': dam_OIDs, 'dam_UIDs': dam_UIDs, 'dam_sources': dam_sources, 'lake_UIDs': values['lake_UID_QC'],
+            'dam_lake': dam_lake, 'ambiguous_count': len(ambiguous_index)}
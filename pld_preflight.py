@@ -0,0 +1,263 @@
+# [Description] ------------------------------
+# Fast topology preflight for the PLD (and GeoDAR) polygons before the expensive Steps 3-5.
+# Finds, across the whole layer:
+#   duplicate_id          the same lake_UID (or GeoDARv11_ID) on more than one polygon
+#   duplicate_geometry    two polygons with identical geometry
+#   overlap               two polygons whose boundaries cross (interiors overlap)
+#   nested                one polygon lying inside another (e.g. C15_3977065 / C15_8349584 in circa-2015,
+#                         which made Intersect return three pieces instead of two in Step4)
+#                         Pairs without crossing edges but with a vertex strictly inside the other polygon are
+#                         confirmed with an exact containment test (Shapely 2 covers); the others are overlaps
+#                         whose boundaries meet only at shared vertices.
+#   ring_too_few_vertices / ring_not_closed / ring_nonfinite / ring_zero_area / ring_self_intersection
+# Candidate polygon pairs come from a packed Hilbert R-tree on the bounds; candidate edge pairs from an
+# R-tree on the edges of each chunk of pairs. Chunks run in a process pool attached to a shared-memory
+# geometry store (geometry_store.py), or in a thread pool on the same arrays (thread_pool.py).
+# Edges sharing a boundary (touching polygons) are not reported.
+# The issues are written as a compact CSV table.
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import csv, multiprocessing
+import numpy as np
+import geometry_arrays, geometry_kernels, geometry_store, geodesic_area, packed_rtree, thread_pool
+
+try:
+    import shapely
+except ImportError:
+    shapely = None
+
+ISSUE_FIELDS = ['issue', 'ID', 'other_ID', 'detail']
+SEGMENT_NODE_SIZE = 4 # R-tree fan-out for edge boxes (small boxes, many queries)
+NESTED_SAMPLE_COUNT = 16 # vertices of a polygon tested against the other polygon for nesting
+BOUNDARY_TOLERANCE = 0.01 # m; vertices closer than this to the other boundary are treated as on it (shared boundary)
+
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    return np.sign((bx - ax)*(cy - ay) - (by - ay)*(cx - ax))
+
+
+def _proper_crossings(coords, seg_1, seg_2):
+    # True where edge seg_1 (vertex seg_1 -> seg_1 + 1) properly crosses edge seg_2 (touching/collinear is not crossing).
+    a1 = coords[seg_1]
+    a2 = coords[seg_1 + 1]
+    b1 = coords[seg_2]
+    b2 = coords[seg_2 + 1]
+    o1 = _orientation(a1[:, 0], a1[:, 1], a2[:, 0], a2[:, 1], b1[:, 0], b1[:, 1])
+    o2 = _orientation(a1[:, 0], a1[:, 1], a2[:, 0], a2[:, 1], b2[:, 0], b2[:, 1])
+    o3 = _orientation(b1[:, 0], b1[:, 1], b2[:, 0], b2[:, 1], a1[:, 0], a1[:, 1])
+    o4 = _orientation(b1[:, 0], b1[:, 1], b2[:, 0], b2[:, 1], a2[:, 0], a2[:, 1])
+    return (o1*o2 < 0) & (o3*o4 < 0)
+
+
+def _segment_boxes(coords, seg_start):
+    p1 = coords[seg_start]
+    p2 = coords[seg_start + 1]
+    return np.column_stack([np.minimum(p1[:, 0], p2[:, 0]), np.minimum(p1[:, 1], p2[:, 1]),
+                            np.maximum(p1[:, 0], p2[:, 0]), np.maximum(p1[:, 1], p2[:, 1])])
+
+
+def check_rings(flat):
+    # Ring-level issues: list of (geometry index, issue, detail).
+    issues = []
+    ring_sizes = np.diff(flat.ring_offsets)
+    ring_geom = geometry_arrays.ring_geometry_index(flat)
+    n_ring = len(ring_sizes)
+    if n_ring == 0:
+        return issues
+    first = flat.coords[flat.ring_offsets[:-1][ring_sizes > 0]]
+    last = flat.coords[flat.ring_offsets[1:][ring_sizes > 0] - 1]
+    not_closed = np.zeros(n_ring, dtype=bool)
+    not_closed[ring_sizes > 0] = np.any(first != last, axis=1)
+    ring_id = np.repeat(np.arange(n_ring), ring_sizes)
+    nonfinite = np.zeros(n_ring, dtype=bool)
+    nonfinite[ring_id[~np.all(np.isfinite(flat.coords), axis=1)]] = True
+    zero_area = geodesic_area.ring_areas(flat) <= 0
+    for name, mask in [('ring_too_few_vertices', ring_sizes < 4), ('ring_not_closed', not_closed),
+                       ('ring_nonfinite', nonfinite), ('ring_zero_area', zero_area & (ring_sizes >= 4))]:
+        for ring_i in np.nonzero(mask)[0]:
+            issues.append((int(ring_geom[ring_i]), name, 'ring ' + str(int(ring_i - flat.part_offsets[flat.geom_offsets[ring_geom[ring_i]]]))))
+    return issues
+
+
+def check_self_intersections(flat, geom_indices):
+    # Rings of the given geometries whose edges cross each other: list of (geometry index, issue, detail).
+    geom_indices = np.asarray(geom_indices, dtype=np.int64)
+    seg_pair, seg_start = geometry_arrays.pair_segments(flat, geom_indices)
+    if len(seg_start) == 0:
+        return []
+    ring_id = np.repeat(np.arange(len(flat.ring_offsets) - 1), np.diff(flat.ring_offsets))
+    boxes = _segment_boxes(flat.coords, seg_start)
+    position_1, position_2 = packed_rtree.PackedRTree.build(boxes, SEGMENT_NODE_SIZE).query_bulk(boxes)
+    keep = (position_1 < position_2) & (seg_pair[position_1] == seg_pair[position_2])
+    position_1 = position_1[keep]
+    position_2 = position_2[keep]
+    seg_1 = seg_start[position_1]
+    seg_2 = seg_start[position_2]
+    # Edges of the same ring that do not share a vertex (consecutive edges and the closing edge do)
+    ring_start = flat.ring_offsets[ring_id[seg_1]]
+    ring_last_edge = flat.ring_offsets[ring_id[seg_1] + 1] - 2
+    keep = ((ring_id[seg_1] == ring_id[seg_2]) & (np.abs(seg_2 - seg_1) > 1) &
+            ~((np.minimum(seg_1, seg_2) == ring_start) & (np.maximum(seg_1, seg_2) == ring_last_edge)))
+    crossing = _proper_crossings(flat.coords, seg_1[keep], seg_2[keep])
+    issues = []
+    for pair_i in np.unique(seg_pair[position_1[keep][crossing]]):
+        issues.append((int(geom_indices[pair_i]), 'ring_self_intersection', ''))
+    return issues
+
+
+def check_pairs(flat, pair_a, pair_b):
+    # Classify candidate polygon pairs: list of (index a, index b, issue) for overlap / nested pairs.
+    # The chunks run on a pool, so the single-threaded distance kernel is used: numba's parallel kernel may not be
+    # entered from several threads, and a process that has run it hangs when it later forks a pool.
+    pair_a = np.asarray(pair_a, dtype=np.int64)
+    pair_b = np.asarray(pair_b, dtype=np.int64)
+    issues = []
+    if len(pair_a) == 0:
+        return issues
+    # Edge crossings between the two polygons of each pair
+    seg_pair_a, seg_a = geometry_arrays.pair_segments(flat, pair_a)
+    seg_pair_b, seg_b = geometry_arrays.pair_segments(flat, pair_b)
+    crossing_pairs = np.zeros(len(pair_a), dtype=bool)
+    if len(seg_a) > 0 and len(seg_b) > 0:
+        tree = packed_rtree.PackedRTree.build(_segment_boxes(flat.coords, seg_b), SEGMENT_NODE_SIZE)
+        query_i, tree_i = tree.query_bulk(_segment_boxes(flat.coords, seg_a))
+        same_pair = seg_pair_a[query_i] == seg_pair_b[tree_i]
+        query_i = query_i[same_pair]
+        tree_i = tree_i[same_pair]
+        crossing = _proper_crossings(flat.coords, seg_a[query_i], seg_b[tree_i])
+        crossing_pairs[seg_pair_a[query_i][crossing]] = True
+    for pair_i in np.nonzero(crossing_pairs)[0]:
+        issues.append((int(pair_a[pair_i]), int(pair_b[pair_i]), 'overlap'))
+    # Without crossings, a polygon with some vertex strictly inside the other polygon is nested if the other one
+    # covers it; otherwise their boundaries cross at shared vertices only, which is an overlap
+    remaining = np.nonzero(~crossing_pairs)[0]
+    for inner, outer in [(pair_a, pair_b), (pair_b, pair_a)]:
+        sample_point, sample_x, sample_y = _sample_vertices(flat, inner[remaining])
+        if len(sample_point) == 0:
+            continue
+        distance, inside = geometry_kernels.point_polygon_distance(sample_x, sample_y, np.arange(len(sample_point)),
+                                                                    outer[remaining][sample_point], flat, boundary=True,
+                                                                    parallel=False)
+        strictly_inside = np.zeros(len(remaining), dtype=bool)
+        strictly_inside[sample_point[inside & (distance > BOUNDARY_TOLERANCE)]] = True
+        candidates = remaining[strictly_inside]
+        if len(candidates) > 0:
+            for pair_i, covered in zip(candidates, _covers(flat, outer[candidates], inner[candidates])):
+                if covered:
+                    issues.append((int(inner[pair_i]), int(outer[pair_i]), 'nested'))
+                else:
+                    issues.append((int(pair_a[pair_i]), int(pair_b[pair_i]), 'overlap'))
+        remaining = remaining[~strictly_inside]
+    return issues
+
+
+def _covers(flat, outer, inner):
+    # Exact containment: True where polygon outer[k] covers polygon inner[k] (boundaries may touch).
+    thread_pool._require_shapely()
+    geometries = thread_pool.to_shapely(geometry_arrays.subset(flat, np.concatenate([outer, inner])))
+    return shapely.covers(geometries[:len(outer)], geometries[len(outer):])
+
+
+def _sample_vertices(flat, geom_indices):
+    # Up to NESTED_SAMPLE_COUNT evenly spaced vertices of each geometry: (position in geom_indices, x, y).
+    vertex_offsets = flat.ring_offsets[geometry_arrays.geometry_ring_offsets(flat)]
+    starts = vertex_offsets[geom_indices]
+    sizes = vertex_offsets[geom_indices + 1] - starts
+    counts = np.minimum(sizes, NESTED_SAMPLE_COUNT)
+    owner = np.repeat(np.arange(len(geom_indices)), counts)
+    rank = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    vertex = starts[owner] + rank*sizes[owner]//np.maximum(counts[owner], 1)
+    return owner, flat.coords[vertex, 0], flat.coords[vertex, 1]
+
+
+def candidate_pairs(flat):
+    # Polygon pairs (a < b) with intersecting bounds.
+    bounds = geometry_arrays.geometry_bounds(flat)
+    tree = packed_rtree.PackedRTree.build(bounds)
+    pair_a, pair_b = tree.query_bulk(bounds)
+    keep = pair_a < pair_b
+    return pair_a[keep], pair_b[keep]
+
+
+def _check_task(flat, task):
+    if task[0] == 'pairs':
+        return check_pairs(flat, task[1], task[2])
+    return check_self_intersections(flat, task[1])
+
+
+def _worker_chunk(task):
+    # Runs in a pool worker attached to the shared geometry store.
+    return _check_task(geometry_store.attached_store().flat(), task)
+
+
+def run_checks(flat, ids, processes=None, chunk_size=20000, execution='processes'):
+    # All checks over one layer; returns a list of issue dicts (see ISSUE_FIELDS).
+    # execution: 'processes' (pool attached to a shared geometry store) or 'threads' (thread_pool.py, same arrays).
+    # The process pool is spawned, so the calling script needs an if __name__ == "__main__" guard (see Step0).
+    ids = list(ids)
+    issues = []
+    first_index = {}
+    for i, this_ID in enumerate(ids):
+        if this_ID in first_index:
+            issues.append({'issue': 'duplicate_id', 'ID': this_ID, 'other_ID': this_ID,
+                           'detail': 'polygons ' + str(first_index[this_ID]) + ' and ' + str(i)})
+        else:
+            first_index[this_ID] = i
+    for geom_i, issue, detail in check_rings(flat):
+        issues.append({'issue': issue, 'ID': ids[geom_i], 'other_ID': '', 'detail': detail})
+
+    pair_a, pair_b = candidate_pairs(flat)
+    hashes = geometry_arrays.geometry_hashes(flat)
+    same_geometry = hashes[pair_a] == hashes[pair_b]
+    for a, b in zip(pair_a[same_geometry], pair_b[same_geometry]):
+        issues.append({'issue': 'duplicate_geometry', 'ID': ids[a], 'other_ID': ids[b], 'detail': ''})
+    pair_a = pair_a[~same_geometry]
+    pair_b = pair_b[~same_geometry]
+
+    tasks = [('pairs', pair_a[i:i + chunk_size], pair_b[i:i + chunk_size]) for i in range(0, len(pair_a), chunk_size)]
+    all_geoms = np.arange(geometry_arrays.geometry_count(flat))
+    tasks += [('rings', all_geoms[i:i + chunk_size], None) for i in range(0, len(all_geoms), chunk_size)]
+    if processes == 1:
+        results = [_check_task(flat, t) for t in tasks]
+    elif execution == 'threads':
+        results = thread_pool.map_items(lambda t: _check_task(flat, t), tasks, processes)
+    else:
+        store = geometry_store.create(flat, ids, shared_memory=True)
+        try:
+            # spawn, not fork: a parent that already ran a parallel Numba kernel (threading layer started) hangs at
+            # exit after forking
+            with multiprocessing.get_context('spawn').Pool(processes, initializer=geometry_store.worker_initializer,
+                                                           initargs=(store.name, None)) as pool:
+                results = pool.map(_worker_chunk, tasks)
+        finally:
+            store.close()
+            store.unlink()
+    for task, result in zip(tasks, results):
+        for issue in result:
+            if task[0] == 'pairs':
+                issues.append({'issue': issue[2], 'ID': ids[issue[0]], 'other_ID': ids[issue[1]], 'detail': ''})
+            else:
+                issues.append({'issue': issue[1], 'ID': ids[issue[0]], 'other_ID': '', 'detail': issue[2]})
+    return issues
+
+
+def check_feature_class(feature_class, id_field, processes=None, where=None, execution='processes'):
+    flat, values = geometry_arrays.read_flat_geometry(feature_class, [id_field], where=where)
+    return run_checks(flat, values[id_field], processes, execution=execution)
+
+
+def write_issues(path, issues_by_layer):
+    # One CSV table for all checked layers: {layer name: issues}.
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['layer'] + ISSUE_FIELDS)
+        for layer_name, issues in issues_by_layer.items():
+            for issue in issues:
+                writer.writerow([layer_name] + [issue[k] for k in ISSUE_FIELDS])
@@ -0,0 +1,131 @@
+# [Description] ------------------------------
+# Background prefetching for the read -> compute loops of the steps.
+# A background thread loads (reads/decodes) the next layer or chunk into a bounded queue while the
+# current one is processed, so disk and CPU work at the same time instead of taking turns.
+# The queue size (prefetch_depth) gives backpressure: the reader never runs more than prefetch_depth
+# items ahead of the consumer. prefetch_depth = 0 loads synchronously (no thread), e.g. for debugging.
+
+# Usage:
+#   for layer, data in PrefetchReader(layers, load_function, prefetch_depth=2):
+#       ... process data while the next layers are being loaded ...
+#   for rows in prefetch_chunks(feature_class, fields, chunk_size=100000): ...
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import queue, sys, threading
+
+_END = object() # marks the end of the items
+
+
+class PrefetchReader(object):
+    # Iterates (item, load(item)) in the order of items, loading up to prefetch_depth items ahead.
+    # If load is None, items is an iterator that does the loading itself (e.g. a chunk generator),
+    # and its values are yielded as they are.
+    # Exceptions raised while loading are re-raised in the consuming thread.
+    def __init__(self, items, load=None, prefetch_depth=2):
+        self.items = items
+        self.load = load
+        self.prefetch_depth = prefetch_depth
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _produce(self, item):
+        if self.load is None:
+            return item
+        return (item, self.load(item))
+
+    def _run(self):
+        try:
+            for item in self.items:
+                if not self._put((True, self._produce(item))):
+                    return
+        except BaseException:
+            self._put((False, sys.exc_info()[1]))
+            return
+        self._put((True, _END))
+
+    def _put(self, entry):
+        # Blocks while the queue is full (backpressure), but gives up when the consumer closed the reader.
+        while not self._stop.is_set():
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        if self.prefetch_depth <= 0:
+            for item in self.items:
+                yield self._produce(item)
+            return
+        self._queue = queue.Queue(maxsize=self.prefetch_depth)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='PrefetchReader')
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            while True:
+                ok, value = self._queue.get()
+                if not ok:
+                    raise value
+                if value is _END:
+                    break
+                yield value
+        finally:
+            self.close()
+
+    def close(self):
+        # Stop the background thread (also called when the consumer leaves the loop early).
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_rows(feature_class, fields, where=None, spatial_reference=None):
+    # All rows of the given fields as a list of tuples (one bulk pass of arcpy.da.SearchCursor).
+    import arcpy
+    with arcpy.da.SearchCursor(feature_class, fields, where_clause=where,
+                               spatial_reference=spatial_reference) as cursor:
+        return [row for row in cursor]
+
+
+def iter_chunks(feature_class, fields, chunk_size=100000, where=None, spatial_reference=None):
+    # Rows of the given fields in lists of at most chunk_size tuples.
+    import arcpy
+    with arcpy.da.SearchCursor(feature_class, fields, where_clause=where,
+                               spatial_reference=spatial_reference) as cursor:
+        chunk = []
+        for row in cursor:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+
+def prefetch_chunks(feature_class, fields, chunk_size=100000, where=None, spatial_reference=None, prefetch_depth=2):
+    # iter_chunks() decoded on a background thread, prefetch_depth chunks ahead.
+    return PrefetchReader(iter_chunks(feature_class, fields, chunk_size, where, spatial_reference),
+                          prefetch_depth=prefetch_depth)
+
+
+def prefetch_layers(layers, fields, where=None, spatial_reference=None, prefetch_depth=1):
+    # (layer, list of rows) for every layer, the next layers being read while the current one is processed.
+    return PrefetchReader(layers, lambda layer: read_rows(layer, fields, where, spatial_reference),
+                          prefetch_depth=prefetch_depth)
@@ -0,0 +1,240 @@
+# [Description] ------------------------------
+# Approximate raster overlay for the Step4 area ratios (intGeoDAR_arearatio), with error bounds.
+# PLD and GeoDAR polygons are rasterized (rasterize.py) tile by tile on a global lon/lat grid; the intersected area
+# of every PLD x GeoDAR pair is estimated from the cells whose centre lies in both polygons. Only cells crossed by
+# a boundary of the pair can be misclassified, so their area bounds the error of the estimate. Original PLD areas
+# are exact (geodesic_area.py).
+# The error bound of every decided ratio is returned with the lake (0 for the exact clusters); Step4 writes it to
+# intGeoDAR_ratio_err. It is the sum of two terms, both reported in the stats:
+# - raster error: area of the cells crossed by a boundary of the pair (rasterize.edge_cells, exact supercover)
+#   over the lake area; a guaranteed bound on the error of the ellipsoidal ratio.
+# - area definition: with Shape_Area (use_geodesic_area False) Step4 divides lon/lat degree areas, not ellipsoidal
+#   areas. The ellipsoidal area of a square degree varies with latitude, so the two ratios of a cluster differ by
+#   at most shape_area_distortion over its latitudes (0 with geodesic areas). Projected gdbs need geodesic areas.
+# A GeoDAR cluster is decided from the raster only if its ratio is clearly on one side of 0.99 and its PLD
+# polygons intersect no other reservoir (so the Step4 ordering rules do not matter); every other cluster,
+# together with everything connected to it through PLD x GeoDAR candidate pairs, is intersected exactly and
+# associated with the Step4 rules (geodar_association.py), giving the same values as the exact mode.
+# Polygons of one layer are assumed not to overlap each other (see Step0_preflight_PLD_topology).
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import collections
+import numpy as np
+import geodar_association, geodesic_area, geometry_arrays, packed_rtree, rasterize, thread_pool
+
+
+def shape_area_distortion(lat_low, lat_high):
+    # Largest relative difference between a ratio of two lon/lat degree areas (Shape_Area of a geographic gdb) and
+    # the ratio of their ellipsoidal areas, for areas within lat_low..lat_high. The ellipsoidal area of a square
+    # degree is proportional to g = cos(lat)/(1 - e2*sin(lat)^2)^2, which decreases away from the equator, so the
+    # two ratios are within a factor g(nearest the equator)/g(farthest from it) of each other.
+    lat_low, lat_high = np.asarray(lat_low, dtype=np.float64), np.asarray(lat_high, dtype=np.float64)
+    nearest = np.radians(np.clip(0.0, lat_low, lat_high))
+    farthest = np.radians(np.where(np.abs(lat_low) > np.abs(lat_high), lat_low, lat_high))
+    g = lambda lat: np.cos(lat)/(1 - geodesic_area.WGS84_E2*np.sin(lat)**2)**2
+    return g(nearest)/g(farthest) - 1
+
+
+def _tile_keys(pair_bounds, resolution, tile_size):
+    # Tiles (global row, column of tile_size cells) covering the overlap box of every pair.
+    keys = set()
+    top = np.floor((90.0 - pair_bounds[:, 3])/resolution).astype(np.int64)//tile_size
+    bottom = np.floor((90.0 - pair_bounds[:, 1])/resolution).astype(np.int64)//tile_size
+    left = np.floor((pair_bounds[:, 0] + 180.0)/resolution).astype(np.int64)//tile_size
+    right = np.floor((pair_bounds[:, 2] + 180.0)/resolution).astype(np.int64)//tile_size
+    for r0, r1, c0, c1 in zip(top.tolist(), bottom.tolist(), left.tolist(), right.tolist()):
+        keys.update((r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1))
+    return sorted(keys)
+
+
+def _pair_sums(keys, weights, sums):
+    # Add weights per key (int64 pair keys) into the dict sums.
+    if len(keys) == 0:
+        return
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inverse, weights=weights)
+    for k, w in zip(unique_keys.tolist(), totals.tolist()):
+        sums[k] = sums.get(k, 0.0) + w
+
+
+def _tile_sums(key, PLD_flat, GeoDAR_flat, PLD_tree, GeoDAR_tree, n_GeoDAR, resolution, tile_size):
+    # Pair keys and areas of one tile: (inside keys, inside areas, boundary keys, boundary areas).
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
+    lon0 = -180.0 + key[1]*tile_size*resolution
+    lat0 = 90.0 - key[0]*tile_size*resolution
+    window = [lon0, lat0 - tile_size*resolution, lon0 + tile_size*resolution, lat0]
+    PLD_here = PLD_tree.query(window)
+    GeoDAR_here = GeoDAR_tree.query(window)
+    if len(PLD_here) == 0 or len(GeoDAR_here) == 0:
+        return empty + empty
+    PLD_tile = geometry_arrays.subset(PLD_flat, PLD_here)
+    GeoDAR_tile = geometry_arrays.subset(GeoDAR_flat, GeoDAR_here)
+    PLD_labels = rasterize.rasterize_polygons(PLD_tile, lon0, lat0, resolution, tile_size, tile_size, PLD_here)
+    GeoDAR_labels = rasterize.rasterize_polygons(GeoDAR_tile, lon0, lat0, resolution, tile_size, tile_size, GeoDAR_here)
+    row_area = rasterize.cell_areas(lat0, resolution, tile_size)
+    # Cells inside both polygons
+    rows, cols = np.nonzero((PLD_labels != rasterize.EMPTY) & (GeoDAR_labels != rasterize.EMPTY))
+    inside = (PLD_labels[rows, cols]*n_GeoDAR + GeoDAR_labels[rows, cols], row_area[rows])
+    # Cells crossed by a boundary of the pair: (cell, PLD, GeoDAR) from PLD edges x GeoDAR cells,
+    # GeoDAR edges x PLD cells, and PLD edges x GeoDAR edges in the same cell
+    PLD_row, PLD_col, PLD_label = rasterize.edge_cells(PLD_tile, lon0, lat0, resolution, tile_size, tile_size, PLD_here)
+    GeoDAR_row, GeoDAR_col, GeoDAR_label = rasterize.edge_cells(GeoDAR_tile, lon0, lat0, resolution, tile_size, tile_size, GeoDAR_here)
+    PLD_cell = PLD_row*tile_size + PLD_col
+    GeoDAR_cell = GeoDAR_row*tile_size + GeoDAR_col
+    other = GeoDAR_labels[PLD_row, PLD_col]
+    triples = [np.stack([PLD_cell[other != rasterize.EMPTY], PLD_label[other != rasterize.EMPTY], other[other != rasterize.EMPTY]])]
+    other = PLD_labels[GeoDAR_row, GeoDAR_col]
+    triples.append(np.stack([GeoDAR_cell[other != rasterize.EMPTY], other[other != rasterize.EMPTY], GeoDAR_label[other != rasterize.EMPTY]]))
+    order = np.argsort(GeoDAR_cell, kind='stable')
+    first = np.searchsorted(GeoDAR_cell[order], PLD_cell, 'left')
+    last = np.searchsorted(GeoDAR_cell[order], PLD_cell, 'right')
+    match = geometry_arrays._ranges(first, last - first)
+    owner = np.repeat(np.arange(len(PLD_cell)), last - first)
+    triples.append(np.stack([PLD_cell[owner], PLD_label[owner], GeoDAR_label[order][match]]))
+    triples = np.unique(np.hstack(triples), axis=1)
+    return inside + (triples[1]*n_GeoDAR + triples[2], row_area[triples[0]//tile_size])
+
+
+def overlay_pairs(PLD_flat, GeoDAR_flat, resolution=1.0/3600, tile_size=2048, workers=1):
+    # Estimated intersected area (m2) and its error bound for every PLD x GeoDAR pair with intersecting bounds.
+    # Returns (pair_PLD, pair_GeoDAR, area_estimate, area_error) as arrays.
+    # workers: threads rasterizing tiles (thread_pool.py); tile results are summed in tile order, so any worker count
+    # gives the same values.
+    PLD_bounds = geometry_arrays.geometry_bounds(PLD_flat)
+    GeoDAR_bounds = geometry_arrays.geometry_bounds(GeoDAR_flat)
+    PLD_tree = packed_rtree.PackedRTree.build(PLD_bounds)
+    GeoDAR_tree = packed_rtree.PackedRTree.build(GeoDAR_bounds)
+    pair_GeoDAR, pair_PLD = PLD_tree.query_bulk(GeoDAR_bounds)
+    n_GeoDAR = max(geometry_arrays.geometry_count(GeoDAR_flat), 1)
+    estimate = {}
+    error = {}
+    if len(pair_PLD) > 0:
+        pair_bounds = np.hstack([np.maximum(PLD_bounds[pair_PLD, :2], GeoDAR_bounds[pair_GeoDAR, :2]),
+                                 np.minimum(PLD_bounds[pair_PLD, 2:], GeoDAR_bounds[pair_GeoDAR, 2:])])
+        tile_results = thread_pool.map_items(lambda key: _tile_sums(key, PLD_flat, GeoDAR_flat, PLD_tree, GeoDAR_tree, n_GeoDAR,
+                                                                    resolution, tile_size),
+                                             _tile_keys(pair_bounds, resolution, tile_size), workers)
+        for inside_keys, inside_areas, boundary_keys, boundary_areas in tile_results:
+            _pair_sums(inside_keys, inside_areas, estimate)
+            _pair_sums(boundary_keys, boundary_areas, error)
+    keys = np.array(sorted(set(estimate) | set(error)), dtype=np.int64)
+    return (keys//n_GeoDAR, keys % n_GeoDAR, np.array([estimate.get(k, 0.0) for k in keys.tolist()]),
+            np.array([error.get(k, 0.0) for k in keys.tolist()]))
+
+
+def _components(pair_PLD, pair_GeoDAR, n_PLD):
+    # Connected component id of every PLD polygon and GeoDAR polygon (GeoDAR nodes offset by n_PLD).
+    parent = np.arange(n_PLD + (int(pair_GeoDAR.max()) + 1 if len(pair_GeoDAR) > 0 else 0))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for p, g in zip(pair_PLD.tolist(), (pair_GeoDAR + n_PLD).tolist()):
+        root_p, root_g = find(p), find(g)
+        if root_p != root_g:
+            parent[root_p] = root_g
+    return np.array([find(x) for x in range(len(parent))])
+
+
+def decide_clusters(pair_PLD, pair_GeoDAR, area_estimate, area_error, PLD_area, n_PLD, PLD_lat_range=None):
+    # Clusters decided from the raster and the polygons that need the exact overlay. PLD_lat_range: (lowest,
+    # highest latitude) of every PLD polygon when the exact ratios use Shape_Area (None with geodesic areas).
+    # Returns (clusters: {GeoDAR index: (PLD indices, ratio estimate, raster error, area definition error)},
+    # exact_PLD, exact_GeoDAR).
+    certain = area_estimate > 0 # some cell centre is inside both polygons: they intersect
+    possible = certain | (area_error > 0)
+    PLD_GeoDAR_count = np.bincount(pair_PLD[possible], minlength=n_PLD)
+    clusters = collections.OrderedDict()
+    needs_exact = set()
+    order = np.nonzero(possible)[0]
+    order = order[np.argsort(pair_GeoDAR[order], kind='stable')]
+    group_start = np.nonzero(np.r_[True, pair_GeoDAR[order][1:] != pair_GeoDAR[order][:-1]])[0]
+    for here in np.split(order, group_start[1:]) if len(order) > 0 else []:
+        g = int(pair_GeoDAR[here[0]])
+        PLD_here = pair_PLD[here]
+        if not np.all(certain[here]) or np.any(PLD_GeoDAR_count[PLD_here] > 1):
+            needs_exact.add(g) # uncertain membership, or a PLD polygon in more than one cluster
+            continue
+        lake_sum = np.sum(PLD_area[PLD_here])
+        ratio = np.sum(area_estimate[here])/lake_sum
+        raster_error = np.sum(area_error[here])/lake_sum
+        definition_error = 0.0
+        if PLD_lat_range is not None: # the intersections lie within the lakes, so the lake latitudes cover them
+            distortion = shape_area_distortion(np.min(PLD_lat_range[0][PLD_here]), np.max(PLD_lat_range[1][PLD_here]))
+            definition_error = float((ratio + raster_error)*distortion)
+        if abs(ratio - geodar_association.NO_CHECK_RATIO) <= raster_error + definition_error:
+            needs_exact.add(g)
+            continue
+        clusters[g] = (PLD_here, ratio, raster_error, definition_error)
+    # Exact overlay for the whole connected component of every undecided cluster
+    component = _components(pair_PLD[possible], pair_GeoDAR[possible], n_PLD)
+    exact_components = set(component[n_PLD + g] for g in needs_exact)
+    exact_PLD = [p for p in range(n_PLD) if component[p] in exact_components]
+    exact_GeoDAR = sorted([g for g in range(len(component) - n_PLD) if component[n_PLD + g] in exact_components])
+    return clusters, exact_PLD, exact_GeoDAR
+
+
+def raster_associate(PLD, GeoDAR, resolution=1.0/3600, tile_size=2048, use_geodesic_area=False, geodesic_area_cache=None,
+                     intersect_output="memory\\raster_overlay_intersect", workers=1):
+    # Step4 association with raster area ratios:
+    # ({lake_UID: [GeoDARv11_ID, intGeoDAR_count, intGeoDAR_arearatio, ratio error bound]}, stats).
+    # Lakes of raster-decided clusters intersect a single reservoir (count -1 if the ratio is > 0.99, else 1);
+    # the exact clusters are intersected with arcpy and use Shape_Area (or geodesic areas), as Step4 does.
+    import arcpy
+    area_cache = geodesic_area.GeodesicAreaCache(geodesic_area_cache)
+    PLD_flat, PLD_values = geometry_arrays.read_flat_geometry(PLD, ['OID@', 'lake_UID'])
+    GeoDAR_flat, GeoDAR_values = geometry_arrays.read_flat_geometry(GeoDAR, ['OID@', 'GeoDARv11_ID'])
+    PLD_area = geodesic_area.cached_polygon_areas(PLD_flat, area_cache)
+    n_PLD = len(PLD_area)
+    PLD_lat_range = None
+    if not use_geodesic_area:
+        if arcpy.Describe(PLD).spatialReference.type != 'Geographic':
+            raise ValueError('raster area ratios with Shape_Area need a geographic PLD gdb (or use_geodesic_area = True)')
+        PLD_bounds = geometry_arrays.geometry_bounds(PLD_flat)
+        PLD_lat_range = (PLD_bounds[:, 1], PLD_bounds[:, 3])
+    pair_PLD, pair_GeoDAR, area_estimate, area_error = overlay_pairs(PLD_flat, GeoDAR_flat, resolution, tile_size, workers)
+    clusters, exact_PLD, exact_GeoDAR = decide_clusters(pair_PLD, pair_GeoDAR, area_estimate, area_error,
+                                                        PLD_area, n_PLD, PLD_lat_range)
+    lakes = collections.OrderedDict()
+    for g, (PLD_here, ratio, raster_error, definition_error) in clusters.items():
+        for p in PLD_here.tolist():
+            lakes[PLD_values['lake_UID'][p]] = [GeoDAR_values['GeoDARv11_ID'][g], -1 if ratio > geodar_association.NO_CHECK_RATIO else 1, ratio,
+                                                raster_error + definition_error]
+
+    if len(exact_GeoDAR) > 0:
+        PLD_OID_field = arcpy.Describe(PLD).OIDFieldName
+        GeoDAR_OID_field = arcpy.Describe(GeoDAR).OIDFieldName
+        SQL_PLD = "{0} IN ({1})".format(arcpy.AddFieldDelimiters(PLD, PLD_OID_field), ','.join([str(PLD_values['OID@'][p]) for p in exact_PLD]))
+        SQL_GeoDAR = "{0} IN ({1})".format(arcpy.AddFieldDelimiters(GeoDAR, GeoDAR_OID_field), ','.join([str(GeoDAR_values['OID@'][g]) for g in exact_GeoDAR]))
+        arcpy.MakeFeatureLayer_management(PLD, "raster_overlay_PLD_lyr", SQL_PLD)
+        arcpy.MakeFeatureLayer_management(GeoDAR, "raster_overlay_GeoDAR_lyr", SQL_GeoDAR)
+        arcpy.Intersect_analysis(["raster_overlay_PLD_lyr", "raster_overlay_GeoDAR_lyr"], intersect_output)
+        if use_geodesic_area:
+            flat, values = geometry_arrays.read_flat_geometry(intersect_output, ['lake_UID', 'GeoDARv11_ID'])
+            intersected_rows = list(zip(values['lake_UID'], values['GeoDARv11_ID'],
+                                        geodesic_area.cached_polygon_areas(flat, area_cache).tolist()))
+            lake_area_by_UID = dict((PLD_values['lake_UID'][p], PLD_area[p]) for p in exact_PLD)
+        else:
+            with arcpy.da.SearchCursor(intersect_output, ['lake_UID', 'GeoDARv11_ID', 'SHAPE@AREA']) as cursor:
+                intersected_rows = [row for row in cursor]
+            with arcpy.da.SearchCursor("raster_overlay_PLD_lyr", ['lake_UID', 'SHAPE@AREA']) as cursor:
+                lake_area_by_UID = dict((row[0], row[1]) for row in cursor)
+        exact_lakes = geodar_association.associate([row[0] for row in intersected_rows], [row[1] for row in intersected_rows],
+                                                   [row[2] for row in intersected_rows], lake_area_by_UID)
+        lakes.update((k, v + [0.0]) for k, v in exact_lakes.items())
+        arcpy.Delete_management(intersect_output)
+        arcpy.Delete_management("raster_overlay_PLD_lyr")
+        arcpy.Delete_management("raster_overlay_GeoDAR_lyr")
+    area_cache.save()
+    stats = {'raster_clusters': len(clusters), 'exact_clusters': len(exact_GeoDAR), 'exact_PLD_polygons': len(exact_PLD),
+             'max_raster_error': max([x[2] for x in clusters.values()] + [0.0]),
+             'max_area_definition_error': max([x[3] for x in clusters.values()] + [0.0])}
+    return lakes, stats
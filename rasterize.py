@@ -0,0 +1,142 @@
+# [Description] ------------------------------
+# Rasterization of flat polygon arrays (see geometry_arrays.py) onto a regular lon/lat grid with numpy.
+# A window is given by its north-west corner (lon0, lat0), the cell size in degrees and its shape (rows go south).
+# A cell belongs to a polygon if its centre is inside (even-odd rule over all rings, so holes and parts are handled):
+# crossings of every edge with the cell-centre rows are sorted and paired into spans, and spans are filled per row.
+# The polygons of one call are assumed not to overlap (where they do, the span starting last in a row wins).
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import numpy as np
+import geometry_arrays, geodesic_area
+
+EMPTY = -1
+
+
+def grid_coordinates(lons, lats, lon0, lat0, resolution):
+    # Continuous (column, row) coordinates of lon/lat in the window (cell (r, c) spans [c, c+1) x [r, r+1)).
+    return (np.asarray(lons, dtype=np.float64) - lon0)/resolution, (lat0 - np.asarray(lats, dtype=np.float64))/resolution
+
+
+def _edges(flat, labels):
+    # First vertex index and label of every polygon edge (edge i joins vertex i and i+1 of one ring).
+    geom_of_ring = geometry_arrays.ring_geometry_index(flat)
+    ring_sizes = np.diff(flat.ring_offsets)
+    ring_of_vertex = np.repeat(np.arange(len(ring_sizes)), ring_sizes)
+    start = np.nonzero(ring_of_vertex[:-1] == ring_of_vertex[1:])[0]
+    return start, labels[geom_of_ring[ring_of_vertex[start]]]
+
+
+def span_cells(flat, lon0, lat0, resolution, nrows, ncols, labels=None):
+    # Filled spans of every polygon: (row, first column, end column (exclusive), label), clipped to the window.
+    if labels is None:
+        labels = np.arange(geometry_arrays.geometry_count(flat))
+    labels = np.asarray(labels, dtype=np.int64)
+    empty = np.zeros(0, dtype=np.int64)
+    start, edge_label = _edges(flat, labels)
+    if len(start) == 0:
+        return empty, empty, empty, empty
+    u, v = grid_coordinates(flat.coords[:, 0], flat.coords[:, 1], lon0, lat0, resolution)
+    u1, v1, u2, v2 = u[start], v[start], u[start + 1], v[start + 1]
+    # Rows whose centre (row + 0.5) lies in [min(v1, v2), max(v1, v2)) are crossed by the edge
+    v_low = np.minimum(v1, v2)
+    v_high = np.maximum(v1, v2)
+    first_row = np.maximum(np.ceil(v_low - 0.5), 0).astype(np.int64)
+    end_row = np.minimum(np.ceil(v_high - 0.5), nrows).astype(np.int64)
+    row_count = np.maximum(end_row - first_row, 0)
+    edge = np.repeat(np.arange(len(start)), row_count)
+    row = geometry_arrays._ranges(first_row, row_count)
+    if len(row) == 0:
+        return empty, empty, empty, empty
+    t = (row + 0.5 - v1[edge])/(v2[edge] - v1[edge])
+    u_cross = u1[edge] + t*(u2[edge] - u1[edge])
+    label = edge_label[edge]
+    order = np.lexsort((u_cross, row, label))
+    row = row[order]
+    label = label[order]
+    u_cross = u_cross[order]
+    # Crossings of one (label, row) come in pairs: [u_a, u_b) is inside
+    first_col = np.clip(np.ceil(u_cross[0::2] - 0.5), 0, ncols).astype(np.int64)
+    end_col = np.clip(np.ceil(u_cross[1::2] - 0.5), 0, ncols).astype(np.int64)
+    row = row[0::2]
+    label = label[0::2]
+    keep = end_col > first_col
+    return row[keep], first_col[keep], end_col[keep], label[keep]
+
+
+def rasterize_polygons(flat, lon0, lat0, resolution, nrows, ncols, labels=None):
+    # (nrows, ncols) int64 grid of labels (default: geometry index), EMPTY outside every polygon.
+    row, first_col, end_col, label = span_cells(flat, lon0, lat0, resolution, nrows, ncols, labels)
+    coverage = np.zeros((nrows, ncols + 1), dtype=np.int32)
+    np.add.at(coverage, (row, first_col), 1)
+    np.add.at(coverage, (row, end_col), -1)
+    covered = np.cumsum(coverage[:, :-1], axis=1) > 0
+    start_label = np.full((nrows, ncols), EMPTY, dtype=np.int64)
+    start_label[row, first_col] = label
+    # Forward fill the label of the last span start along each row
+    col_index = np.where(start_label != EMPTY, np.arange(ncols), 0)
+    np.maximum.accumulate(col_index, axis=1, out=col_index)
+    filled = np.take_along_axis(start_label, col_index, axis=1)
+    return np.where(covered, filled, EMPTY)
+
+
+def edge_cells(flat, lon0, lat0, resolution, nrows, ncols, labels=None):
+    # Distinct (row, column, label) of the window cells touched by polygon edges. Exact supercover: each edge is
+    # cut at the column lines, and every row its v range covers within a column is kept, so a cell the edge only
+    # clips at a corner is included (cells merely touched at a grid line or corner are kept too, which is harmless).
+    if labels is None:
+        labels = np.arange(geometry_arrays.geometry_count(flat))
+    labels = np.asarray(labels, dtype=np.int64)
+    empty = np.zeros(0, dtype=np.int64)
+    start, edge_label = _edges(flat, labels)
+    if len(start) == 0:
+        return empty, empty, empty
+    u, v = grid_coordinates(flat.coords[:, 0], flat.coords[:, 1], lon0, lat0, resolution)
+    u1, v1, u2, v2 = u[start], v[start], u[start + 1], v[start + 1]
+    # Only edges whose box touches the window are traversed
+    near = ((np.maximum(u1, u2) >= 0) & (np.minimum(u1, u2) <= ncols) &
+            (np.maximum(v1, v2) >= 0) & (np.minimum(v1, v2) <= nrows))
+    u1, v1, u2, v2, edge_label = u1[near], v1[near], u2[near], v2[near], edge_label[near]
+    u_low, u_high = np.minimum(u1, u2), np.maximum(u1, u2)
+    # Columns spanned by each edge (clipped to the window)
+    first_col = np.maximum(np.floor(u_low), 0).astype(np.int64)
+    last_col = np.minimum(np.floor(u_high), ncols - 1).astype(np.int64)
+    col_count = np.maximum(last_col - first_col + 1, 0)
+    edge = np.repeat(np.arange(len(u1)), col_count)
+    col = geometry_arrays._ranges(first_col, col_count)
+    # v at both ends of the piece of the edge inside each column
+    vertical = (u2 == u1)[edge]
+    slope = np.where(u2 != u1, (v2 - v1)/np.where(u2 != u1, u2 - u1, 1), 0)[edge]
+    va = np.where(vertical, np.minimum(v1, v2)[edge], v1[edge] + (np.maximum(col, u_low[edge]) - u1[edge])*slope)
+    vb = np.where(vertical, np.maximum(v1, v2)[edge], v1[edge] + (np.minimum(col + 1, u_high[edge]) - u1[edge])*slope)
+    first_row = np.maximum(np.floor(np.minimum(va, vb)), 0).astype(np.int64)
+    last_row = np.minimum(np.floor(np.maximum(va, vb)), nrows - 1).astype(np.int64)
+    row_count = np.maximum(last_row - first_row + 1, 0)
+    row = geometry_arrays._ranges(first_row, row_count)
+    col = np.repeat(col, row_count)
+    label = edge_label[np.repeat(edge, row_count)]
+    cell_label = np.unique(np.stack([row, col, label]), axis=1)
+    return cell_label[0], cell_label[1], cell_label[2]
+
+
+def burn_boundaries(grid, flat, lon0, lat0, resolution, labels=None):
+    # Also mark the cells crossed by polygon edges, so that polygons narrower than a cell still own cells.
+    # Marks only EMPTY cells; modifies grid in place.
+    row, col, label = edge_cells(flat, lon0, lat0, resolution, grid.shape[0], grid.shape[1], labels)
+    empty = grid[row, col] == EMPTY
+    grid[row[empty], col[empty]] = label[empty]
+    return grid
+
+
+def cell_areas(lat0, resolution, nrows):
+    # Ellipsoidal area (m2) of one cell of every row (authalic latitude, as in geodesic_area.py).
+    lat_edges = lat0 - resolution*np.arange(nrows + 1)
+    beta = geodesic_area.authalic_latitude(np.clip(lat_edges, -90, 90))
+    return geodesic_area.AUTHALIC_RADIUS_2*np.radians(resolution)*(np.sin(beta[:-1]) - np.sin(beta[1:]))
+
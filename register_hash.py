@@ -0,0 +1,102 @@
+# [Description] ------------------------------
+# Incremental rebuild of the register dam_UID and reg_string columns (Step2), for re-released registers with small
+# corrections. Every row stores a hash (reg_hash) of the source fields the Step2 script reads, together with
+# dam_source, dam_ID and the script's constants (salt); on rerun only rows whose hash changed, or that are new,
+# are recomputed and written, in one cursor pass.
+# A JSON manifest next to the data (<gdb folder>\<gdb name>.<feature class>.reg_hash.json, or <name>.reg_hash.json
+# for shapefiles) keeps {dam_UID: hash} of the last run, so that a re-imported register (without reg_hash) still
+# reports only the dams whose source values changed, and the dam_UIDs that disappeared are listed as deleted.
+# The manifest "changes" ({new, changed, deleted}) limit the downstream (Step5) refresh to those dams.
+
+# Usage (see the Step2 scripts):
+#   changes = register_hash.update_register(GIS_file, ['NameofDam', 'River'], build_reg_string, salt='India')
+#   print(changes['deleted'])
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import datetime, hashlib, json, os
+
+HASH_VERSION = 1 # change when the reg_string format of the Step2 scripts changes (rebuilds every row)
+MANIFEST_EXTENSION = '.reg_hash.json'
+
+
+def manifest_path(feature_class):
+    # Manifest file of a feature class path (gdb manifests sit beside the gdb, as the R-tree sidecars do).
+    feature_class = os.path.normpath(feature_class.replace('/', os.sep))
+    parts = feature_class.split(os.sep)
+    for i, part in enumerate(parts):
+        if part.lower().endswith('.gdb'):
+            gdb = os.sep.join(parts[:i + 1])
+            return os.path.splitext(gdb)[0] + '.' + '.'.join(parts[i + 1:]) + MANIFEST_EXTENSION
+    return os.path.splitext(feature_class)[0] + MANIFEST_EXTENSION
+
+
+def dam_UID(dam_source, dam_ID):
+    # Universal dam ID: register name (dam_source without "register_") + "_" + dam_ID.
+    return dam_source[9:] + '_' + str(int(dam_ID))
+
+
+def row_hash(values, salt=''):
+    # Hash (16 hex digits) of the row values and the salt.
+    return hashlib.sha1(repr((HASH_VERSION, salt, tuple(values))).encode('utf-8')).hexdigest()[:16]
+
+
+def read_manifest(path):
+    if path is None or not os.path.exists(path):
+        return {'rows': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(path, manifest):
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temporary, path)
+
+
+def update_register(GIS_file, source_fields, build_reg_string, salt='', hash_field='reg_hash', manifest=None,
+                    incremental=True):
+    # Write dam_UID, reg_string (build_reg_string({field: value}, dam_UID)) and hash_field of the rows whose hash
+    # changed (every row if not incremental), and write the manifest (default: manifest_path(GIS_file)).
+    # Returns {'written': rows written, 'new': [...], 'changed': [...], 'deleted': [...]} (dam_UIDs).
+    import arcpy
+    manifest = manifest or manifest_path(arcpy.Describe(GIS_file).catalogPath)
+    previous = read_manifest(manifest)['rows']
+    if hash_field not in [f.name for f in arcpy.ListFields(GIS_file)]:
+        arcpy.AddField_management(GIS_file, hash_field, "TEXT", field_length=16)
+
+    fields = ['dam_source', 'dam_ID'] + list(source_fields)
+    current = {}
+    new = []
+    changed = []
+    written = 0
+    with arcpy.da.UpdateCursor(GIS_file, fields + ['dam_UID', 'reg_string', hash_field]) as cursor:
+        for row in cursor:
+            values = row[:len(fields)]
+            this_dam_UID = dam_UID(values[0], values[1])
+            this_hash = row_hash(values, salt)
+            current[this_dam_UID] = this_hash
+            if this_dam_UID not in previous:
+                new.append(this_dam_UID)
+            elif previous[this_dam_UID] != this_hash:
+                changed.append(this_dam_UID)
+            stored_UID, stored_string, stored_hash = row[len(fields):]
+            if incremental and stored_hash == this_hash and stored_UID == this_dam_UID and stored_string:
+                continue
+            this_reg_string = build_reg_string(dict(zip(fields, values)), this_dam_UID)
+            cursor.updateRow(list(values) + [this_dam_UID, this_reg_string, this_hash])
+            written += 1
+
+    deleted = sorted(set(previous) - set(current))
+    changes = {'written': written, 'new': new, 'changed': changed, 'deleted': deleted}
+    write_manifest(manifest, {'feature_class': GIS_file, 'updated': datetime.datetime.now().isoformat(timespec='seconds'),
+                              'hash_version': HASH_VERSION, 'salt': salt, 'rows': current,
+                              'changes': {'new': new, 'changed': changed, 'deleted': deleted}})
+    return changes
@@ -0,0 +1,261 @@
+# [Description] ------------------------------
+# Output-equivalence and speed regression harness for the step scripts and their faster engines.
+# Every stage runs a reference engine and the engines under test on a fresh copy of a frozen fixture dataset
+# (the scripts edit their inputs in place), reads the checked output fields keyed by an ID field and diffs them
+# field by field (floats within a per-field tolerance, everything else exactly):
+#   every engine is compared with the reference engine, and the reference engine with the frozen expected
+#   outputs of the fixture (written once with --freeze), so changes across releases are caught too.
+# Run times are appended to a history file (JSON lines); an engine fails when it takes longer than
+# slowdown_budget x the median of its last history_window runs (or than its budget_seconds, if set).
+
+# Configuration (JSON):
+#   {"history": "regression_history.jsonl", "slowdown_budget": 1.25, "history_window": 5,
+#    "stages": [{"name": "Step5_India",
+#                "fixture": "D:\\Fixtures\\R1_India_fixture.gdb",   # file geodatabase or folder, copied for every run
+#                "expected": "D:\\Fixtures\\Step5_India_expected.json",
+#                "script": "Step5_build_dam_reservoir_relation-India.py",
+#                "setup": {"work_dir": "{fixture}"},                 # {fixture}: path of the fresh copy
+#                "outputs": {"All_dams_India_HM": {"key": "dam_UID", "fields": ["R1_keep", "R1_lake_UID_QC"]},
+#                            "PLDv01_India_HM": {"key": "lake_UID_QC", "fields": ["R1_sel_dam_UID"]}},
+#                "tolerances": {"intGeoDAR_arearatio": 1e-6},
+#                "engine_tolerances": {"raster": {"intGeoDAR_arearatio": "intGeoDAR_ratio_err"}},
+#                "engines": {"reference": {}, "lake_grid": {"use_lake_grid": true}},
+#                "budget_seconds": {"lake_grid": 600}}]}
+#   engines: {name: [Setup] overrides} for the stage script, or {name: [{"script": ..., "setup": {...}}, ...]} to
+#   run several scripts (e.g. Steps 3, 4 and 5 against the fused pipeline). The first engine is the reference.
+#   Output feature classes are relative to the fixture copy.
+#   engine_tolerances: {engine: {field: tolerance}} replacing the stage tolerances for that engine; a tolerance can
+#   be the name of an error-bound field written by the engine (e.g. the raster area ratios of Step4), which is read
+#   with the checked fields and added, row by row, to the stage tolerance of the field.
+
+# Usage:
+#   python regression_harness.py regression_harness.json [--stage Step5_India] [--freeze] [--release v1.2]
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import argparse, collections, contextlib, datetime, json, os, shutil, subprocess, sys, tempfile, time
+import numpy as np
+import warm_worker
+
+SLOWDOWN_BUDGET = 1.25
+HISTORY_WINDOW = 5
+MAX_REPORTED_DIFFERENCES = 20
+
+
+def _substitute(value, fixture):
+    if isinstance(value, str):
+        return value.replace('{fixture}', fixture)
+    return value
+
+
+def engine_steps(stage, engine):
+    # [(script path, setup)] of one engine of a stage (scripts relative to this folder).
+    steps = stage['engines'][engine]
+    if isinstance(steps, dict):
+        setup = dict(stage.get('setup', {}))
+        setup.update(steps)
+        steps = [{'script': stage['script'], 'setup': setup}]
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return [(os.path.join(script_dir, x['script']), x.get('setup', {})) for x in steps]
+
+
+def engine_tolerances(stage, engine):
+    # {field: tolerance} of an engine: the stage tolerances updated with its engine_tolerances.
+    tolerances = dict(stage.get('tolerances', {}))
+    tolerances.update(stage.get('engine_tolerances', {}).get(engine, {}))
+    return tolerances
+
+
+def _bound_fields(spec, tolerances):
+    # Error-bound fields named by the tolerances of the checked fields (read after them, not compared).
+    return sorted(set(v for k, v in (tolerances or {}).items() if k in spec['fields'] and isinstance(v, str)))
+
+
+def read_outputs(workspace, outputs, tolerances=None):
+    # {feature class: {key: [row values, ...]}} of the checked fields and the error-bound fields of the tolerances
+    # (rows with the same key in sorted order).
+    import arcpy
+    result = {}
+    for feature_class, spec in outputs.items():
+        rows = collections.defaultdict(list)
+        fields = [spec['key']] + spec['fields'] + _bound_fields(spec, tolerances)
+        with arcpy.da.SearchCursor(os.path.join(workspace, feature_class), fields) as cursor:
+            for row in cursor:
+                rows[str(row[0])].append(list(row[1:]))
+        result[feature_class] = dict((k, sorted(v, key=repr)) for k, v in rows.items())
+    return result
+
+
+def run_engine(stage, engine, work_root):
+    # Run one engine on a fresh copy of the fixture: (outputs, seconds, log path).
+    fixture = os.path.join(work_root, engine, os.path.basename(os.path.normpath(stage['fixture'])))
+    shutil.copytree(stage['fixture'], fixture)
+    log_path = os.path.join(work_root, engine + '.log')
+    seconds = 0.0
+    with open(log_path, 'w') as log, contextlib.redirect_stdout(log):
+        for script, setup in engine_steps(stage, engine):
+            setup = dict((k, _substitute(v, fixture)) for k, v in setup.items())
+            start = time.perf_counter()
+            warm_worker.run_script(script, setup)
+            seconds += time.perf_counter() - start
+    return read_outputs(fixture, stage['outputs'], engine_tolerances(stage, engine)), seconds, log_path
+
+
+def _equal(a, b, tolerance):
+    if isinstance(a, float) and isinstance(b, float):
+        return (np.isnan(a) and np.isnan(b)) or abs(a - b) <= tolerance
+    return a == b
+
+
+def diff_outputs(expected, actual, outputs, tolerances=None, base_tolerances=None):
+    # Field-by-field differences: [{feature_class, key, field, expected, actual}] (field None: row count differs).
+    # tolerances: {field: number or error-bound field of the actual rows (added to base_tolerances[field])}.
+    tolerances = tolerances or {}
+    base_tolerances = base_tolerances or {}
+    differences = []
+    for feature_class, spec in outputs.items():
+        expected_rows = expected.get(feature_class, {})
+        actual_rows = actual.get(feature_class, {})
+        for key in sorted(set(expected_rows) | set(actual_rows)):
+            a = expected_rows.get(key, [])
+            b = actual_rows.get(key, [])
+            if len(a) != len(b):
+                differences.append({'feature_class': feature_class, 'key': key, 'field': None,
+                                    'expected': len(a), 'actual': len(b)})
+                continue
+            for row_a, row_b in zip(a, b):
+                bounds = dict(zip(_bound_fields(spec, tolerances), row_b[len(spec['fields']):]))
+                for field, value_a, value_b in zip(spec['fields'], row_a, row_b):
+                    tolerance = tolerances.get(field, 0.0)
+                    if isinstance(tolerance, str):
+                        tolerance = (bounds[tolerance] or 0.0) + base_tolerances.get(field, 0.0)
+                    if not _equal(value_a, value_b, tolerance):
+                        differences.append({'feature_class': feature_class, 'key': key, 'field': field,
+                                            'expected': value_a, 'actual': value_b})
+    return differences
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(path, records):
+    with open(path, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def time_budget(history, stage_name, engine, slowdown_budget=SLOWDOWN_BUDGET, history_window=HISTORY_WINDOW,
+                budget_seconds=None):
+    # Allowed run time (s) of an engine: slowdown_budget x median of its last history_window runs,
+    # capped by budget_seconds (None if neither is available).
+    seconds = [x['seconds'] for x in history if x['stage'] == stage_name and x['engine'] == engine][-history_window:]
+    budget = slowdown_budget*float(np.median(seconds)) if seconds else None
+    if budget_seconds is not None:
+        budget = budget_seconds if budget is None else min(budget, budget_seconds)
+    return budget
+
+
+def release_label(directory=None):
+    # git describe of the code being tested ("unknown" outside a git checkout).
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL,
+                                       cwd=directory or os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_stage(stage, history, slowdown_budget=SLOWDOWN_BUDGET, history_window=HISTORY_WINDOW, freeze=False,
+              keep_workspace=False):
+    # Run every engine of a stage; returns a report:
+    # {stage, passed, engines: {engine: {seconds, budget, slow, differences, difference_count, log}}}
+    engines = list(stage['engines'])
+    reference = engines[0]
+    work_root = tempfile.mkdtemp(prefix='regression_' + stage['name'] + '_')
+    report = {'stage': stage['name'], 'passed': True, 'engines': collections.OrderedDict()}
+    reference_outputs = None
+    for engine in engines:
+        outputs, seconds, log_path = run_engine(stage, engine, work_root)
+        if engine == reference:
+            reference_outputs = outputs
+            expected_path = stage.get('expected')
+            if freeze and expected_path:
+                with open(expected_path, 'w') as f:
+                    json.dump(outputs, f, indent=1)
+            if expected_path and os.path.exists(expected_path):
+                with open(expected_path) as f:
+                    differences = diff_outputs(json.load(f), outputs, stage['outputs'], engine_tolerances(stage, engine),
+                                               stage.get('tolerances'))
+            else:
+                differences = []
+        else:
+            differences = diff_outputs(reference_outputs, outputs, stage['outputs'], engine_tolerances(stage, engine),
+                                       stage.get('tolerances'))
+        budget = time_budget(history, stage['name'], engine, slowdown_budget, history_window,
+                             stage.get('budget_seconds', {}).get(engine))
+        slow = budget is not None and seconds > budget
+        report['engines'][engine] = {'seconds': seconds, 'budget': budget, 'slow': slow,
+                                     'difference_count': len(differences),
+                                     'differences': differences[:MAX_REPORTED_DIFFERENCES], 'log': log_path}
+        if slow or differences:
+            report['passed'] = False
+    if report['passed'] and not keep_workspace:
+        shutil.rmtree(work_root, ignore_errors=True)
+    return report
+
+
+def run(config, stage_names=None, freeze=False, release=None, keep_workspace=False):
+    # Run the configured stages, record their timings in the history file and return the stage reports.
+    history_path = config.get('history', 'regression_history.jsonl')
+    history = read_history(history_path)
+    release = release or release_label()
+    reports = []
+    for stage in config['stages']:
+        if stage_names and stage['name'] not in stage_names:
+            continue
+        report = run_stage(stage, history, config.get('slowdown_budget', SLOWDOWN_BUDGET),
+                           config.get('history_window', HISTORY_WINDOW), freeze, keep_workspace)
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        append_history(history_path, [{'time': now, 'release': release, 'stage': stage['name'], 'engine': engine,
+                                       'seconds': x['seconds'], 'slow': x['slow'], 'difference_count': x['difference_count']}
+                                      for engine, x in report['engines'].items()])
+        reports.append(report)
+    return reports
+
+
+def print_report(report):
+    print(report['stage'] + ': ' + ('passed' if report['passed'] else 'FAILED'))
+    for engine, x in report['engines'].items():
+        budget = '' if x['budget'] is None else ' (budget ' + str(round(x['budget'], 1)) + ' s)'
+        print('  ' + engine + ': ' + str(round(x['seconds'], 1)) + ' s' + budget + (' SLOW' if x['slow'] else '') +
+              ', ' + str(x['difference_count']) + ' differences')
+        for d in x['differences']:
+            print('    ' + d['feature_class'] + ' ' + d['key'] + ' ' + str(d['field']) + ': ' +
+                  repr(d['expected']) + ' -> ' + repr(d['actual']))
+        if x['slow'] or x['difference_count']:
+            print('    log: ' + x['log'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Output-equivalence and speed regression harness')
+    parser.add_argument('config', help='harness configuration (JSON)')
+    parser.add_argument('--stage', action='append', help='run only this stage (repeatable)')
+    parser.add_argument('--freeze', action='store_true', help='write the expected outputs from the reference engine')
+    parser.add_argument('--release', help='label recorded in the history (default: git describe)')
+    parser.add_argument('--keep-workspace', action='store_true', help='keep the fixture copies of passed stages')
+    arguments = parser.parse_args()
+    with open(arguments.config) as f:
+        config = json.load(f)
+    reports = run(config, arguments.stage, arguments.freeze, arguments.release, arguments.keep_workspace)
+    for report in reports:
+        print_report(report)
+    sys.exit(0 if all(x['passed'] for x in reports) else 1)
@@ -0,0 +1,199 @@
+# [Description] ------------------------------
+# Persisted dam <-> lake relation store (one SQLite file) built from the Step5 outputs, so downstream users
+# no longer need to open the gdb and re-parse R1_dam_UIDs / R1_sel_dam_UID strings.
+# Tables:
+#   dams       dam_UID -> dam_source, paired lake_UID_QC (R1_lake_UID_QC), R1_keep, lon/lat
+#   lakes      lake_UID_QC -> R1_damcnt, R1_srccnt, R1_sel_damcnt, bounds, geometry (WKB, WGS84)
+#   lake_dams  lake_UID_QC -> ranked dam_UIDs (rank follows R1_dam_UIDs), dam_source, selected (in R1_sel_dam_UID)
+#   dam_rtree / lake_rtree  SQLite R*Tree spatial indexes on dam points and lake bounds
+# The batched lookups (dams of 100k lakes, nearest paired reservoir of many points) use temporary
+# tables / vectorized arrays and return in milliseconds.
+
+# Usage:
+#   relation_store.build_from_feature_classes(store_path, dams, water_mask_dissolved) # end of Step5
+#   store = relation_store.RelationStore(store_path)
+#   store.dams_of_lakes(lake_UIDs); store.nearest_paired_reservoirs(lons, lats)
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import os, sqlite3
+import numpy as np
+import geometry_arrays, geometry_kernels, packed_rtree
+
+SCHEMA = """
+CREATE TABLE dams (dam_id INTEGER PRIMARY KEY, dam_UID TEXT UNIQUE, dam_source TEXT, lake_UID_QC TEXT,
+                   keep INTEGER, lon REAL, lat REAL);
+CREATE TABLE lakes (lake_id INTEGER PRIMARY KEY, lake_UID_QC TEXT UNIQUE, damcnt INTEGER, srccnt INTEGER,
+                    sel_damcnt INTEGER, xmin REAL, ymin REAL, xmax REAL, ymax REAL, geom BLOB);
+CREATE TABLE lake_dams (lake_UID_QC TEXT, rank INTEGER, dam_UID TEXT, dam_source TEXT, selected INTEGER,
+                        PRIMARY KEY (lake_UID_QC, rank));
+CREATE INDEX dams_lake ON dams (lake_UID_QC);
+CREATE INDEX lake_dams_dam ON lake_dams (dam_UID);
+CREATE VIRTUAL TABLE dam_rtree USING rtree (dam_id, xmin, xmax, ymin, ymax);
+CREATE VIRTUAL TABLE lake_rtree USING rtree (lake_id, xmin, xmax, ymin, ymax);
+"""
+
+
+def _split_UIDs(UID_string):
+    # 'a,b,c' (R1_dam_UIDs / R1_sel_dam_UID) -> ['a', 'b', 'c']
+    if UID_string is None or UID_string.strip() == '':
+        return []
+    return [x.strip() for x in UID_string.split(',')]
+
+
+def build(store_path, dam_UIDs, dam_sources, dam_lake_UIDs, dam_keep, dam_lons, dam_lats,
+          lake_UIDs, lake_ranked_dam_UIDs, lake_selected_dam_UIDs, lake_srccnt, lake_wkb):
+    # Write a new store (replacing store_path). Lake lists are parallel; lake_ranked_dam_UIDs[i] is the
+    # ranked list of dam_UIDs of lake i (best source first) and lake_selected_dam_UIDs[i] the selected ones.
+    tmp_path = store_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    con = sqlite3.connect(tmp_path)
+    con.executescript(SCHEMA)
+    con.executemany("INSERT INTO dams VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    zip(range(1, len(dam_UIDs) + 1), dam_UIDs, dam_sources, dam_lake_UIDs, dam_keep, dam_lons, dam_lats))
+    con.executemany("INSERT INTO dam_rtree VALUES (?, ?, ?, ?, ?)",
+                    ((i + 1, x, x, y, y) for i, (x, y) in enumerate(zip(dam_lons, dam_lats)) if x is not None))
+    source_by_dam = dict(zip(dam_UIDs, dam_sources))
+    flat = geometry_arrays.wkb_to_flat(lake_wkb)
+    bounds = geometry_arrays.geometry_bounds(flat)
+    lake_rows = []
+    lake_dam_rows = []
+    for i, this_lake_UID in enumerate(lake_UIDs):
+        ranked = lake_ranked_dam_UIDs[i]
+        selected = set(lake_selected_dam_UIDs[i])
+        lake_rows.append((i + 1, this_lake_UID, len(ranked), lake_srccnt[i], len(selected),
+                          bounds[i, 0], bounds[i, 1], bounds[i, 2], bounds[i, 3],
+                          None if lake_wkb[i] is None else bytes(lake_wkb[i])))
+        for rank, this_dam_UID in enumerate(ranked):
+            lake_dam_rows.append((this_lake_UID, rank + 1, this_dam_UID, source_by_dam.get(this_dam_UID),
+                                  int(this_dam_UID in selected)))
+    con.executemany("INSERT INTO lakes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", lake_rows)
+    con.executemany("INSERT INTO lake_dams VALUES (?, ?, ?, ?, ?)", lake_dam_rows)
+    con.executemany("INSERT INTO lake_rtree VALUES (?, ?, ?, ?, ?)",
+                    ((i + 1, b[0], b[2], b[1], b[3]) for i, b in enumerate(bounds.tolist()) if not np.isnan(b[0])))
+    con.commit()
+    con.close()
+    os.replace(tmp_path, store_path)
+
+
+def build_from_feature_classes(store_path, dams, water_mask_dissolved):
+    # Build the store from the Step5 outputs (All_dams_*_HM and PLDv01_*_HM).
+    import arcpy
+    sr = geometry_arrays.wgs84()
+    dam_rows = []
+    with arcpy.da.SearchCursor(dams, ['dam_UID', 'dam_source', 'R1_lake_UID_QC', 'R1_keep', 'SHAPE@XY'],
+                               spatial_reference=sr) as cursor:
+        for row in cursor:
+            dam_rows.append(row)
+    lake_UIDs = []
+    lake_ranked = []
+    lake_selected = []
+    lake_srccnt = []
+    lake_wkb = []
+    # Only lakes with paired dams are stored (the relation), with their geometry for nearest queries
+    SQL_paired = """{0} IS NOT NULL""".format(arcpy.AddFieldDelimiters(water_mask_dissolved, "R1_dam_UIDs"))
+    with arcpy.da.SearchCursor(water_mask_dissolved, ['lake_UID_QC', 'R1_dam_UIDs', 'R1_sel_dam_UID', 'R1_srccnt', 'SHAPE@WKB'],
+                               where_clause=SQL_paired, spatial_reference=sr) as cursor:
+        for row in cursor:
+            lake_UIDs.append(row[0])
+            lake_ranked.append(_split_UIDs(row[1]))
+            lake_selected.append(_split_UIDs(row[2]))
+            lake_srccnt.append(row[3])
+            lake_wkb.append(row[4])
+    build(store_path, [r[0] for r in dam_rows], [r[1] for r in dam_rows], [r[2] for r in dam_rows],
+          [r[3] for r in dam_rows], [r[4][0] if r[4] is not None else None for r in dam_rows],
+          [r[4][1] if r[4] is not None else None for r in dam_rows],
+          lake_UIDs, lake_ranked, lake_selected, lake_srccnt, lake_wkb)
+
+
+class RelationStore(object):
+    def __init__(self, store_path):
+        self.con = sqlite3.connect(store_path)
+        self._lake_flat = None # paired lake geometries, loaded on the first nearest query
+
+    def close(self):
+        self.con.close()
+
+    def _temp_keys(self, keys):
+        # Load the batch of keys into a temporary table (one join instead of one query per key).
+        self.con.execute("CREATE TEMP TABLE IF NOT EXISTS batch_keys (pos INTEGER PRIMARY KEY, key TEXT)")
+        self.con.execute("DELETE FROM batch_keys")
+        self.con.executemany("INSERT INTO batch_keys VALUES (?, ?)", enumerate(keys))
+
+    def dams_of_lakes(self, lake_UIDs, selected_only=False):
+        # {lake_UID_QC: [(dam_UID, dam_source, selected), ...] ranked by source preference}
+        self._temp_keys(lake_UIDs)
+        SQL = """SELECT ld.lake_UID_QC, ld.dam_UID, ld.dam_source, ld.selected FROM batch_keys k
+                 JOIN lake_dams ld ON ld.lake_UID_QC = k.key {0} ORDER BY k.pos, ld.rank"""
+        result = dict((x, []) for x in lake_UIDs)
+        for lake_UID, dam_UID, dam_source, selected in self.con.execute(SQL.format("WHERE ld.selected = 1" if selected_only else "")):
+            result[lake_UID].append((dam_UID, dam_source, selected))
+        return result
+
+    def lakes_of_dams(self, dam_UIDs):
+        # {dam_UID: (lake_UID_QC or None, R1_keep, rank within the lake or None)}
+        self._temp_keys(dam_UIDs)
+        SQL = """SELECT d.dam_UID, d.lake_UID_QC, d.keep, ld.rank FROM batch_keys k JOIN dams d ON d.dam_UID = k.key
+                 LEFT JOIN lake_dams ld ON ld.dam_UID = d.dam_UID AND ld.lake_UID_QC = d.lake_UID_QC"""
+        result = dict((x, (None, None, None)) for x in dam_UIDs)
+        for dam_UID, lake_UID, keep, rank in self.con.execute(SQL):
+            result[dam_UID] = (lake_UID, keep, rank)
+        return result
+
+    def lake_counts(self, lake_UIDs):
+        # {lake_UID_QC: (R1_damcnt, R1_srccnt, R1_sel_damcnt)}
+        self._temp_keys(lake_UIDs)
+        SQL = """SELECT l.lake_UID_QC, l.damcnt, l.srccnt, l.sel_damcnt FROM batch_keys k JOIN lakes l ON l.lake_UID_QC = k.key"""
+        return dict((row[0], row[1:]) for row in self.con.execute(SQL))
+
+    def dams_in_bbox(self, xmin, ymin, xmax, ymax):
+        SQL = """SELECT d.dam_UID FROM dam_rtree r JOIN dams d ON d.dam_id = r.dam_id
+                 WHERE r.xmin <= ? AND r.xmax >= ? AND r.ymin <= ? AND r.ymax >= ?"""
+        return [row[0] for row in self.con.execute(SQL, (xmax, xmin, ymax, ymin))]
+
+    def lakes_in_bbox(self, xmin, ymin, xmax, ymax):
+        SQL = """SELECT l.lake_UID_QC FROM lake_rtree r JOIN lakes l ON l.lake_id = r.lake_id
+                 WHERE r.xmin <= ? AND r.xmax >= ? AND r.ymin <= ? AND r.ymax >= ?"""
+        return [row[0] for row in self.con.execute(SQL, (xmax, xmin, ymax, ymin))]
+
+    def _load_lakes(self):
+        if self._lake_flat is None:
+            rows = self.con.execute("SELECT lake_UID_QC, geom FROM lakes WHERE damcnt > 0 ORDER BY lake_id").fetchall()
+            self._lake_UIDs = np.array([r[0] for r in rows], dtype=object)
+            self._lake_flat = geometry_arrays.wkb_to_flat([r[1] for r in rows])
+            self._lake_rtree = packed_rtree.PackedRTree.build(geometry_arrays.geometry_bounds(self._lake_flat))
+
+    def nearest_paired_reservoirs(self, lons, lats, max_distance=5000.0):
+        # Nearest lake with paired dams for every point: (lake_UID_QC array (None if none within max_distance), distance in m).
+        self._load_lakes()
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        n_point = len(lons)
+        best_distance = np.full(n_point, np.inf)
+        best_lake = np.full(n_point, -1, dtype=np.int64)
+        pending = np.arange(n_point)
+        radius = min(max_distance, 250.0)
+        while len(pending) > 0:
+            # Search window (degrees) around each pending point; lakes farther than radius are outside it
+            windows = geometry_kernels.search_windows(lons[pending], lats[pending], radius)
+            query_i, lake_i = self._lake_rtree.query_bulk(windows)
+            distance = geometry_kernels.point_polygon_distance(lons, lats, pending[query_i], lake_i, self._lake_flat)[0]
+            np.minimum.at(best_distance, pending[query_i], distance)
+            hit = distance == best_distance[pending[query_i]]
+            best_lake[pending[query_i][hit]] = lake_i[hit]
+            # A point is resolved once its nearest lake is within the window radius
+            resolved = best_distance[pending] <= radius
+            if radius >= max_distance:
+                break
+            pending = pending[~resolved]
+            radius = min(radius*4, max_distance)
+        found = (best_lake >= 0) & (best_distance <= max_distance)
+        lake_UIDs = np.where(found, self._lake_UIDs[np.maximum(best_lake, 0)] if len(self._lake_UIDs) > 0 else None, None)
+        return lake_UIDs, np.where(found, best_distance, np.nan)
@@ -0,0 +1,70 @@
+# [Description] ------------------------------
+# Packed Hilbert R-tree sidecars (see packed_rtree.py) written next to the harmonized outputs and intermediate
+# water masks, so that every consumer can memory-map a ready index instead of building one.
+# A sidecar holds the WGS84 bounds of every feature (in the R-tree) and its OID; queries return OIDs.
+# Sidecar path: <folder of the gdb>\<gdb name>.<feature class>.hrt for gdb feature classes, <name>.hrt for shapefiles.
+# meta records the feature class, its feature count and the time of writing, so stale sidecars can be detected.
+
+# Usage:
+#   rtree_sidecar.write_sidecar(r"D:\...\R1_India_test.gdb\PLDv01_India_HM")
+#   index = rtree_sidecar.open_sidecar(r"D:\...\R1_India_test.gdb\PLDv01_India_HM")   # or the .hrt path
+#   OIDs = rtree_sidecar.query_OIDs(index, [77.0, 12.0, 78.0, 13.0])
+#   OIDs, distances = rtree_sidecar.nearest_OIDs(index, 77.5, 12.5, k=3)   # box distances (m)
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import datetime, os
+import numpy as np
+import geometry_arrays, packed_rtree
+
+SIDECAR_EXTENSION = '.hrt'
+
+
+def sidecar_path(feature_class, extension=SIDECAR_EXTENSION):
+    # Sidecar file of a feature class path (a gdb cannot hold extra files, so gdb sidecars sit beside it).
+    # extension: also used for the other per-dataset caches (e.g. geometry_envelopes.py).
+    feature_class = os.path.normpath(feature_class)
+    if feature_class.endswith(extension):
+        return feature_class
+    parts = feature_class.split(os.sep)
+    for i, part in enumerate(parts):
+        if part.lower().endswith('.gdb'):
+            gdb = os.sep.join(parts[:i + 1])
+            return os.path.splitext(gdb)[0] + '.' + '.'.join(parts[i + 1:]) + extension
+    return os.path.splitext(feature_class)[0] + extension
+
+
+def write_sidecar(feature_class, path=None, node_size=16):
+    # Build the R-tree of a feature class (WGS84 bounds) and write it with the OIDs; returns the sidecar path.
+    import arcpy
+    catalog_path = arcpy.Describe(feature_class).catalogPath
+    path = path or sidecar_path(catalog_path)
+    flat, values = geometry_arrays.read_flat_geometry(feature_class, ['OID@'])
+    tree = packed_rtree.PackedRTree.build(geometry_arrays.geometry_bounds(flat), node_size)
+    tree.ids = np.array(values['OID@'], dtype=np.int64)
+    tree.meta = {'feature_class': catalog_path, 'count': len(tree.ids), 'spatial_reference': 'WGS84',
+                 'written': datetime.datetime.now().isoformat(timespec='seconds')}
+    tree.save(path)
+    return path
+
+
+def open_sidecar(feature_class_or_path):
+    # Memory-mapped PackedRTree of a sidecar (tree.ids: OIDs, tree.meta: see write_sidecar).
+    return packed_rtree.PackedRTree.load(sidecar_path(feature_class_or_path))
+
+
+def query_OIDs(tree, bbox):
+    # OIDs of the features whose bounds intersect bbox [xmin, ymin, xmax, ymax] (WGS84).
+    return tree.ids[tree.query(bbox)]
+
+
+def nearest_OIDs(tree, lon, lat, k=1, max_distance=np.inf):
+    # OIDs of the k features with the nearest bounds to (lon, lat), and the box distances (m).
+    items, distances = tree.nearest(lon, lat, k, max_distance, geographic=True)
+    return tree.ids[items], distances
@@ -0,0 +1,162 @@
+# [Description] ------------------------------
+# One-pass parameter sweep over the Step5 search settings (search_step, max_search_distance, max_search_distance_large).
+# The dam -> polygon candidates and their geodesic distances are computed once (GenerateNearTable up to the
+# largest radius of the sweep); every setting is then evaluated from that cached candidate table with the
+# Step5 rules in dam_pairing.py. Tuning the radii costs one run instead of one multi-hour run per setting.
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import csv, hashlib, itertools, re
+import numpy as np
+import dam_pairing, geometry_arrays, geometry_kernels, thread_pool
+
+
+def build_candidate_table(dams, water_polygons, max_radius, lake_area_by_OID=None, near_table="memory\\sweep_near_table",
+                          distance_engine="near_table", workers=None):
+    # Read dams and polygons once and return everything the sweep needs as arrays:
+    # {max_radius, dam_UIDs, dam_sources, keep_initial, register_name, lake_UIDs, lake_area, GeoDAR_lake, cand_dam, cand_lake, cand_distance}
+    # lake_area_by_OID: optional {polygon OID: area} (e.g. geodesic areas) used instead of Shape_Area.
+    # distance_engine: "near_table" (GenerateNearTable, GEODESIC) or "kernels" (geometry_kernels.py on the WGS84 coordinates;
+    # local equirectangular distances, within ~0.1% of the geodesic ones at these radii) or "threads" (the same kernels
+    # over chunks of dams in a thread pool sharing one R-tree, see thread_pool.py; workers threads, None: all cores).
+    import arcpy
+    dam_OIDs = []
+    dam_UIDs = []
+    dam_sources = []
+    dam_xy = []
+    keep_initial = []
+    register_name = None
+    with arcpy.da.SearchCursor(dams, ['OID@', 'dam_UID', 'dam_source', 'SHAPE@XY'],
+                               spatial_reference=geometry_arrays.wgs84()) as cursor:
+        for this_OID, this_dam_UID, this_dam_source, this_xy in cursor:
+            dam_OIDs.append(this_OID)
+            dam_xy.append(this_xy)
+            dam_UIDs.append(this_dam_UID)
+            dam_sources.append(this_dam_source)
+            if re.search('register_.+', this_dam_source):
+                keep_initial.append(1)
+                register_name = this_dam_source
+            else:
+                keep_initial.append(None)
+    lake_OIDs = []
+    lake_UIDs = []
+    lake_area = []
+    lake_by_GeoDAR_ID = {}
+    with arcpy.da.SearchCursor(water_polygons, ['OID@', 'lake_UID_QC', 'GeoDARv11_ID_QC', 'Shape_Area']) as cursor:
+        for this_OID, this_lake_UID, this_GeoDAR_ID, this_area in cursor:
+            if this_GeoDAR_ID is not None:
+                lake_by_GeoDAR_ID[this_GeoDAR_ID] = len(lake_OIDs)
+            lake_OIDs.append(this_OID)
+            lake_UIDs.append(this_lake_UID)
+            lake_area.append(this_area if lake_area_by_OID is None else lake_area_by_OID[this_OID])
+    GeoDAR_lake = [lake_by_GeoDAR_ID.get(x, dam_pairing.NO_LAKE) for x in dam_UIDs]
+
+    # All (dam, polygon) pairs within max_radius
+    if distance_engine in ("kernels", "threads"):
+        dam_xy = np.array(dam_xy, dtype=np.float64).reshape(-1, 2)
+        lake_flat = geometry_arrays.read_flat_geometry(water_polygons)[0]
+        if distance_engine == "threads":
+            cand_dam, cand_lake, cand_distance = thread_pool.candidates_within(dam_xy[:, 0], dam_xy[:, 1], lake_flat, max_radius,
+                                                                               workers=workers)
+        else:
+            cand_dam, cand_lake, cand_distance = geometry_kernels.candidates_within(dam_xy[:, 0], dam_xy[:, 1], lake_flat, max_radius)
+    else:
+        arcpy.GenerateNearTable_analysis(dams, water_polygons, near_table, str(max_radius) + " Meters",
+                                         "NO_LOCATION", "NO_ANGLE", "ALL", 0, "GEODESIC")
+        dam_index_by_OID = dict((x, i) for i, x in enumerate(dam_OIDs))
+        lake_index_by_OID = dict((x, i) for i, x in enumerate(lake_OIDs))
+        cand_dam = []
+        cand_lake = []
+        cand_distance = []
+        with arcpy.da.SearchCursor(near_table, ['IN_FID', 'NEAR_FID', 'NEAR_DIST']) as cursor:
+            for in_FID, near_FID, near_dist in cursor:
+                cand_dam.append(dam_index_by_OID[in_FID])
+                cand_lake.append(lake_index_by_OID[near_FID])
+                cand_distance.append(near_dist)
+        arcpy.Delete_management(near_table)
+    return {'max_radius': float(max_radius), 'dam_UIDs': dam_UIDs, 'dam_sources': dam_sources, 'keep_initial': keep_initial,
+            'register_name': register_name, 'lake_UIDs': lake_UIDs, 'lake_area': np.array(lake_area, dtype=np.float64),
+            'GeoDAR_lake': np.array(GeoDAR_lake, dtype=np.int64), 'cand_dam': np.array(cand_dam, dtype=np.int64),
+            'cand_lake': np.array(cand_lake, dtype=np.int64), 'cand_distance': np.array(cand_distance, dtype=np.float64)}
+
+
+def input_signature(dams, water_polygons, distance_engine, lake_area_by_OID=None):
+    # Digest of everything a candidate table is built from: the dam points and attributes, the polygon geometry
+    # (geometry_arrays.geometry_hashes) and attributes, the lake areas and the distance engine. A cached table is
+    # only reused when its signature matches (reading the inputs is much cheaper than the near analysis).
+    import arcpy
+    signature = hashlib.sha1(distance_engine.encode('utf-8'))
+    with arcpy.da.SearchCursor(dams, ['OID@', 'dam_UID', 'dam_source', 'SHAPE@XY'],
+                               spatial_reference=geometry_arrays.wgs84()) as cursor:
+        signature.update(repr([row for row in cursor]).encode('utf-8'))
+    fields = ['OID@', 'lake_UID_QC', 'GeoDARv11_ID_QC', 'Shape_Area']
+    flat, values = geometry_arrays.read_flat_geometry(water_polygons, fields)
+    signature.update(geometry_arrays.geometry_hashes(flat).tobytes())
+    signature.update(repr([values[f] for f in fields]).encode('utf-8'))
+    if lake_area_by_OID is not None:
+        signature.update(repr(sorted(lake_area_by_OID.items())).encode('utf-8'))
+    return signature.hexdigest()
+
+
+def save_candidate_table(path, table):
+    # Cache the candidate table (.npz) so further sweeps skip the near analysis.
+    # table['signature'] (input_signature of the inputs it was built from) is stored with it if set.
+    np.savez_compressed(path, max_radius=np.array([table['max_radius']]), signature=np.array([table.get('signature')], dtype=object),
+                        dam_UIDs=np.array(table['dam_UIDs'], dtype=object),
+                        dam_sources=np.array(table['dam_sources'], dtype=object),
+                        keep_initial=np.array(table['keep_initial'], dtype=object),
+                        register_name=np.array([table['register_name']], dtype=object),
+                        lake_UIDs=np.array(table['lake_UIDs'], dtype=object), lake_area=table['lake_area'],
+                        GeoDAR_lake=table['GeoDAR_lake'], cand_dam=table['cand_dam'],
+                        cand_lake=table['cand_lake'], cand_distance=table['cand_distance'])
+
+
+def load_candidate_table(path):
+    data = np.load(path, allow_pickle=True)
+    table = dict((k, data[k]) for k in data.files)
+    for k in ['dam_UIDs', 'dam_sources', 'keep_initial', 'lake_UIDs']:
+        table[k] = table[k].tolist()
+    table['register_name'] = table['register_name'][0]
+    table['signature'] = table['signature'][0] if 'signature' in table else None # tables cached before signatures
+    table['max_radius'] = float(table['max_radius'][0])
+    return table
+
+
+def evaluate(table, search_step, max_search_distance, max_search_distance_large):
+    # Pairing and lake ranking of one setting: (dam_lake, lakes, keep), see dam_pairing.py.
+    dam_lake = dam_pairing.pair_dams(table['dam_sources'], table['GeoDAR_lake'], table['cand_dam'], table['cand_lake'],
+                                     table['cand_distance'], table['lake_area'],
+                                     search_step, max_search_distance, max_search_distance_large)
+    lakes, keep = dam_pairing.rank_lakes(dam_lake, table['dam_UIDs'], table['dam_sources'],
+                                         table['register_name'], table['keep_initial'])
+    return dam_lake, lakes, keep
+
+
+def sweep(table, search_steps, max_search_distances, max_search_distances_large, baseline=None):
+    # Summary of every (search_step, max_search_distance, max_search_distance_large) combination.
+    # changed_assignments is counted against baseline (a setting tuple; default: the first combination).
+    settings = list(itertools.product(search_steps, max_search_distances, max_search_distances_large))
+    if baseline is None:
+        baseline = settings[0]
+    baseline_dam_lake = evaluate(table, *baseline)[0]
+    summaries = []
+    for setting in settings:
+        dam_lake, lakes, keep = evaluate(table, *setting)
+        summary = {'search_step': setting[0], 'max_search_distance': setting[1], 'max_search_distance_large': setting[2]}
+        summary.update(dam_pairing.summarize(dam_lake, lakes, baseline_dam_lake))
+        summaries.append(summary)
+    return summaries
+
+
+def write_summary(path, summaries):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(summaries[0].keys()))
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow(summary)
@@ -0,0 +1,194 @@
+# [Description] ------------------------------
+# Thread-pool execution of the batch geometry stages, for regional runs where a process pool spends more time
+# starting workers and shipping data than computing. The work is split into chunks that call vectorized routines
+# which release the GIL (NumPy, the Numba kernels of geometry_kernels.py, Shapely 2), the threads share the
+# in-process arrays and one packed R-tree (packed_rtree.py), and chunk results are put back together in chunk order,
+# so the output does not depend on the number of workers.
+# Stages:
+#   point_polygon_distance / candidates_within   distance queries (dam -> polygon; search_sweep distance_engine = "threads")
+#   intersection_areas                           area of PLD x GeoDAR intersections (Shapely 2; Step4 area_ratio_mode = "threads")
+#   related_pairs                                shared-segment (or intersect) tests between two layers (Shapely 2; Step1)
+# Shapely is optional: only the stages that need it raise an ImportError without it.
+
+# Usage:
+#   distance, inside = thread_pool.point_polygon_distance(lons, lats, pair_point, pair_geom, flat, workers=16)
+#   pair_a, pair_b = thread_pool.related_pairs(circa2015_flat, PLD_flat, "SHARE_A_LINE_SEGMENT_WITH", workers=16)
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import geodesic_area, geometry_arrays, geometry_kernels, packed_rtree
+
+try:
+    import shapely
+except ImportError:
+    shapely = None
+
+# DE-9IM patterns of the Step1 selection relations (SHARE_A_LINE_SEGMENT_WITH: the boundaries share a segment)
+RELATION_PATTERNS = {'SHARE_A_LINE_SEGMENT_WITH': '****1****', 'INTERSECT': None}
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def map_items(function, items, workers=None):
+    # [function(item) for item in items], run on workers threads (results in item order).
+    items = list(items)
+    workers = min(workers or default_workers(), max(len(items), 1))
+    if workers == 1:
+        return [function(x) for x in items]
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(function, items))
+
+
+def map_chunks(function, n, chunk_size, workers=None):
+    # [function(start, end) for every chunk of range(n)], run on workers threads (results in chunk order).
+    return map_items(lambda start: function(start, min(start + chunk_size, n)), range(0, n, chunk_size), workers)
+
+
+def _concatenate(results, count=None):
+    # Concatenate the tuples of arrays returned by the chunks.
+    if len(results) == 0:
+        return tuple(np.zeros(0) for i in range(count))
+    return tuple(np.concatenate(x) for x in zip(*results))
+
+
+def _require_shapely():
+    if shapely is None:
+        raise ImportError('this stage needs Shapely 2 (pip install shapely)')
+
+
+def to_shapely(flat):
+    # Shapely (multi)polygons of a flat polygon array (no coordinate copy per geometry).
+    _require_shapely()
+    return shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, flat.coords,
+                                     (flat.ring_offsets, flat.part_offsets, flat.geom_offsets))
+
+
+def planar_areas(flat):
+    # Planar area of every polygon, in the units of its coordinates (Shape_Area when read in the layer's own projection).
+    return shapely.area(to_shapely(flat))
+
+
+def _flat_polygons(geometries):
+    # Polygon parts of shapely geometries as a flat array, with the index of the geometry of every part.
+    parts, index = shapely.get_parts(geometries, return_index=True)
+    parts, part_index = shapely.get_parts(parts, return_index=True) # multipolygons inside collections
+    index = index[part_index]
+    polygon = (shapely.get_type_id(parts) == shapely.GeometryType.POLYGON) & ~shapely.is_empty(parts)
+    parts, index = parts[polygon], index[polygon]
+    if len(parts) == 0:
+        return geometry_arrays.wkb_to_flat([]), index
+    geom_type, coords, (ring_offsets, polygon_offsets) = shapely.to_ragged_array(parts)
+    flat = geometry_arrays.FlatGeometry(coords, ring_offsets.astype(np.int64), polygon_offsets.astype(np.int64),
+                                        np.arange(len(parts) + 1, dtype=np.int64))
+    return flat, index
+
+
+def point_polygon_distance(px, py, pair_point, pair_geom, flat, boundary=False, workers=None, chunk_size=200000, engine=None):
+    # geometry_kernels.point_polygon_distance split over threads (each chunk runs the single-threaded kernel).
+    pair_point = np.asarray(pair_point, dtype=np.int64)
+    pair_geom = np.asarray(pair_geom, dtype=np.int64)
+    geometry_kernels.warm_up() # compile the kernels on this thread, not on the workers
+    results = map_chunks(lambda start, end: geometry_kernels.point_polygon_distance(
+        px, py, pair_point[start:end], pair_geom[start:end], flat, boundary, engine, parallel=False),
+        len(pair_point), chunk_size, workers)
+    if len(results) == 0:
+        return np.zeros(0), np.zeros(0, dtype=bool)
+    return _concatenate(results)
+
+
+def candidates_within(lons, lats, flat, max_distance, rtree=None, workers=None, chunk_size=50000, engine=None,
+                      envelopes=None):
+    # geometry_kernels.candidates_within split over threads by point chunks, all querying one shared R-tree.
+    # envelopes: optional geometry_envelopes.Envelopes of flat (pairs rejected on the outer envelope first).
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    if rtree is None:
+        rtree = packed_rtree.PackedRTree.build(geometry_arrays.geometry_bounds(flat))
+    def chunk(start, end):
+        point_i, geom_i = rtree.query_bulk(geometry_kernels.search_windows(lons[start:end], lats[start:end], max_distance))
+        point_i = point_i + start
+        if envelopes is not None:
+            near = geometry_kernels.point_polygon_distance(lons, lats, point_i, geom_i, envelopes.outer, engine=engine,
+                                                           parallel=False)[0] <= max_distance
+            point_i, geom_i = point_i[near], geom_i[near]
+        distance = geometry_kernels.point_polygon_distance(lons, lats, point_i, geom_i, flat, engine=engine, parallel=False)[0]
+        keep = distance <= max_distance
+        return point_i[keep], geom_i[keep], distance[keep]
+    geometry_kernels.warm_up() # compile the kernels on this thread, not on the workers
+    point_i, geom_i, distance = _concatenate(map_chunks(chunk, len(lons), chunk_size, workers), 3)
+    return point_i.astype(np.int64), geom_i.astype(np.int64), distance
+
+
+def intersection_areas(flat_a, flat_b, pair_a=None, pair_b=None, workers=None, chunk_size=20000, envelopes=None,
+                       geodesic=True):
+    # Area of the intersection of polygon pair_a[k] of flat_a with pair_b[k] of flat_b: geodesic (m2, geodesic_area.py),
+    # or planar in the coordinate units (geodesic=False). Without pairs, all pairs with intersecting bounds are used.
+    # Returns (pair_a, pair_b, area).
+    # envelopes: optional (prepared a, prepared b) of geometry_envelopes.prepare; rejected pairs get 0 without overlay.
+    geometries_a = to_shapely(flat_a)
+    geometries_b = to_shapely(flat_b)
+    if pair_a is None:
+        tree = packed_rtree.PackedRTree.build(geometry_arrays.geometry_bounds(flat_a))
+        pair_b, pair_a = tree.query_bulk(geometry_arrays.geometry_bounds(flat_b))
+    pair_a = np.asarray(pair_a, dtype=np.int64)
+    pair_b = np.asarray(pair_b, dtype=np.int64)
+    def chunk(start, end):
+        k = np.arange(end - start)
+        if envelopes is not None:
+            import geometry_envelopes
+            classes = geometry_envelopes.classify_intersects(envelopes[0], envelopes[1], pair_a[start:end], pair_b[start:end])
+            k = k[classes != geometry_envelopes.REJECT]
+        pieces = shapely.intersection(geometries_a[pair_a[start:end][k]], geometries_b[pair_b[start:end][k]])
+        area = np.zeros(end - start)
+        if geodesic:
+            flat, index = _flat_polygons(pieces)
+            area[k] = np.bincount(index, weights=geodesic_area.polygon_areas(flat), minlength=len(k))
+        else:
+            area[k] = shapely.area(pieces)
+        return (area,)
+    results = map_chunks(chunk, len(pair_a), chunk_size, workers)
+    area = _concatenate(results)[0] if results else np.zeros(0)
+    return pair_a, pair_b, area
+
+
+def related_pairs(flat_a, flat_b, relation='SHARE_A_LINE_SEGMENT_WITH', rtree_b=None, workers=None, chunk_size=20000,
+                  envelopes=None):
+    # (index in flat_a, index in flat_b) of the polygon pairs in the relation (see RELATION_PATTERNS), sorted.
+    # rtree_b: optional PackedRTree of flat_b, shared by every chunk.
+    # envelopes: optional (prepared a, prepared b) of geometry_envelopes.prepare; only the pairs the envelopes
+    # cannot decide are tested on the full-resolution polygons.
+    geometries_a = to_shapely(flat_a)
+    geometries_b = to_shapely(flat_b)
+    if rtree_b is None:
+        rtree_b = packed_rtree.PackedRTree.build(geometry_arrays.geometry_bounds(flat_b))
+    pattern = RELATION_PATTERNS[relation]
+    bounds_a = geometry_arrays.geometry_bounds(flat_a)
+    def chunk(start, end):
+        pair_a, pair_b = rtree_b.query_bulk(bounds_a[start:end])
+        pair_a = pair_a + start
+        if envelopes is not None:
+            import geometry_envelopes
+            classes = geometry_envelopes.classify_related(envelopes[0], envelopes[1], pair_a, pair_b, relation)
+            related = classes == geometry_envelopes.ACCEPT
+            k = np.nonzero(classes == geometry_envelopes.EXACT)[0]
+        else:
+            related = np.zeros(len(pair_a), dtype=bool)
+            k = np.arange(len(pair_a))
+        if pattern is None:
+            related[k] = shapely.intersects(geometries_a[pair_a[k]], geometries_b[pair_b[k]])
+        else:
+            related[k] = shapely.relate_pattern(geometries_a[pair_a[k]], geometries_b[pair_b[k]], pattern)
+        return pair_a[related], pair_b[related]
+    pair_a, pair_b = _concatenate(map_chunks(chunk, len(bounds_a), chunk_size, workers), 2)
+    return pair_a.astype(np.int64), pair_b.astype(np.int64)
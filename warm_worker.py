@@ -0,0 +1,399 @@
+# [Description] ------------------------------
+# Long-lived local worker that keeps arcpy imported (license checked out once) and the loaded datasets hot:
+# layers as flat geometry arrays with bounds and a packed R-tree, ID dictionaries and any other cached values.
+# Step jobs (including whole step scripts) then run against the warm process instead of paying the
+# startup and data-load cost on every run. Cached layers are evicted least-recently-used first when the
+# memory budget is exceeded.
+# Scripts run with the run_script job have geometry_arrays.read_flat_geometry routed through the cache
+# (read_flat_geometry below), so reruns reuse the geometry of PLD, GeoDAR and the water mask; a layer is read again
+# when its feature count, selection or file modification time changes. Outside the worker the steps read directly.
+
+# Protocol: one JSON object per line.
+#   request:  {"id": 1, "job": "load_layer", "args": {"feature_class": "...", "fields": ["lake_UID"]}}
+#   response: {"id": 1, "ok": true, "result": ..., "log": "<printed output>"}  or  {"id": 1, "ok": false, "error": "..."}
+# Transport: stdin/stdout (--stdio), or a Unix socket (--socket PATH; one client at a time, jobs run in order).
+
+# Usage:
+#   python warm_worker.py --socket /tmp/pld_worker.sock --memory-budget-mb 16000
+#   client = warm_worker.WarmWorkerClient(socket_path="/tmp/pld_worker.sock")   # or WarmWorkerClient() to spawn one on stdio
+#   client.call("run_script", path="Step5_build_dam_reservoir_relation-India.py", setup={"dams_original": "All_dams_India"})
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import argparse, ast, collections, contextlib, io, json, os, socket, subprocess, sys, traceback
+import numpy as np
+
+JOBS = {}
+
+
+def job(name):
+    # Register a job function: f(cache, **args) -> JSON-serializable result.
+    def register(function):
+        JOBS[name] = function
+        return function
+    return register
+
+
+def _sizeof(value):
+    # Approximate memory size (bytes) of a cached value.
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    if hasattr(value, '_fields'): # namedtuple of arrays (FlatGeometry)
+        return sum(_sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class LayerCache(object):
+    # Key -> value with least-recently-used eviction under a memory budget (bytes).
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self.entries = collections.OrderedDict() # key -> (value, size)
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, load=None):
+        # Cached value (marked as most recently used); load() fills a missing entry if given.
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][0]
+        self.misses += 1
+        if load is None:
+            raise KeyError(key)
+        value = load()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.evict(key)
+        size = _sizeof(value)
+        self.entries[key] = (value, size)
+        self.total_size += size
+        # Evict least recently used entries (never the one just added)
+        while self.total_size > self.memory_budget and len(self.entries) > 1:
+            oldest = next(iter(self.entries))
+            self.evict(oldest)
+            self.evictions += 1
+
+    def evict(self, key):
+        if key in self.entries:
+            self.total_size -= self.entries.pop(key)[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.total_size = 0
+
+    def stats(self):
+        return {'entries': [[k, s] for k, (v, s) in self.entries.items()], 'total_size': self.total_size,
+                'memory_budget': self.memory_budget, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+CACHE = LayerCache(8*1024**3) # replaced by serve(); step scripts run in the worker can use warm_worker.CACHE
+
+
+# [Jobs] -----------------------------------
+@job('ping')
+def _ping(cache):
+    return 'pong'
+
+
+@job('stats')
+def _stats(cache):
+    return cache.stats()
+
+
+@job('evict')
+def _evict(cache, key=None):
+    if key is None:
+        cache.clear()
+    else:
+        cache.evict(key)
+    return cache.stats()
+
+
+def layer_key(feature_class, fields=(), where=None):
+    return 'layer|' + feature_class + '|' + ','.join(fields) + '|' + (where or '')
+
+
+def get_layer(feature_class, fields=(), where=None, cache=None):
+    # {'flat', 'values', 'bounds', 'rtree'} of a layer, from the cache or read once.
+    import geometry_arrays, packed_rtree
+    cache = CACHE if cache is None else cache
+    def load():
+        flat, values = geometry_arrays.read_flat_geometry(feature_class, list(fields), where=where)
+        bounds = geometry_arrays.geometry_bounds(flat)
+        return {'flat': flat, 'values': values, 'bounds': bounds, 'rtree': packed_rtree.PackedRTree.build(bounds)}
+    return cache.get(layer_key(feature_class, fields, where), load)
+
+
+def _modification_time(catalog_path):
+    # Latest modification time of the files holding a layer: the files of its file geodatabase, or the shapefile.
+    # None for layers without files (e.g. the memory workspace).
+    workspace = catalog_path
+    while not workspace.lower().endswith('.gdb') and os.path.dirname(workspace) != workspace:
+        workspace = os.path.dirname(workspace)
+    if workspace.lower().endswith('.gdb') and os.path.isdir(workspace):
+        return max([entry.stat().st_mtime for entry in os.scandir(workspace)] + [os.path.getmtime(workspace)])
+    base = os.path.splitext(catalog_path)[0]
+    times = [os.path.getmtime(base + x) for x in ('.shp', '.shx', '.dbf') if os.path.exists(base + x)]
+    return max(times) if times else None
+
+
+def _signature(feature_class, where=None):
+    # Cheap identity of a layer's current content, from metadata only: catalog path, feature count, selection and
+    # definition query (layers) and the file modification time, so that a rewritten or edited layer is read again.
+    # The signature is None for layers without files, which are never cached.
+    import arcpy
+    describe = arcpy.Describe(feature_class)
+    modified = _modification_time(describe.catalogPath)
+    if modified is None:
+        return describe.catalogPath, None
+    count = int(arcpy.GetCount_management(feature_class)[0])
+    selection = getattr(describe, 'FIDSet', '') or ''
+    definition = getattr(describe, 'whereClause', '') or ''
+    return describe.catalogPath, repr((count, modified, hash(selection), definition))
+
+
+def read_flat_geometry(feature_class, fields=None, where=None, cache=None, read=None):
+    # Cached geometry_arrays.read_flat_geometry (WGS84): the geometry, bounds and R-tree stay in the cache and are
+    # reused while the layer is unchanged (see _signature); the attribute fields are always read fresh, as the
+    # steps update them between runs. read: the uncached reader (default geometry_arrays.read_flat_geometry).
+    import arcpy, geometry_arrays, packed_rtree
+    cache = CACHE if cache is None else cache
+    read = read or geometry_arrays.read_flat_geometry
+    fields = list(fields or [])
+    catalog_path, signature = _signature(feature_class, where)
+    if signature is None:
+        return read(feature_class, fields, where)
+    key = 'geometry|' + catalog_path + '|' + (where or '')
+    def load():
+        flat = read(feature_class, where=where)[0]
+        bounds = geometry_arrays.geometry_bounds(flat)
+        return {'signature': signature, 'flat': flat, 'bounds': bounds, 'rtree': packed_rtree.PackedRTree.build(bounds)}
+    if key in cache and cache.get(key)['signature'] != signature:
+        cache.evict(key)
+    layer = cache.get(key, load)
+    values = dict((f, []) for f in fields)
+    if fields:
+        with arcpy.da.SearchCursor(feature_class, fields, where_clause=where) as cursor:
+            for row in cursor:
+                for f_i, f in enumerate(fields):
+                    values[f].append(row[f_i])
+    return layer['flat'], values
+
+
+@contextlib.contextmanager
+def cached_geometry_reads(cache=None):
+    # Route geometry_arrays.read_flat_geometry through read_flat_geometry (WGS84 reads only) while a job runs.
+    import geometry_arrays
+    read = geometry_arrays.read_flat_geometry
+    def cached_read(feature_class, fields=None, where=None, spatial_reference=None):
+        if spatial_reference is not None:
+            return read(feature_class, fields, where, spatial_reference)
+        return read_flat_geometry(feature_class, fields, where, cache, read)
+    geometry_arrays.read_flat_geometry = cached_read
+    try:
+        yield
+    finally:
+        geometry_arrays.read_flat_geometry = read
+
+
+def get_id_dictionary(feature_class, key_field, value_field, where=None, cache=None):
+    # {key_field value: value_field value}, from the cache or read once (read again if the layer changed).
+    cache = CACHE if cache is None else cache
+    catalog_path, signature = _signature(feature_class, where)
+    key = 'ids|' + catalog_path + '|' + key_field + '|' + value_field + '|' + (where or '')
+    def load():
+        import arcpy
+        with arcpy.da.SearchCursor(feature_class, [key_field, value_field], where_clause=where) as cursor:
+            return {'signature': signature, 'ids': dict((row[0], row[1]) for row in cursor)}
+    if signature is None:
+        return load()['ids']
+    if key in cache and cache.get(key)['signature'] != signature:
+        cache.evict(key)
+    return cache.get(key, load)['ids']
+
+
+@job('load_layer')
+def _load_layer(cache, feature_class, fields=(), where=None):
+    layer = get_layer(feature_class, fields, where, cache)
+    return {'key': layer_key(feature_class, fields, where), 'count': len(layer['bounds'])}
+
+
+@job('id_dictionary')
+def _id_dictionary(cache, feature_class, key_field, value_field, where=None):
+    return len(get_id_dictionary(feature_class, key_field, value_field, where, cache))
+
+
+@job('bbox_query')
+def _bbox_query(cache, feature_class, bbox, fields=(), where=None, id_field=None):
+    # Indices (or id_field values) of the layer's geometries whose bounds intersect bbox.
+    layer = get_layer(feature_class, fields, where, cache)
+    found = layer['rtree'].query(bbox)
+    if id_field is None:
+        return found.tolist()
+    return [layer['values'][id_field][i] for i in found]
+
+
+@job('geodesic_areas')
+def _geodesic_areas(cache, feature_class, key_field, where=None, cache_path=None):
+    # {key_field value: geodesic area (m2)} computed from the cached layer.
+    import geodesic_area
+    layer = get_layer(feature_class, [key_field], where, cache)
+    areas = geodesic_area.cached_polygon_areas(layer['flat'], geodesic_area.GeodesicAreaCache(cache_path))
+    return dict(zip([str(x) for x in layer['values'][key_field]], areas.tolist()))
+
+
+def _with_setup(source, setup):
+    # Script AST with the top-level [Setup] assignments named in setup replaced by the given values.
+    tree = ast.parse(source)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id in setup:
+            node.value = ast.parse(repr(setup[node.targets[0].id]), mode='eval').body
+    return ast.fix_missing_locations(tree)
+
+
+def run_script(path, setup=None):
+    # Run a step script in this process, with setup: {variable: value} overriding its [Setup] section.
+    path = os.path.abspath(path)
+    with open(path) as f:
+        source = f.read()
+    code = compile(_with_setup(source, setup or {}), path, 'exec')
+    script_globals = {'__name__': '__main__', '__file__': path}
+    script_dir = os.path.dirname(path)
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    exec(code, script_globals)
+    return 'completed'
+
+
+@job('run_script')
+def _run_script(cache, path, setup=None):
+    # Run a step script inside the warm process (arcpy and the cached data stay loaded).
+    # setup: {variable: value} overriding the script's [Setup] section, e.g. {"work_dir": "..."}.
+    # Geometry reads of the script go through the cache (see cached_geometry_reads).
+    with cached_geometry_reads(cache):
+        return run_script(path, setup)
+
+
+# [Server] -----------------------------------
+def handle(request, cache):
+    # Run one request and return the response dict (printed output is returned in "log").
+    response = {'id': request.get('id')}
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            response['result'] = JOBS[request['job']](cache, **request.get('args', {}))
+        response['ok'] = True
+    except Exception:
+        response['ok'] = False
+        response['error'] = traceback.format_exc()
+    response['log'] = log.getvalue()
+    return response
+
+
+def _serve_stream(reader, writer, cache):
+    for line in reader:
+        if line.strip() == '':
+            continue
+        request = json.loads(line)
+        if request.get('job') == 'shutdown':
+            writer.write(json.dumps({'id': request.get('id'), 'ok': True, 'result': 'bye'}) + '\n')
+            writer.flush()
+            return True
+        writer.write(json.dumps(handle(request, cache), default=str) + '\n')
+        writer.flush()
+    return False
+
+
+def serve(socket_path=None, memory_budget=8*1024**3):
+    # Serve requests on stdin/stdout, or on a Unix socket if socket_path is given, until "shutdown".
+    global CACHE
+    CACHE = LayerCache(memory_budget)
+    try:
+        import arcpy # import (and license checkout) once for all jobs
+    except ImportError:
+        pass
+    if socket_path is None:
+        protocol_out = sys.stdout
+        sys.stdout = sys.stderr # stray prints must not corrupt the protocol stream
+        _serve_stream(sys.stdin, protocol_out, CACHE)
+        return
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(1)
+    try:
+        while True:
+            connection = server.accept()[0]
+            with connection, connection.makefile('r') as reader, connection.makefile('w') as writer:
+                if _serve_stream(reader, writer, CACHE):
+                    break
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+
+class WarmWorkerClient(object):
+    # Client for a running worker (socket_path) or a worker spawned on stdin/stdout.
+    def __init__(self, socket_path=None, memory_budget_mb=8192, python=sys.executable):
+        self._next_id = 0
+        self.process = None
+        if socket_path is not None:
+            self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.connection.connect(socket_path)
+            self.reader = self.connection.makefile('r')
+            self.writer = self.connection.makefile('w')
+        else:
+            self.process = subprocess.Popen([python, os.path.abspath(__file__), '--stdio', '--memory-budget-mb', str(memory_budget_mb)],
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+            self.reader = self.process.stdout
+            self.writer = self.process.stdin
+
+    def call(self, job_name, **args):
+        # Run a job and return its result (raises RuntimeError with the worker traceback on failure).
+        self._next_id += 1
+        self.writer.write(json.dumps({'id': self._next_id, 'job': job_name, 'args': args}) + '\n')
+        self.writer.flush()
+        response = json.loads(self.reader.readline())
+        if response.get('log'):
+            sys.stdout.write(response['log'])
+        if not response['ok']:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def close(self, shutdown=False):
+        if shutdown or self.process is not None:
+            self.writer.write(json.dumps({'job': 'shutdown'}) + '\n')
+            self.writer.flush()
+            self.reader.readline()
+        if self.process is not None:
+            self.process.wait()
+        else:
+            self.connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Warm worker for the dams-into-SWOT-PLD steps')
+    parser.add_argument('--socket', help='Unix socket path (default: serve on stdin/stdout)')
+    parser.add_argument('--stdio', action='store_true', help='serve on stdin/stdout')
+    parser.add_argument('--memory-budget-mb', type=float, default=8192)
+    arguments = parser.parse_args()
+    serve(None if arguments.stdio else arguments.socket, int(arguments.memory_budget_mb*1024**2))
@@ -0,0 +1,406 @@
+# [Description] ------------------------------
+# Coordinator-free work queue on a shared directory, to spread the partitions of a global run (Step1 pfaf layers,
+# Steps 4-5 regions) over the workers of several nodes. Only POSIX file operations are used (O_EXCL create,
+# rename, utime), so any shared filesystem works, and several local worker processes can be tested on one box.
+# Queue directory:
+#   queue.json                 merge specification of the partition outputs (see merge)
+#   tasks/<id>.json            task manifests: {"id", "script", "setup", "copies", "outputs"}
+#   claims/<id>.lock           claim of a running task (created with O_EXCL), touched by its worker every heartbeat
+#   done/<id>.json             completion record (worker, seconds, outputs)
+#   errors/<id>.<token>.json   failed attempts (traceback); stale/<id>.<token>.lock: claims of dead workers
+#   errors/<id>.<token>.lost.json  attempts that finished after their claim was requeued (discarded, no done record)
+#   logs/<id>.<token>.log      printed output of every attempt
+# A claim whose heartbeat has not changed for stale_seconds (timed on the clock of the worker that watches it, so the
+# node clocks need not agree) is moved to stale/ and the task is run again, up to max_attempts attempts in all.
+# Tasks must therefore be rerunnable: every task writes to its own partition workspace, and copies
+# ([[source, destination]], arcpy.Copy_management) are redone before every attempt.
+
+# Usage:
+#   tasks = work_queue.partition_tasks("Step1_labeling_PLD_on_circa2015.py", ["01", "02", "03"],
+#       setup={"pfaf_layers": ["{partition}"], "circa2015": r"\\share\run\p{partition}.gdb\circa2015_UCLA_lakes"},
+#       copies=[[r"\\share\SWOT_PLD_v01.gdb", r"\\share\run\p{partition}.gdb"]],
+#       outputs={"circa2015": r"\\share\run\p{partition}.gdb\circa2015_UCLA_lakes"})
+#   work_queue.publish(r"\\share\queue", tasks, {"circa2015": {"target": r"\\share\SWOT_PLD_v01.gdb\circa2015_UCLA_lakes",
+#       "mode": "max", "key": "lake_UID", "fields": ["shareseg_PLDv01"]}})
+#   python work_queue.py worker /share/queue      (on every node, as many as wanted)
+#   python work_queue.py status /share/queue
+#   python work_queue.py merge /share/queue
+
+# Initiated: Oct 19, 2026
+# Last update: Oct 19, 2026
+# Contact: jidawang@ksu.edu; gdbruins@ucla.edu
+#---------------------------------------------
+
+
+# [Script] -----------------------------------
+# Import built-in functions and tools.
+import argparse, collections, contextlib, datetime, json, os, re, socket, threading, time, traceback, uuid
+import warm_worker
+
+HEARTBEAT_SECONDS = 30.0
+STALE_SECONDS = 300.0
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 10.0
+QUEUE_FOLDERS = ['tasks', 'claims', 'done', 'errors', 'stale', 'logs']
+TASK_ID = re.compile(r'^[A-Za-z0-9_\-]+$')
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def _write_json(path, value):
+    # Write a JSON file atomically (readers never see a partial file).
+    temporary = path + '.' + uuid.uuid4().hex + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(value, f, indent=1)
+    os.replace(temporary, path)
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _substitute(value, partition):
+    # Replace {partition} in the strings of a (nested) setup value.
+    if isinstance(value, str):
+        return value.replace('{partition}', partition)
+    if isinstance(value, list):
+        return [_substitute(x, partition) for x in value]
+    if isinstance(value, dict):
+        return dict((k, _substitute(v, partition)) for k, v in value.items())
+    return value
+
+
+def partition_tasks(script, partitions, setup=None, copies=None, outputs=None, prefix=None):
+    # One task per partition, with {partition} replaced in setup, copies and outputs.
+    prefix = prefix or os.path.splitext(os.path.basename(script))[0]
+    return [{'id': prefix + '_' + str(x), 'script': script, 'setup': _substitute(setup or {}, str(x)),
+             'copies': _substitute(copies or [], str(x)), 'outputs': _substitute(outputs or {}, str(x))}
+            for x in partitions]
+
+
+def publish(queue_dir, tasks, merges=None, replace=False):
+    # Write the task manifests (and the merge specification) into a queue directory; returns the published IDs.
+    # Existing tasks are kept unless replace is True.
+    for folder in QUEUE_FOLDERS:
+        os.makedirs(os.path.join(queue_dir, folder), exist_ok=True)
+    if merges is not None:
+        _write_json(os.path.join(queue_dir, 'queue.json'), {'merges': merges})
+    published = []
+    for task in tasks:
+        if not TASK_ID.match(task['id']):
+            raise ValueError('task IDs are used as file names (letters, digits, _ and -): ' + task['id'])
+        path = os.path.join(queue_dir, 'tasks', task['id'] + '.json')
+        if os.path.exists(path) and not replace:
+            continue
+        task = dict(task)
+        task['script'] = os.path.abspath(task['script'])
+        task['published'] = _now()
+        _write_json(path, task)
+        published.append(task['id'])
+    return published
+
+
+def _ids(queue_dir, folder, suffix):
+    names = os.listdir(os.path.join(queue_dir, folder))
+    return sorted(x[:-len(suffix)] for x in names if x.endswith(suffix) and not x.endswith('.tmp'))
+
+
+def _attempt_counts(queue_dir):
+    # {task ID: number of failed and abandoned attempts}
+    counts = collections.Counter()
+    for folder in ['errors', 'stale']:
+        for name in os.listdir(os.path.join(queue_dir, folder)):
+            if not name.endswith('.tmp') and not name.endswith('.lost.json'): # lost attempts are counted in stale/
+                counts[name.split('.')[0]] += 1
+    return counts
+
+
+def queue_state(queue_dir, max_attempts=MAX_ATTEMPTS):
+    # {task ID: "pending" | "running" | "done" | "failed"}
+    done = set(_ids(queue_dir, 'done', '.json'))
+    running = set(_ids(queue_dir, 'claims', '.lock'))
+    attempts = _attempt_counts(queue_dir)
+    state = collections.OrderedDict()
+    for task_id in _ids(queue_dir, 'tasks', '.json'):
+        if task_id in done:
+            state[task_id] = 'done'
+        elif task_id in running:
+            state[task_id] = 'running'
+        elif attempts[task_id] >= max_attempts:
+            state[task_id] = 'failed'
+        else:
+            state[task_id] = 'pending'
+    return state
+
+
+def claim(queue_dir, task_id, worker_id):
+    # Claim a task with an exclusive lock file; returns the claim token, or None if the task is claimed already.
+    token = uuid.uuid4().hex
+    lock_path = os.path.join(queue_dir, 'claims', task_id + '.lock')
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'token': token, 'worker': worker_id, 'host': socket.gethostname(), 'pid': os.getpid(),
+                   'claimed': _now()}, f)
+    return token
+
+
+def _claim_token(lock_path):
+    try:
+        return _read_json(lock_path).get('token')
+    except (OSError, ValueError): # released, or being written
+        return None
+
+
+def release(queue_dir, task_id, token):
+    # Remove a claim if it is still ours.
+    lock_path = os.path.join(queue_dir, 'claims', task_id + '.lock')
+    if _claim_token(lock_path) == token:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(lock_path)
+
+
+class Heartbeat(object):
+    # Touches a claim every interval seconds while a task runs; lost is set if the claim was taken away.
+    def __init__(self, lock_path, token, interval=HEARTBEAT_SECONDS):
+        self.lock_path = lock_path
+        self.token = token
+        self.interval = interval
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if _claim_token(self.lock_path) != self.token:
+                self.lost.set()
+                return
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(self.lock_path, None)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class StaleWatch(object):
+    # Watches the heartbeats of the claims and requeues the claims whose heartbeat has not changed for
+    # stale_seconds on this worker's own clock.
+    def __init__(self, queue_dir, stale_seconds=STALE_SECONDS):
+        self.queue_dir = queue_dir
+        self.stale_seconds = stale_seconds
+        self.seen = {} # task ID -> (claim token, heartbeat mtime, time.monotonic() when first seen)
+
+    def requeue_stale(self):
+        # Returns the requeued task IDs.
+        requeued = []
+        now = time.monotonic()
+        claimed = _ids(self.queue_dir, 'claims', '.lock')
+        for task_id in list(self.seen):
+            if task_id not in claimed:
+                del self.seen[task_id]
+        for task_id in claimed:
+            lock_path = os.path.join(self.queue_dir, 'claims', task_id + '.lock')
+            try:
+                mtime = os.stat(lock_path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            token = _claim_token(lock_path)
+            last = self.seen.get(task_id)
+            if last is None or last[:2] != (token, mtime):
+                self.seen[task_id] = (token, mtime, now)
+            elif now - last[2] >= self.stale_seconds and requeue(self.queue_dir, task_id, token):
+                del self.seen[task_id]
+                requeued.append(task_id)
+        return requeued
+
+
+def requeue(queue_dir, task_id, token=None):
+    # Move the claim of a task to stale/ so that the task is run again (only the claim with this token, if given).
+    # Returns True if this call requeued it.
+    lock_path = os.path.join(queue_dir, 'claims', task_id + '.lock')
+    stale_path = os.path.join(queue_dir, 'stale', task_id + '.' + uuid.uuid4().hex + '.lock')
+    try:
+        os.rename(lock_path, stale_path) # only one of the workers racing for it succeeds
+    except FileNotFoundError:
+        return False
+    if token is not None and _claim_token(stale_path) != token:
+        # A fresh claim was taken in the meantime: put it back (link never overwrites a newer claim)
+        with contextlib.suppress(FileExistsError):
+            os.link(stale_path, lock_path)
+        os.remove(stale_path)
+        return False
+    return True
+
+
+def _copy(source, destination):
+    import arcpy
+    if arcpy.Exists(destination):
+        arcpy.Delete_management(destination)
+    arcpy.Copy_management(source, destination)
+
+
+def run_task(queue_dir, task, worker_id, token, heartbeat_seconds=HEARTBEAT_SECONDS):
+    # Run a claimed task (copies, then the script with its setup) and write its completion or error record.
+    lock_path = os.path.join(queue_dir, 'claims', task['id'] + '.lock')
+    log_path = os.path.join(queue_dir, 'logs', task['id'] + '.' + token + '.log')
+    start = time.perf_counter()
+    with Heartbeat(lock_path, token, heartbeat_seconds) as heartbeat:
+        try:
+            with open(log_path, 'w') as log, contextlib.redirect_stdout(log):
+                for source, destination in task.get('copies', []):
+                    _copy(source, destination)
+                warm_worker.run_script(task['script'], task.get('setup', {}))
+        except BaseException as error:
+            _write_json(os.path.join(queue_dir, 'errors', task['id'] + '.' + token + '.json'),
+                        {'id': task['id'], 'worker': worker_id, 'failed': _now(), 'error': traceback.format_exc()})
+            release(queue_dir, task['id'], token)
+            if not isinstance(error, Exception): # KeyboardInterrupt, SystemExit
+                raise
+            return False
+    if heartbeat.lost.is_set() or _claim_token(lock_path) != token:
+        # The claim was requeued while the script ran and another attempt owns the partition workspace now:
+        # this attempt is discarded, so that merge only reads the outputs of the attempt holding the claim
+        _write_json(os.path.join(queue_dir, 'errors', task['id'] + '.' + token + '.lost.json'),
+                    {'id': task['id'], 'worker': worker_id, 'failed': _now(),
+                     'error': 'claim lost (requeued after a stale heartbeat); outputs discarded'})
+        return False
+    _write_json(os.path.join(queue_dir, 'done', task['id'] + '.json'),
+                {'id': task['id'], 'token': token, 'worker': worker_id, 'host': socket.gethostname(),
+                 'finished': _now(), 'seconds': time.perf_counter() - start, 'outputs': task.get('outputs', {})})
+    release(queue_dir, task['id'], token)
+    return True
+
+
+def work(queue_dir, worker_id=None, heartbeat_seconds=HEARTBEAT_SECONDS, stale_seconds=STALE_SECONDS,
+         max_attempts=MAX_ATTEMPTS, poll_seconds=POLL_SECONDS, exit_when_empty=True, max_tasks=None):
+    # Worker loop: claim and run pending tasks, requeue stale claims, and return (done, failed) task counts when
+    # no task is pending or running (exit_when_empty) or after max_tasks tasks.
+    worker_id = worker_id or socket.gethostname() + ':' + str(os.getpid())
+    watch = StaleWatch(queue_dir, stale_seconds)
+    completed = 0
+    failed = 0
+    while max_tasks is None or completed + failed < max_tasks:
+        state = queue_state(queue_dir, max_attempts)
+        ran = False
+        for task_id in [k for k, v in state.items() if v == 'pending']:
+            token = claim(queue_dir, task_id, worker_id)
+            if token is None:
+                continue
+            if os.path.exists(os.path.join(queue_dir, 'done', task_id + '.json')): # finished since the scan
+                release(queue_dir, task_id, token)
+                continue
+            print(_now() + ' ' + worker_id + ' running ' + task_id)
+            task = _read_json(os.path.join(queue_dir, 'tasks', task_id + '.json'))
+            if run_task(queue_dir, task, worker_id, token, heartbeat_seconds):
+                completed += 1
+                print(_now() + ' ' + worker_id + ' done ' + task_id)
+            else:
+                failed += 1
+                print(_now() + ' ' + worker_id + ' failed ' + task_id)
+            ran = True
+            break
+        if ran:
+            continue
+        for task_id in watch.requeue_stale():
+            print(_now() + ' ' + worker_id + ' requeued ' + task_id + ' (stale heartbeat)')
+        if exit_when_empty and not any(v in ('pending', 'running') for v in queue_state(queue_dir, max_attempts).values()):
+            break
+        time.sleep(poll_seconds)
+    return completed, failed
+
+
+def _merge_max(target, paths, key, fields):
+    # Write the maximum of every field over the partition outputs into the target rows with the same key.
+    import arcpy
+    values = {}
+    for path in paths:
+        with arcpy.da.SearchCursor(path, [key] + fields) as cursor:
+            for row in cursor:
+                current = values.setdefault(row[0], list(row[1:]))
+                for i, value in enumerate(row[1:]):
+                    if value is not None and (current[i] is None or value > current[i]):
+                        current[i] = value
+    with arcpy.da.UpdateCursor(target, [key] + fields) as cursor:
+        for row in cursor:
+            if row[0] in values:
+                cursor.updateRow([row[0]] + values[row[0]])
+
+
+def merge(queue_dir, merges=None, allow_incomplete=False):
+    # Merge the partition outputs of the completed tasks, per output name in merges (default: queue.json):
+    #   {"target": path, "mode": "append"}   partition feature classes merged into a new target
+    #   {"target": path, "mode": "max", "key": field, "fields": [...]}   maximum field values written into an existing
+    #                                                                   target (e.g. the Step1 flags)
+    # Returns {output name: number of partitions merged}.
+    import arcpy
+    if merges is None:
+        merges = _read_json(os.path.join(queue_dir, 'queue.json'))['merges']
+    state = queue_state(queue_dir)
+    unfinished = [k for k, v in state.items() if v != 'done']
+    if unfinished and not allow_incomplete:
+        raise RuntimeError('tasks not done: ' + ', '.join(unfinished))
+    records = [_read_json(os.path.join(queue_dir, 'done', x + '.json')) for x in state if state[x] == 'done']
+    merged = {}
+    for name, spec in merges.items():
+        paths = [x['outputs'][name] for x in records if name in x.get('outputs', {})]
+        if spec.get('mode', 'append') == 'append':
+            arcpy.Merge_management(paths, spec['target'])
+        elif spec['mode'] == 'max':
+            _merge_max(spec['target'], paths, spec['key'], spec['fields'])
+        else:
+            raise ValueError('unknown merge mode: ' + spec['mode'])
+        merged[name] = len(paths)
+    return merged
+
+
+def print_status(queue_dir, max_attempts=MAX_ATTEMPTS):
+    state = queue_state(queue_dir, max_attempts)
+    print(', '.join(k + ' ' + str(v) for k, v in sorted(collections.Counter(state.values()).items())))
+    for task_id in [k for k, v in state.items() if v == 'running']:
+        lock_path = os.path.join(queue_dir, 'claims', task_id + '.lock')
+        with contextlib.suppress(OSError, ValueError):
+            claim_record = _read_json(lock_path)
+            print('  ' + task_id + ' running on ' + claim_record['worker'] + ', last heartbeat ' +
+                  str(round(time.time() - os.stat(lock_path).st_mtime)) + ' s ago (this clock)')
+    for task_id in [k for k, v in state.items() if v == 'failed']:
+        print('  ' + task_id + ' failed ' + str(max_attempts) + ' times (see errors/)')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Shared-directory work queue for the dams-into-SWOT-PLD steps')
+    parser.add_argument('command', choices=['publish', 'worker', 'status', 'requeue', 'merge'])
+    parser.add_argument('queue_dir')
+    parser.add_argument('--tasks', help='publish: JSON file with {"tasks": [...], "merges": {...}}')
+    parser.add_argument('--task', action='append', help='requeue: task ID (repeatable)')
+    parser.add_argument('--worker-id')
+    parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_SECONDS, help='seconds between heartbeats')
+    parser.add_argument('--stale', type=float, default=STALE_SECONDS, help='seconds without heartbeat before requeueing')
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='seconds between scans of an idle worker')
+    parser.add_argument('--keep-polling', action='store_true', help='worker: wait for new tasks instead of exiting')
+    parser.add_argument('--allow-incomplete', action='store_true', help='merge: merge the done tasks only')
+    arguments = parser.parse_args()
+    if arguments.command == 'publish':
+        spec = _read_json(arguments.tasks)
+        print('published ' + str(len(publish(arguments.queue_dir, spec['tasks'], spec.get('merges')))) + ' tasks')
+    elif arguments.command == 'worker':
+        completed, failed = work(arguments.queue_dir, arguments.worker_id, arguments.heartbeat, arguments.stale,
+                                 arguments.max_attempts, arguments.poll, not arguments.keep_polling)
+        print('worker finished: ' + str(completed) + ' done, ' + str(failed) + ' failed')
+    elif arguments.command == 'status':
+        print_status(arguments.queue_dir, arguments.max_attempts)
+    elif arguments.command == 'requeue':
+        for task_id in arguments.task or []:
+            print(task_id + (' requeued' if requeue(arguments.queue_dir, task_id) else ' not claimed'))
+    else:
+        print(merge(arguments.queue_dir, allow_incomplete=arguments.allow_incomplete))